@@ -4,6 +4,10 @@ const DATA_STALE_HOURS = 48;
 const SITE_BASE = 'https://minortermite.github.io/betprizm';
 const NETLIFY_FN_URL = SITE_BASE + '/matches.json';
 const LS_CACHE_KEY = 'prizmbet_matches_cache';
+const DELTA_URL = 'matches.delta.json';
+const SHARDS_BASE = 'shards/';
+const LS_SHARDS_KEY = 'prizmbet_shards_cache';
+const LIVE_SSE_URL = ''; // адрес live_odds.py (/events); пусто — live-линия выключена
 
 // ===== DATA LOADING & CACHING =====
 function getCachedMatches() {
@@ -17,6 +21,81 @@ function setCachedMatches(data) {
     try { localStorage.setItem(LS_CACHE_KEY, JSON.stringify(data)); } catch { }
 }
 
+// ===== DELTA (matches.delta.json) =====
+// Дельта переводит клиента с версии base_version на version: added / removed / changed по id.
+function applyDelta(base, delta) {
+    if (!base?.matches || !delta || delta.base_version !== base.version) return null;
+    const removed = new Set(delta.removed || []);
+    const byId = new Map();
+    for (const m of base.matches) if (!removed.has(m.id)) byId.set(m.id, m);
+    for (const ch of delta.changed || []) {
+        const m = byId.get(ch.id);
+        if (m) byId.set(ch.id, { ...m, ...ch });
+    }
+    for (const m of delta.added || []) byId.set(m.id, m);
+    return { ...base, version: delta.version, last_update: delta.last_update, matches: [...byId.values()] };
+}
+
+// Обновить кэш через дельту. null — дельта не подходит, нужен полный matches.json.
+async function fetchDelta(cached) {
+    if (!cached?.version) return null;
+    try {
+        const r = await fetch(DELTA_URL + '?t=' + Date.now());
+        if (!r.ok) return null;
+        const delta = await r.json();
+        if (delta.version === cached.version) return cached; // версия не изменилась
+        return applyDelta(cached, delta);
+    } catch { return null; }
+}
+
+// ===== SHARDS (shards/manifest.json) =====
+// Имя шарда содержит хеш содержимого: файл из кэша с тем же именем заведомо актуален.
+function getCachedShards() {
+    try { return JSON.parse(localStorage.getItem(LS_SHARDS_KEY) || '{}'); } catch { return {}; }
+}
+
+// Собрать ленту из шардов, скачав только изменившиеся. sports — ограничить видами спорта.
+async function fetchShards(sports = null) {
+    try {
+        const r = await fetch(SHARDS_BASE + 'manifest.json?t=' + Date.now());
+        if (!r.ok) return null;
+        const manifest = await r.json();
+        const wanted = (manifest.shards || []).filter(s => !sports || sports.includes(s.sport));
+        const cached = getCachedShards();
+        const fresh = {};
+        await Promise.all(wanted.map(async (s) => {
+            if (cached[s.file]) { fresh[s.file] = cached[s.file]; return; }
+            const resp = await fetch(SHARDS_BASE + s.file);
+            if (!resp.ok) throw new Error('shard ' + s.file + ': ' + resp.status);
+            fresh[s.file] = (await resp.json()).matches || [];
+        }));
+        // В кэше остаются только шарды текущего манифеста
+        if (!sports) { try { localStorage.setItem(LS_SHARDS_KEY, JSON.stringify(fresh)); } catch { } }
+        return {
+            version: manifest.version, last_update: manifest.last_update,
+            matches: wanted.flatMap(s => fresh[s.file]),
+        };
+    } catch (e) { console.warn('shards fail:', e.message); return null; }
+}
+
+// ===== LIVE (SSE от live_odds.py) =====
+// snapshot — все live-события, delta — added / removed / changed по id, как в matches.delta.json.
+function connectLive(onMatches, url = LIVE_SSE_URL) {
+    if (!url || typeof EventSource === 'undefined') return null;
+    let state = { version: 0, matches: [] };
+    const es = new EventSource(url);
+    es.addEventListener('snapshot', (e) => {
+        state = { version: 0, matches: JSON.parse(e.data).matches || [] };
+        onMatches(state.matches);
+    });
+    es.addEventListener('delta', (e) => {
+        const delta = JSON.parse(e.data);
+        state = applyDelta(state, { ...delta, version: 0, base_version: 0 }) || state;
+        onMatches(state.matches);
+    });
+    return es; // EventSource сам переподключается и получает свежий snapshot
+}
+
 function isDataStale(ts) {
     if (!ts) return true;
     const d = new Date(ts);
@@ -48,11 +127,17 @@ async function loadData() {
     const cacheBust = Math.floor(Date.now() / 600000);
 
     let data = null, source = 'static';
-    // 2. Пробуем статичный matches.json (основной источник на GitHub Pages)
-    try {
-        const r = await fetch('matches.json?v=' + cacheBust);
-        if (r.ok) data = await r.json();
-    } catch (e) { console.warn('static fail:', e.message); }
+    // 2. Есть кэш с версией — пробуем догнать его дельтой (сотни байт вместо всего файла)
+    data = await fetchDelta(cached);
+    // 2a. Шарды: перекачиваются только виды спорта, где что-то изменилось
+    if (!data?.matches?.length) data = await fetchShards();
+    // 2b. Статичный matches.json (основной источник на GitHub Pages)
+    if (!data?.matches?.length) {
+        try {
+            const r = await fetch('matches.json?v=' + cacheBust);
+            if (r.ok) data = await r.json();
+        } catch (e) { console.warn('static fail:', e.message); }
+    }
     // 3. Fallback — пробуем абсолютный URL (GitHub Pages)
     if (!data?.matches?.length) {
         try {
@@ -80,11 +165,14 @@ async function refreshData() {
     const lastUpdate = document.getElementById('lastUpdate');
     if (lastUpdate) lastUpdate.innerHTML = '<span class="loading"></span> Обновление...';
 
-    let data = null;
-    try {
-        const r = await fetch('matches.json?t=' + Date.now());
-        if (r.ok) data = await r.json();
-    } catch (e) { }
+    let data = await fetchDelta(getCachedMatches());
+    if (!data?.matches?.length) data = await fetchShards();
+    if (!data?.matches?.length) {
+        try {
+            const r = await fetch('matches.json?t=' + Date.now());
+            if (r.ok) data = await r.json();
+        } catch (e) { }
+    }
 
     if (data?.matches?.length) {
         setCachedMatches(data);
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — офлайн-бенчмарк парсеров Marathon на сохранённых страницах.
+
+Корпус: fixtures/*.html и (по --synthetic N) сгенерированная
+страница на N футбольных строк. Для каждого бэкенда (PARSER_BACKEND) —
+строк в секунду, перцентили задержки на страницу, пик tracemalloc и пик RSS;
+отдельно — стадия отбора main() (select_matches). Каждый бэкенд меряется
+в своём процессе, чтобы пик RSS одного не перетекал в другой.
+
+Дерево lxml живёт в памяти libxml2, которую tracemalloc не видит, поэтому
+по каждой странице меряется и прирост пика RSS за разбор (Linux: VmHWM,
+сбрасываемый через /proc/self/clear_refs). --filler N добавляет в синтетику
+N пунктов меню/скриптов — как на тяжёлых страницах Marathon.
+
+    python bench_parser.py --rounds 20 --synthetic 2000 --save-baseline
+    python bench_parser.py --rounds 20 --synthetic 2000 --compare       # код 1 при регрессии
+"""
+
+from __future__ import annotations
+
+import argparse
+import ctypes
+import gc
+import glob
+import json
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows — RSS не меряем
+    resource = None
+
+import marathon_parser_real as mp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, "bench_baseline.json")
+# Что считается регрессией при --compare: строк/с ниже и p95 выше базы на столько
+DEFAULT_THRESHOLD = 0.20
+
+
+def corpus_files() -> List[str]:
+    """Записанные страницы со строками coupon-row (tennis.html их не содержит — пустой разбор не мерим)."""
+    return sorted(glob.glob(os.path.join(HERE, "fixtures", "*.html")))
+
+
+def _filler(n: int) -> str:
+    """Разметка, которую парсер выбрасывает: меню, скрипты, подвал."""
+    return "".join(f"<li class=\"menu-item\"><a href=\"/su/betting/Sport{i}\"><span>Раздел {i}</span></a>"
+                   f"<script>window.__m{i}={{id:{i},name:\"section-{i}\"}};</script></li>" for i in range(n))
+
+
+def synthetic_page(rows: int, per_league: int = 50, filler: int = 0) -> str:
+    """Большая футбольная страница в разметке Marathon: rows строк, по per_league в контейнере."""
+    parts = ["<!DOCTYPE html><html lang=\"ru\"><head><meta charset=\"utf-8\"></head><body>"]
+    if filler:
+        parts.append(f"<nav><ul>{_filler(filler // 2)}</ul></nav>")
+    for i in range(rows):
+        if i % per_league == 0:
+            if i:
+                parts.append("</div>")
+            parts.append(f"<div class=\"category-container\"><div class=\"category-header\">"
+                         f"<a class=\"category-label-link\" href=\"/su/betting/Football/L{i}\">"
+                         f"<h2>Страна {i // per_league}.Лига {i // per_league}.Тур {i % 7}</h2></a></div>")
+        e_id = 30_000_000 + i
+        link = f"/su/betting/Football/X/Team+{i}+vs+Team+{i + 1}+-+{e_id}"
+        odds = "".join(
+            f"<span class=\"selection-link\" data-selection-key=\"{e_id}@{key}\">{1.1 + (i * k) % 40 / 10:.2f}</span>"
+            for k, key in enumerate(("Match_Result.1", "Match_Result.draw", "Match_Result.3",
+                                     "Result.HD", "Result.HA", "Result.AD", "Total_Goals.Under_2.5"), 1))
+        parts.append(f"<div class=\"bg coupon-row\" data-event-treeId=\"{e_id}\" data-event-name=\"Team {i} - Team {i + 1}\">"
+                     f"<div class=\"date-wrapper\">{i % 28 + 1} мар {i % 24:02d}:00</div>"
+                     f"<a class=\"member-link\" href=\"{link}\"><span>Команда {i} (счет 1:0)</span></a>"
+                     f"<a class=\"member-link\" href=\"{link}\"><span>Команда {i + 1}</span></a>{odds}</div>")
+    parts.append("</div>")
+    if filler:
+        parts.append(f"<footer><ul>{_filler(filler - filler // 2)}</ul></footer>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def load_corpus(synthetic: int, filler: int = 0) -> List[Tuple[str, str, str]]:
+    """[(имя, вид спорта, html)]. Футбольные страницы — по имени файла."""
+    pages = []
+    for path in corpus_files():
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            html = f.read()
+        name = os.path.basename(path)
+        pages.append((name, "football" if "football" in name else "tennis", html))
+    if synthetic:
+        pages.append((f"synthetic-{synthetic}", "football", synthetic_page(synthetic, filler=filler)))
+    return pages
+
+
+def parse(sport: str, html: str, backend: str) -> List[mp.Match]:
+    if sport == "football":
+        return mp.parse_football_matches(html, backend)
+    return mp.parse_2way_matches(html, sport, backend)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def rss_peak_mb() -> float:
+    if resource is None:
+        return 0.0
+    # ru_maxrss: Linux — КБ, macOS — байты
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def _proc_status_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise OSError(field)
+
+
+try:
+    _malloc_trim = ctypes.CDLL("libc.so.6").malloc_trim
+except (OSError, AttributeError):   # не glibc
+    _malloc_trim = None
+
+
+def page_rss_peak_mb(fn) -> float:
+    """
+    На сколько вырос пик RSS за вызов fn() (0.0, если /proc недоступен — не Linux).
+    Перед замером свободная память отдаётся ОС (malloc_trim), иначе разбор
+    переиспользует арены прошлых страниц и прирост не виден.
+    """
+    gc.collect()
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")   # сброс VmHWM до текущего RSS
+        before = _proc_status_kb("VmRSS")
+    except OSError:
+        fn()
+        return 0.0
+    fn()
+    return max(0, _proc_status_kb("VmHWM") - before) / 1024
+
+
+def bench_backend(backend: str, rounds: int, synthetic: int, filler: int = 0) -> dict:
+    """Выполняется в отдельном процессе: задержки, строки/с, пики памяти одного бэкенда."""
+    pages = load_corpus(synthetic, filler)
+    rss_before = rss_peak_mb()
+    parse(pages[0][1], pages[0][2], backend)   # прогрев импорта/XPath
+
+    latencies: Dict[str, List[float]] = {name: [] for name, _, _ in pages}
+    rows = 0
+    total = 0.0
+    for _ in range(rounds):
+        for name, sport, html in pages:
+            t0 = time.perf_counter()
+            items = parse(sport, html, backend)
+            dt = time.perf_counter() - t0
+            latencies[name].append(dt)
+            rows += len(items)
+            total += dt
+
+    # Память — отдельным проходом: tracemalloc сильно замедляет разбор
+    tracemalloc.start()
+    peaks = {}
+    for name, sport, html in pages:
+        tracemalloc.reset_peak()
+        parse(sport, html, backend)
+        peaks[name] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    rss_pages = {name: page_rss_peak_mb(lambda: parse(sport, html, backend)) for name, sport, html in pages}
+
+    all_lat = [v for vals in latencies.values() for v in vals]
+    return {
+        "backend": backend,
+        "rows_per_sec": rows / total if total else 0.0,
+        "p50_ms": percentile(all_lat, 50) * 1000,
+        "p95_ms": percentile(all_lat, 95) * 1000,
+        "p99_ms": percentile(all_lat, 99) * 1000,
+        "tracemalloc_peak_mb": max(peaks.values(), default=0.0),
+        "rss_page_peak_mb": max(rss_pages.values(), default=0.0),
+        "rss_peak_mb": rss_peak_mb(),
+        "rss_growth_mb": rss_peak_mb() - rss_before,
+        "pages": {name: {"p50_ms": percentile(v, 50) * 1000, "p95_ms": percentile(v, 95) * 1000,
+                         "tracemalloc_peak_mb": peaks[name], "rss_page_peak_mb": rss_pages[name]}
+                  for name, v in latencies.items()},
+    }
+
+
+def bench_select(rounds: int, synthetic: int, filler: int = 0) -> dict:
+    """Стадия отбора main(): дедуп по id + фильтры лиг и дат на строках корпуса (с дублями)."""
+    items = [m for _, sport, html in load_corpus(synthetic, filler) for m in parse(sport, html, "lxml")]
+    items = items * 3   # одна и та же лига приходит с нескольких URL
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        mp.select_matches(items)
+    total = time.perf_counter() - t0
+    return {"rows": len(items), "rows_per_sec": len(items) * rounds / total if total else 0.0}
+
+
+def run(backends: List[str], rounds: int, synthetic: int, filler: int = 0) -> dict:
+    results = {}
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results[backend] = pool.submit(bench_backend, backend, rounds, synthetic, filler).result()
+    return {
+        "rounds": rounds, "synthetic": synthetic, "filler": filler,
+        "corpus": [name for name, _, _ in load_corpus(synthetic, filler)],
+        "backends": results,
+        "select": bench_select(rounds, synthetic, filler),
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"корпус: {', '.join(report['corpus'])}; раундов: {report['rounds']}")
+    print(f"{'бэкенд':<8}{'строк/с':>11}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+          f"{'tracemalloc, МБ':>17}{'RSS/стр, МБ':>13}{'RSS, МБ':>10}")
+    for name, r in report["backends"].items():
+        print(f"{name:<8}{r['rows_per_sec']:>11.0f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['tracemalloc_peak_mb']:>17.2f}{r.get('rss_page_peak_mb', 0.0):>13.2f}{r['rss_peak_mb']:>10.1f}")
+    print("пик памяти на страницу, МБ (tracemalloc / прирост RSS):")
+    names = list(report["backends"])
+    print(f"  {'страница':<28}" + "".join(f"{n:>18}" for n in names))
+    for page in report["corpus"]:
+        cells = []
+        for n in names:
+            p = report["backends"][n]["pages"][page]
+            cells.append(f"{p['tracemalloc_peak_mb']:.2f} / {p.get('rss_page_peak_mb', 0.0):.2f}")
+        print(f"  {page:<28}" + "".join(f"{c:>18}" for c in cells))
+    sel = report["select"]
+    print(f"select_matches: {sel['rows']} строк, {sel['rows_per_sec']:.0f} строк/с")
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """Регрессии относительно базы: падение строк/с или рост p95 больше threshold."""
+    problems = []
+    for name, r in report["backends"].items():
+        base = baseline.get("backends", {}).get(name)
+        if not base:
+            continue
+        speed = r["rows_per_sec"] / base["rows_per_sec"] - 1 if base["rows_per_sec"] else 0.0
+        p95 = r["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        print(f"{name:<8} строк/с {speed:+.1%}, p95 {p95:+.1%}, "
+              f"tracemalloc {r['tracemalloc_peak_mb'] - base['tracemalloc_peak_mb']:+.2f} МБ")
+        if speed < -threshold:
+            problems.append(f"{name}: строк/с упало на {-speed:.0%}")
+        if p95 > threshold:
+            problems.append(f"{name}: p95 вырос на {p95:.0%}")
+    base_sel = baseline.get("select", {}).get("rows_per_sec")
+    if base_sel:
+        sel = report["select"]["rows_per_sec"] / base_sel - 1
+        print(f"select   строк/с {sel:+.1%}")
+        if sel < -threshold:
+            problems.append(f"select_matches: строк/с упало на {-sel:.0%}")
+    return problems
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Бенчмарк парсеров Marathon на сохранённых страницах")
+    ap.add_argument("--backend", action="append", choices=sorted(mp._ROW_BACKENDS),
+                    help="по умолчанию — все")
+    ap.add_argument("--rounds", type=int, default=10)
+    ap.add_argument("--synthetic", type=int, default=1000, help="строк в синтетической странице (0 — без неё)")
+    ap.add_argument("--filler", type=int, default=0, help="пунктов меню/скриптов в синтетической странице")
+    ap.add_argument("--baseline", default=BASELINE_FILE)
+    ap.add_argument("--save-baseline", action="store_true", help="записать результат как базу")
+    ap.add_argument("--compare", action="store_true", help="сравнить с базой; код 1 при регрессии")
+    ap.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    ap.add_argument("--json", action="store_true", help="вывести полный отчёт JSON")
+    args = ap.parse_args()
+
+    report = run(args.backend or sorted(mp._ROW_BACKENDS), args.rounds, args.synthetic, args.filler)
+    print_report(report)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"база сохранена: {args.baseline}")
+    if args.compare:
+        try:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"нет базы {args.baseline} — сначала --save-baseline")
+            return 1
+        problems = compare(report, baseline, args.threshold)
+        for p in problems:
+            print(f"[REGRESSION] {p}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
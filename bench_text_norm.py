@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — микро-бенчмарк text_norm против прежних (некэшированных) функций.
+
+Корпус — реальные названия команд, лиг и дат из matches.json / marathon.json,
+повторённые --rounds раз (как повторяются на страницах и в прогонах демона).
+
+    python bench_text_norm.py --rounds 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import json
+import re
+import time
+
+import text_norm
+
+
+# ─── Прежние реализации (до text_norm) — эталон скорости и результата ──────────
+def legacy_clean_name(s):
+    if not s: return ""
+    s = re.sub(r"\(?Первый матч\s+\d+:\d+\)?", "", s, flags=re.I)
+    s = re.sub(r"\(?счет\s+\d+:\d+\)?", "", s, flags=re.I)
+    s = re.sub(r"\(?серия\s+\d+:\d+\)?", "", s, flags=re.I)
+    s = re.sub(r"\(\d{1,2}:\d{1,2}(?:,\s*\d{1,2}:\d{1,2})*\)", "", s)
+    s = re.sub(r"\d+:\d+", "", s).strip()
+    s = re.sub(r"\bматч\b", "", s, flags=re.I).strip()
+    return re.sub(r"\s+", " ", s).strip(" -/\\")
+
+
+def legacy_parse_ru_date(date_str):
+    m = re.match(r"(\d{1,2})\s+([а-яё]+)", (date_str or "").strip(), re.I)
+    if not m:
+        return None
+    day = int(m.group(1))
+    mon = text_norm.MONTH_RU.get(m.group(2)[:3].lower())
+    if not mon:
+        return None
+    today = _dt.date.today()
+    d = _dt.date(today.year, mon, day)
+    if (today - d).days > 180:
+        d = _dt.date(today.year + 1, mon, day)
+    return d
+
+
+def legacy_normalize_h2_league(text):
+    if not text:
+        return ""
+    if text.lower().startswith('итоги'):
+        return ""
+    text = re.sub(r'\.(?=[^\s\d])', '. ', text)
+    parts = [p.strip() for p in text.split('. ') if p.strip()]
+    if not parts:
+        return ""
+    result = []
+    for part in parts:
+        if text_norm._STAGE_PAT.search(part):
+            break
+        result.append(part)
+        if len(result) >= 3:
+            break
+    return '. '.join(result)
+
+
+def load_corpus(paths):
+    names, leagues, dates = [], [], []
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                matches = json.load(f).get("matches", [])
+        except Exception:
+            continue
+        for m in matches:
+            names += [m.get("team1", ""), m.get("team2", "")]
+            # В h2 Marathon точка без пробела: "Испания.Ла Лига"
+            leagues.append((m.get("league") or "").replace(". ", "."))
+            if m.get("date"):
+                dates.append(m["date"])
+    return names, leagues, dates
+
+
+def bench(fn, items, rounds, *args):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for it in items:
+            fn(it, *args)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rounds", type=int, default=50)
+    ap.add_argument("files", nargs="*", default=["matches.json", "marathon.json"])
+    args = ap.parse_args()
+
+    names, leagues, dates = load_corpus(args.files)
+    today = _dt.date.today()
+    cases = [
+        ("clean_name", names, legacy_clean_name, text_norm.clean_name, ()),
+        ("normalize_h2_league", leagues, legacy_normalize_h2_league, text_norm.normalize_h2_league, ()),
+        ("parse_ru_date", dates, legacy_parse_ru_date, text_norm.parse_ru_date, (today,)),
+    ]
+    for name, items, old, new, extra in cases:
+        for it in items:
+            assert old(it) == new(it, *extra), (name, it)
+    text_norm.cache_clear()
+
+    print(f"{'функция':<22}{'вызовов':>9}{'было, мс':>11}{'стало, мс':>11}{'ускорение':>11}")
+    for name, items, old, new, extra in cases:
+        t_old = bench(old, items, args.rounds)
+        t_new = bench(new, items, args.rounds, *extra)
+        calls = len(items) * args.rounds
+        speedup = t_old / t_new if t_new else float("inf")
+        print(f"{name:<22}{calls:>9}{t_old * 1000:>11.1f}{t_new * 1000:>11.1f}{speedup:>10.1f}x")
+
+    print("\nLRU:")
+    for name, st in text_norm.cache_stats().items():
+        print(f"  {name:<22} hits={st['hits']} misses={st['misses']} size={st['currsize']}/{st['maxsize']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,10 @@ import re
 import requests
 from datetime import datetime, timezone
 import prizm_api
+import prizm_ledger
+import publish
+import sheets_sync
+from match_model import Match
 
 # PRIZM timestamp = seconds since PRIZM genesis block (Unix epoch offset)
 # PRIZM genesis: 2018-01-01 00:00:00 UTC = 1514764800
@@ -28,6 +32,10 @@ BETS_FILE    = os.path.join(SCRIPT_DIR, "bets.json")
 MATCHES_FILE = os.path.join(SCRIPT_DIR, "matches.json")
 CREDS_FILE   = os.path.join(SCRIPT_DIR, "credentials.json")
 SHEET_ID     = "1QkVj51WMKSd6-LU4vZK3dYPk6QLQIO014ydpACtThNk"
+LEDGER_FILE  = prizm_ledger.LEDGER_FILE   # реестр транзакций (SQLite), общий с ботом
+
+# bets.min.json + .gz/.br рядом с bets.json (см. publish.write_artifacts)
+JSON_ARTIFACTS = os.getenv("JSON_ARTIFACTS", "1") != "0"
 
 # Использование функций из prizm_api
 def get_transactions(first_index=0, last_index=99):
@@ -46,6 +54,10 @@ def prizm_ts_to_dt(ts):
         return datetime.now(tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
 
 
+def tx_id_of(tx):
+    return tx.get("transaction") or tx.get("fullHash", "")
+
+
 def nqt_to_pzm(nqt_str):
     """Перевод NQT → PZM"""
     try:
@@ -62,7 +74,10 @@ def load_json(path, default):
         return default
 
 
-def save_json(path, data):
+def save_json(path, data, artifacts=False):
+    if artifacts:
+        publish.save_with_artifacts(path, data)
+        return
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
@@ -102,9 +117,9 @@ def parse_comment(text):
 # ===== МАТЧИ =====
 
 def load_matches_index():
-    """Индекс матчей по ID строкой"""
+    """Индекс матчей по ID строкой; коэффициенты разбираются один раз, при загрузке"""
     data = load_json(MATCHES_FILE, {})
-    return {str(m["id"]): m for m in data.get("matches", [])}
+    return {str(m["id"]): Match.from_dict(m) for m in data.get("matches", [])}
 
 
 def get_coef(match, outcome):
@@ -118,13 +133,13 @@ def load_bets():
     return load_json(BETS_FILE, {"bets": [], "last_update": None, "total_bets": 0})
 
 
-def process_transactions(txs, matches_idx, existing_bets):
-    """Вернуть список новых ставок из транзакций"""
-    seen_tx = {b["tx_id"] for b in existing_bets}
+def process_transactions(txs, matches_idx, ledger):
+    """Вернуть список новых ставок из транзакций; уже ставшие ставкой (ботом или нами) — по реестру"""
+    seen_tx = ledger.processed(prizm_ledger.BETS, (tx_id_of(t) for t in txs))
     new_bets = []
 
     for tx in txs:
-        tx_id = tx.get("transaction") or tx.get("fullHash", "")
+        tx_id = tx_id_of(tx)
         if tx_id in seen_tx:
             continue
 
@@ -152,8 +167,8 @@ def process_transactions(txs, matches_idx, existing_bets):
         bet_time  = prizm_ts_to_dt(tx.get("timestamp", 0))
 
         if match:
-            match_name = f"{match.get('team1','?')} vs {match.get('team2','?')}"
-            sport      = match.get("sport", "—")
+            match_name = f"{match.team1 or '?'} vs {match.team2 or '?'}"
+            sport      = match.sport or "—"
         else:
             match_name = f"Матч #{match_id}"
             sport      = "—"
@@ -181,7 +196,19 @@ def process_transactions(txs, matches_idx, existing_bets):
 
 # ===== GOOGLE SHEETS =====
 
+SHEET_HEADERS = ["TX ID", "Кошелёк", "Матч", "Спорт",
+                 "Исход", "Коэф", "Сумма PZM", "Выигрыш PZM", "Статус", "Время"]
+SHEETS_STATE = os.path.join(SCRIPT_DIR, sheets_sync.STATE_FILE)   # tx_id → строка листа
+
+
+def bet_row(b):
+    return [b["tx_id"], b["from_wallet"], b["match_name"], b["sport"],
+            b["outcome"], b["coefficient"], b["amount"], b["potential_win"],
+            b["status"], b["time"]]
+
+
 def update_sheets(all_bets):
+    """Новые ставки и сменившиеся статусы — одним batch_update (см. sheets_sync)."""
     try:
         from google.oauth2.service_account import Credentials
         import gspread
@@ -198,25 +225,9 @@ def update_sheets(all_bets):
         except Exception:
             ws = sheet.add_worksheet("Ставки", rows=2000, cols=12)
 
-        headers = ["TX ID", "Кошелёк", "Матч", "Спорт",
-                   "Исход", "Коэф", "Сумма PZM", "Выигрыш PZM", "Статус", "Время"]
-
-        existing = ws.get_all_values()
-        if not existing or existing[0] != headers:
-            ws.clear()
-            ws.append_row(headers)
-            existing = [headers]
-
-        existing_txs = {row[0] for row in existing[1:]}
-        new_rows = [
-            [b["tx_id"], b["from_wallet"], b["match_name"], b["sport"],
-             b["outcome"], b["coefficient"], b["amount"], b["potential_win"],
-             b["status"], b["time"]]
-            for b in all_bets if b["tx_id"] not in existing_txs
-        ]
-        if new_rows:
-            ws.append_rows(new_rows, value_input_option="USER_ENTERED")
-        print(f"  [OK] Google Sheets: +{len(new_rows)} строк")
+        res = sheets_sync.SheetSync(ws, SHEET_HEADERS, SHEETS_STATE).sync(bet_row(b) for b in all_bets)
+        print(f"  [OK] Google Sheets: +{res.added} строк, обновлено {res.updated} ({res.cells} ячеек)"
+              + (" [полная сверка листа]" if res.bootstrapped else ""))
     except Exception as e:
         print(f"  [WARN] Google Sheets недоступен: {e}")
 
@@ -244,11 +255,17 @@ def main():
         print("  Нет новых транзакций или API недоступен")
         # Всё равно сохраняем bets.json (обновляем временную метку)
         bets_data["last_update"] = now
-        save_json(BETS_FILE, bets_data)
+        save_json(BETS_FILE, bets_data, artifacts=JSON_ARTIFACTS)
+        if os.path.exists(CREDS_FILE):
+            update_sheets(existing)   # статусы могли смениться без новых транзакций
         print("  Done.")
         return
 
-    new_bets = process_transactions(txs, matches_idx, existing)
+    ledger = prizm_ledger.Ledger(LEDGER_FILE)
+    ledger.add(txs)
+    # Ставки, записанные до появления реестра, — «обработаны» (один раз)
+    ledger.seed(prizm_ledger.BETS, (b["tx_id"] for b in existing))
+    new_bets = process_transactions(txs, matches_idx, ledger)
     print(f"  Новых ставок: {len(new_bets)}")
 
     if new_bets:
@@ -258,15 +275,20 @@ def main():
             "total_bets":  len(all_bets),
             "bets":        all_bets,
         }
-        save_json(BETS_FILE, bets_data)
+        save_json(BETS_FILE, bets_data, artifacts=JSON_ARTIFACTS)
         print(f"  [OK] bets.json сохранён ({len(all_bets)} ставок)")
-
-        if os.path.exists(CREDS_FILE):
-            update_sheets(all_bets)
     else:
+        all_bets = existing
         # Обновляем временную метку даже без новых ставок
         bets_data["last_update"] = now
-        save_json(BETS_FILE, bets_data)
+        save_json(BETS_FILE, bets_data, artifacts=JSON_ARTIFACTS)
+    # Отметка — только после записи bets.json: сбой раньше повторит обработку
+    ledger.mark_processed(prizm_ledger.BETS, (b["tx_id"] for b in new_bets))
+    ledger.close()
+
+    # Дифф дешёвый (лист не читается) — синхронизируем каждый прогон, чтобы доходили win/loss
+    if os.path.exists(CREDS_FILE):
+        update_sheets(all_bets)
 
     print(f"  Done.")
 
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — пул тёплых контекстов headless Chromium (Playwright) для страниц,
+которые обычным GET не отдаются: 403 или «скелет» без coupon-row, который
+дорисовывает JS.
+
+Браузер запускается один раз на прогон, его event loop живёт в отдельном
+потоке; submit(url) можно звать из любого потока. Один контекст — одна
+вкладка, поэтому число контекстов и есть предел одновременных вкладок.
+Картинки, шрифты и медиа не грузятся. Контекст пересоздаётся после
+recycle_after страниц: куки и память не копятся весь прогон.
+
+    with BrowserPool() as pool:
+        page = pool.fetch("https://www.marathonbet.ru/su/betting/Football")
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import NamedTuple, Optional
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:  # браузерный фолбэк просто не включится
+    async_playwright = None
+
+BROWSER_TABS = int(os.getenv("BROWSER_TABS", "2"))
+BROWSER_RECYCLE = int(os.getenv("BROWSER_RECYCLE", "30"))
+BROWSER_TIMEOUT = float(os.getenv("BROWSER_TIMEOUT", "30"))
+BLOCKED_RESOURCES = frozenset({"image", "font", "media"})
+READY_SELECTOR = ".coupon-row"
+
+UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+      "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+
+
+class Rendered(NamedTuple):
+    url: str
+    html: str
+    status: int
+    render_s: float
+
+
+class _Slot:
+    """Контекст браузера и счётчик отданных им страниц."""
+
+    def __init__(self, context):
+        self.context = context   # None — закрыт, создаётся при следующей странице
+        self.served = 0
+
+
+class BrowserPool:
+    def __init__(self, tabs: int = BROWSER_TABS, recycle_after: int = BROWSER_RECYCLE,
+                 timeout: float = BROWSER_TIMEOUT, ready_selector: str = READY_SELECTOR,
+                 headless: bool = True, user_agent: str = UA):
+        self.tabs = max(1, tabs)
+        self.recycle_after = max(1, recycle_after)
+        self.timeout = timeout
+        self.ready_selector = ready_selector
+        self.headless = headless
+        self.user_agent = user_agent
+        self.stats = {"pages": 0, "errors": 0, "recycled": 0, "blocked": 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pw = None
+        self._browser = None
+        self._idle: Optional[asyncio.Queue] = None
+
+    # ─── жизненный цикл ────────────────────────────────────────────────────────
+    def start(self) -> "BrowserPool":
+        """Запустить браузер и прогреть контексты; ошибка запуска пробрасывается вызывающему."""
+        if async_playwright is None:
+            raise RuntimeError("playwright не установлен (pip install playwright && playwright install chromium)")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+        self._thread.start()
+        try:
+            self._call(self._start())
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    async def _start(self) -> None:
+        self._pw = await async_playwright().start()
+        self._browser = await self._pw.chromium.launch(headless=self.headless)
+        self._idle = asyncio.Queue()
+        for _ in range(self.tabs):
+            self._idle.put_nowait(_Slot(await self._new_context()))
+
+    async def _new_context(self):
+        context = await self._browser.new_context(user_agent=self.user_agent, locale="ru-RU")
+        await context.route("**/*", self._route)
+        return context
+
+    async def _route(self, route) -> None:
+        if route.request.resource_type in BLOCKED_RESOURCES:
+            self.stats["blocked"] += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._loop.is_running():
+            try:
+                self._call(self._close(), timeout=30)
+            except Exception:
+                pass
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+        self._loop.close()
+        self._loop = None
+
+    async def _close(self) -> None:
+        if self._browser is not None:
+            await self._browser.close()   # закрывает и все контексты
+        if self._pw is not None:
+            await self._pw.stop()
+
+    def __enter__(self) -> "BrowserPool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _call(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    # ─── загрузка ──────────────────────────────────────────────────────────────
+    def submit(self, url: str) -> Future:
+        """Отрисовать страницу в свободной вкладке; Future[Rendered]. Потокобезопасно."""
+        return asyncio.run_coroutine_threadsafe(self._render(url), self._loop)
+
+    def fetch(self, url: str) -> Rendered:
+        return self.submit(url).result()
+
+    async def _render(self, url: str) -> Rendered:
+        slot = await self._idle.get()   # нет свободного контекста — ждём: это и есть предел вкладок
+        t0 = time.perf_counter()
+        tab = None
+        try:
+            if slot.context is None:   # пересоздание после recycle_after — лениво, ошибка не теряет слот
+                slot.context = await self._new_context()
+            tab = await slot.context.new_page()
+            resp = await tab.goto(url, wait_until="domcontentloaded", timeout=self.timeout * 1000)
+            if self.ready_selector:
+                try:
+                    await tab.wait_for_selector(self.ready_selector, timeout=self.timeout * 1000)
+                except Exception:
+                    pass   # строк так и не появилось — отдаём что есть, парсер вернёт пусто
+            html = await tab.content()
+            self.stats["pages"] += 1
+            return Rendered(url, html, resp.status if resp else 0, time.perf_counter() - t0)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            if tab is not None:
+                try:
+                    await tab.close()
+                except Exception:
+                    pass
+            slot.served += 1
+            if slot.served >= self.recycle_after and slot.context is not None:
+                await self._recycle(slot)
+            self._idle.put_nowait(slot)
+
+    async def _recycle(self, slot: _Slot) -> None:
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+        slot.context = None
+        slot.served = 0
+        self.stats["recycled"] += 1
+
+
+def browser_available() -> bool:
+    """Можно ли запустить Chromium здесь (для тестов и диагностики)."""
+    if async_playwright is None:
+        return False
+    try:
+        BrowserPool(tabs=1).start().close()
+        return True
+    except Exception:
+        return False
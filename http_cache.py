@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — дисковый кэш страниц для условных GET (ETag / Last-Modified / хеш тела).
+
+Для каждого URL хранит валидаторы ответа, sha1 тела и уже разобранный список
+матчей. Если сервер ответил 304 или тело совпало байт-в-байт — парсинг не нужен.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional
+
+# Меняется при изменении формата записей или логики парсеров — старый кэш отбрасывается
+CACHE_VERSION = 3
+
+
+def body_hash(content: bytes) -> str:
+    return hashlib.sha1(content).hexdigest()
+
+
+class HttpCache:
+    """Потокобезопасный кэш url → {etag, last_modified, hash, event_fp, key, items}."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict = self._load()
+        self.stats = {"not_modified": 0, "same_body": 0, "miss": 0}
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                return data.get("entries", {})
+        except Exception:
+            pass
+        return {}
+
+    def conditional_headers(self, url: str, key: str) -> dict:
+        """Заголовки If-None-Match / If-Modified-Since для повторного запроса."""
+        with self._lock:
+            e = self._entries.get(url)
+        if not e or e.get("key") != key:
+            return {}
+        headers = {}
+        if e.get("etag"):
+            headers["If-None-Match"] = e["etag"]
+        if e.get("last_modified"):
+            headers["If-Modified-Since"] = e["last_modified"]
+        return headers
+
+    def not_modified(self, url: str, key: str) -> Optional[List[dict]]:
+        """Ответ 304: вернуть ранее разобранные матчи (None — записи нет)."""
+        with self._lock:
+            e = self._entries.get(url)
+            if not e or e.get("key") != key:
+                return None
+            self.stats["not_modified"] += 1
+            return [dict(m) for m in e["items"]]
+
+    def same_body(self, url: str, key: str, digest: str,
+                  etag: str = "", last_modified: str = "") -> Optional[List[dict]]:
+        """Тело не изменилось (сервер не умеет 304) — обновить валидаторы и вернуть матчи."""
+        with self._lock:
+            e = self._entries.get(url)
+            if not e or e.get("key") != key or e.get("hash") != digest:
+                self.stats["miss"] += 1
+                return None
+            e["etag"], e["last_modified"] = etag, last_modified
+            self.stats["same_body"] += 1
+            return [dict(m) for m in e["items"]]
+
+    def fingerprints(self, url: str) -> tuple:
+        """(sha1 тела, отпечаток набора event-id) сохранённой страницы — для поиска дублей."""
+        with self._lock:
+            e = self._entries.get(url) or {}
+            return e.get("hash", ""), e.get("event_fp", "")
+
+    def put(self, url: str, key: str, digest: str, items: List[dict],
+            etag: str = "", last_modified: str = "", event_fp: str = "") -> None:
+        with self._lock:
+            self._entries[url] = {
+                "key": key, "hash": digest, "event_fp": event_fp, "etag": etag,
+                "last_modified": last_modified,
+                "items": [dict(m) for m in items],
+            }
+
+    def save(self) -> None:
+        """Атомарная запись: сначала во временный файл, затем os.replace."""
+        with self._lock:
+            payload = {"version": CACHE_VERSION, "entries": self._entries}
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
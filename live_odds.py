@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — live-линия: опрос LIVE_URLS каждые несколько секунд и
+рассылка изменившихся коэффициентов браузерам через Server-Sent Events.
+
+Состояние хранится в памяти по страницам и событиям; после каждого опроса
+клиентам уходит только разница (publish.compute_delta): новые события
+целиком, исчезнувшие — по id, изменившиеся — только изменившиеся поля.
+
+Эндпоинты (stdlib ThreadingHTTPServer):
+    GET /events    — SSE: сначала "snapshot" со всеми событиями, затем "delta"
+    GET /snapshot  — текущее состояние одним JSON
+    GET /health    — счётчики опросов и клиентов
+
+    python live_odds.py
+    python live_odds.py --url tennis:Live:http://127.0.0.1:8091/live/tennis   # со стендом live_standin.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import marathon_parser_real as mp
+from http_cache import body_hash
+from publish import compute_delta, delta_is_empty
+
+LIVE_POLL_SEC = float(os.getenv("LIVE_POLL_SEC", "3"))
+LIVE_HOST = os.getenv("LIVE_HOST", "127.0.0.1")
+LIVE_PORT = int(os.getenv("LIVE_PORT", "8090"))
+HEARTBEAT_SEC = 15        # комментарий-пинг, чтобы прокси не рвали тихое соединение
+CLIENT_QUEUE = 256        # столько сообщений может отстать клиент, дальше он отключается
+
+
+class LiveState:
+    """События по страницам: {title: {event_id: матч}}. Потокобезопасно."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages: Dict[str, List[dict]] = {}
+
+    def update(self, title: str, items: List[dict]) -> Optional[dict]:
+        """Заменить события страницы; вернуть дельту или None, если ничего не изменилось."""
+        with self._lock:
+            delta = compute_delta(self._pages.get(title, []), items)
+            self._pages[title] = items
+        return None if delta_is_empty(delta) else delta
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return [m for items in self._pages.values() for m in items]
+
+
+class SSEHub:
+    """Подписчики SSE — по очереди сообщений на клиента."""
+
+    def __init__(self, max_queue: int = CLIENT_QUEUE):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._clients: set = set()
+        self.seq = 0
+
+    def subscribe(self) -> queue.Queue:
+        q: queue.Queue = queue.Queue(self.max_queue)
+        with self._lock:
+            self._clients.add(q)
+        return q
+
+    def unsubscribe(self, q: queue.Queue) -> None:
+        with self._lock:
+            self._clients.discard(q)
+
+    @property
+    def clients(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def format(self, event: str, data) -> bytes:
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        return f"id: {self.seq}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+    def publish(self, event: str, data) -> int:
+        """Разослать событие всем; отставшие клиенты отключаются (им уходит None)."""
+        with self._lock:
+            self.seq += 1
+            msg = self.format(event, data)
+            slow = []
+            for q in self._clients:
+                try:
+                    q.put_nowait(msg)
+                except queue.Full:
+                    slow.append(q)
+            for q in slow:
+                self._clients.discard(q)
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+            return len(self._clients)
+
+
+class LivePoller:
+    """Опрашивает live-страницы и публикует дельты в hub."""
+
+    def __init__(self, targets: List[tuple], state: LiveState, hub: SSEHub,
+                 interval: float = LIVE_POLL_SEC):
+        self.targets = targets
+        self.state = state
+        self.hub = hub
+        self.interval = interval
+        self.stats = {"polls": 0, "errors": 0, "unchanged": 0, "deltas": 0}
+        self._digests: Dict[str, str] = {}
+        self._stop = threading.Event()
+
+    def poll_once(self) -> int:
+        """Один проход по всем страницам. Возвращает число разосланных дельт."""
+        sent = 0
+        for sport, title, url in self.targets:
+            self.stats["polls"] += 1
+            try:
+                r = mp.http_request(url, retries=0)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[LIVE] {title}: {e}")
+                continue
+            digest = body_hash(r.content)
+            if self._digests.get(title) == digest:   # страница байт-в-байт та же — не парсим
+                self.stats["unchanged"] += 1
+                continue
+            self._digests[title] = digest
+            items = [m.to_dict() for m in mp.parse_page(sport, title, r.text, include_live=True)]
+            delta = self.state.update(title, items)
+            if delta:
+                self.hub.publish("delta", delta)
+                self.stats["deltas"] += 1
+                sent += 1
+        return sent
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.poll_once()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> threading.Thread:
+        t = threading.Thread(target=self.run, name="live-poller", daemon=True)
+        t.start()
+        return t
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class LiveServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128   # по умолчанию 5: сотня одновременных подключений упирается в backlog
+
+
+def make_handler(state: LiveState, hub: SSEHub, poller: Optional[LivePoller] = None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):   # без строки в stdout на каждый запрос
+            pass
+
+        def _json(self, data, status: int = 200) -> None:
+            raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/snapshot":
+                self._json({"matches": state.snapshot()})
+            elif path == "/health":
+                self._json({"clients": hub.clients, "seq": hub.seq, **(poller.stats if poller else {})})
+            elif path == "/events":
+                self._stream()
+            else:
+                self._json({"error": "not found"}, 404)
+
+        def _stream(self) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "keep-alive")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            # Подписка до снимка: дельта, пришедшая между ними, просто применится повторно
+            q = hub.subscribe()
+            try:
+                self.wfile.write(hub.format("snapshot", {"matches": state.snapshot()}))
+                self.wfile.flush()
+                while True:
+                    try:
+                        msg = q.get(timeout=HEARTBEAT_SEC)
+                    except queue.Empty:
+                        msg = b": ping\n\n"
+                    if msg is None:   # клиент не успевал читать — отключён хабом
+                        break
+                    self.wfile.write(msg)
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                hub.unsubscribe(q)
+                self.close_connection = True
+
+    return Handler
+
+
+def serve(targets: List[tuple], host: str = LIVE_HOST, port: int = LIVE_PORT,
+          interval: float = LIVE_POLL_SEC) -> None:
+    state, hub = LiveState(), SSEHub()
+    poller = LivePoller(targets, state, hub, interval)
+    server = LiveServer((host, port), make_handler(state, hub, poller))
+    poller.start()
+    print(f"[LIVE] {len(targets)} страниц, опрос раз в {interval:g} с, SSE: http://{host}:{port}/events")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[LIVE] остановлен")
+    finally:
+        poller.stop()
+        server.server_close()
+
+
+def _parse_target(spec: str) -> tuple:
+    """"sport:title:url" → (sport, title, url); url может содержать двоеточия."""
+    sport, title, url = spec.split(":", 2)
+    return sport, title, url
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Live-линия Marathon с рассылкой по SSE")
+    ap.add_argument("--url", action="append", type=_parse_target, default=[],
+                    help="sport:title:url (можно несколько); по умолчанию LIVE_URLS")
+    ap.add_argument("--host", default=LIVE_HOST)
+    ap.add_argument("--port", type=int, default=LIVE_PORT)
+    ap.add_argument("--interval", type=float, default=LIVE_POLL_SEC)
+    args = ap.parse_args()
+    targets = args.url or list(mp.LIVE_URLS)
+    if not targets:
+        ap.error("LIVE_URLS пуст — передайте --url sport:title:url")
+    serve(targets, args.host, args.port, args.interval)
+
+
+if __name__ == "__main__":
+    main()
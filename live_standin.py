@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — локальный стенд для live_odds.py без похода на Marathon.
+
+Отдаёт /live/<sport> в разметке Marathon (coupon-row, data-selection-key).
+Раз в --tick секунд часть событий двигает коэффициенты, изредка события
+заканчиваются и появляются новые; у части live-строк нет ссылки на матч,
+как на настоящих популярных страницах. Плюс нагрузочный клиент SSE.
+
+    python live_standin.py --port 8091 --events 300 --tick 2
+    python live_odds.py --url tennis:Live:http://127.0.0.1:8091/live/tennis --interval 1
+    python live_standin.py --load http://127.0.0.1:8090/events --clients 200 --seconds 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import html
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, List
+
+from live_odds import LiveServer
+
+FIRST_EVENT_ID = 90_000_000
+
+
+class LiveBoard:
+    """Набор live-событий одного вида спорта; состояние двигается по тикам при запросе."""
+
+    def __init__(self, sport: str, events: int = 50, tick: float = 2.0, move_share: float = 0.2,
+                 seed: int = 0):
+        self.sport = sport
+        self.tick = tick
+        self.move_share = move_share
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = FIRST_EVENT_ID
+        self._events: Dict[int, dict] = {}
+        for _ in range(events):
+            self._spawn()
+        self._ticks_done = 0
+        self._started = time.monotonic()
+
+    def _spawn(self) -> None:
+        e_id = self._next_id
+        self._next_id += 1
+        self._events[e_id] = {
+            "t1": f"Игрок {e_id % 1000}А", "t2": f"Игрок {e_id % 1000}Б",
+            "p1": round(self._rnd.uniform(1.1, 4.0), 2), "p2": round(self._rnd.uniform(1.1, 4.0), 2),
+            "linked": self._rnd.random() < 0.7,
+        }
+
+    def _step(self) -> None:
+        ids = list(self._events)
+        for e_id in self._rnd.sample(ids, max(1, int(len(ids) * self.move_share))):
+            ev = self._events[e_id]
+            for k in ("p1", "p2"):
+                ev[k] = round(min(50.0, max(1.01, ev[k] * self._rnd.uniform(0.93, 1.07))), 2)
+        if self._rnd.random() < 0.1:   # матч закончился, начался новый
+            del self._events[self._rnd.choice(ids)]
+            self._spawn()
+
+    def advance(self) -> None:
+        with self._lock:
+            due = int((time.monotonic() - self._started) / self.tick) if self.tick > 0 else 0
+            while self._ticks_done < due:
+                self._step()
+                self._ticks_done += 1
+
+    def render(self) -> str:
+        self.advance()
+        with self._lock:
+            rows = [self._row(e_id, ev) for e_id, ev in self._events.items()]
+        return ("<!DOCTYPE html><html lang=\"ru\"><head><meta charset=\"utf-8\"></head><body>"
+                "<div class=\"category-container\">" + "".join(rows) + "</div></body></html>")
+
+    def _row(self, e_id: int, ev: dict) -> str:
+        name = html.escape(f"{ev['t1']} - {ev['t2']}")
+        link = ""
+        if ev["linked"]:
+            link = f"<a class=\"event-name\" href=\"/su/betting/{self.sport}/Live/{e_id}\">{name}</a>"
+        return (f"<div class=\"coupon-row\" data-event-treeId=\"{e_id}\" data-event-name=\"{name}\">"
+                f"<div class=\"date\">2-й сет</div>{link}"
+                f"<span class=\"selection-link\" data-selection-key=\"{e_id}@Match_Result.1\">{ev['p1']:.2f}</span>"
+                f"<span class=\"selection-link\" data-selection-key=\"{e_id}@Match_Result.3\">{ev['p2']:.2f}</span>"
+                f"</div>")
+
+
+def make_handler(boards: Dict[str, LiveBoard], args):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *a):
+            pass
+
+        def do_GET(self):
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "live":
+                self.send_error(404)
+                return
+            board = boards.get(parts[1])
+            if board is None:
+                board = boards.setdefault(parts[1], LiveBoard(parts[1], args.events, args.tick, seed=len(boards)))
+            raw = board.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+    return Handler
+
+
+def load_test(url: str, clients: int, seconds: float) -> None:
+    """N параллельных SSE-клиентов: сколько событий и байт каждый получил за окно."""
+    counts: List[int] = [0] * clients
+    sizes: List[int] = [0] * clients
+    deadline = time.monotonic() + seconds
+
+    def client(i: int) -> None:
+        try:
+            with urllib.request.urlopen(url, timeout=seconds + 30) as resp:
+                while time.monotonic() < deadline:
+                    line = resp.readline()
+                    if not line:
+                        return
+                    sizes[i] += len(line)
+                    if line.startswith(b"event:"):
+                        counts[i] += 1
+        except Exception as e:
+            print(f"[LOAD] клиент {i}: {e}")
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(max(0.0, deadline - time.monotonic()) + 1)
+    alive = sum(1 for c in counts if c)
+    total = sum(counts)
+    print(f"[LOAD] клиентов с данными: {alive}/{clients}, событий: {total} "
+          f"(в среднем {total / max(alive, 1):.1f}), принято {sum(sizes) / 1024:.1f} КБ за {seconds:g} с")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Стенд live-страниц Marathon и нагрузочный SSE-клиент")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8091)
+    ap.add_argument("--events", type=int, default=50, help="событий на страницу")
+    ap.add_argument("--tick", type=float, default=2.0, help="раз в сколько секунд двигается линия")
+    ap.add_argument("--load", metavar="SSE_URL", help="вместо стенда — нагрузить SSE-эндпоинт")
+    ap.add_argument("--clients", type=int, default=50)
+    ap.add_argument("--seconds", type=float, default=20)
+    args = ap.parse_args()
+
+    if args.load:
+        load_test(args.load, args.clients, args.seconds)
+        return
+    server = LiveServer((args.host, args.port), make_handler({}, args))
+    print(f"[STANDIN] http://{args.host}:{args.port}/live/<sport>, {args.events} событий, тик {args.tick:g} с")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
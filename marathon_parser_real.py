@@ -6,18 +6,31 @@ PRIZMBET Marathon parser — MAXIMUM POPULAR LEAGUES + LIVE (OPTIMIZED & SAFE)
 
 from __future__ import annotations
 
+import asyncio
 import datetime as _dt
-import json
 import os
+import queue
 import re
 import time
-from typing import List, Optional
-from urllib.parse import urljoin
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 import threading
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+
+from browser_pool import BrowserPool
+from http_cache import HttpCache, body_hash
+from match_model import NAN, Match
+from odds_history import OddsHistory
+from publish import publish_matches, publish_shards
+from run_report import RunReport
+from sheets_sync import SheetSync
+from text_norm import clean_name, day_start_ts, kickoff_ts, msk_today, norm_space, normalize_h2_league
+from text_norm import cache_stats as norm_cache_stats
 
 BASE = "https://www.marathonbet.ru"
 
@@ -53,62 +66,193 @@ ALLOWED_FOOTBALL_LEAGUES = {
     "Россия. Премьер-лига", "Россия. 1-я лига",
 }
 
+# Live-страницы для live_odds.py: (sport, title, url), как в POPULAR_FALLBACK
 LIVE_URLS = []
 OUT_JSON = "matches.json"
+DELTA_JSON = "matches.delta.json"
+# matches.min.json + .gz/.br для статического хостинга (brotli — если установлен)
+JSON_ARTIFACTS = os.getenv("JSON_ARTIFACTS", "1") != "0"
+# История коэффициентов (odds_history.py): дозапись изменившихся линий каждого прогона
+ODDS_HISTORY = os.getenv("ODDS_HISTORY", "1") != "0"
+ODDS_HISTORY_DIR = os.getenv("ODDS_HISTORY_DIR", "odds_history")
+# Отчёт прогона (run_report.py): строка JSON на прогон; пусто — не писать
+RUN_REPORT = os.getenv("RUN_REPORT", "run_report.jsonl")
+# Шарды ленты для клиентов: по виду спорта, SHARD_BY_LEAGUE=1 — по лигам; SHARDS=0 — не писать
+SHARDS = os.getenv("SHARDS", "1") != "0"
+SHARDS_DIR = os.getenv("SHARDS_DIR", "shards")
+SHARD_BY_LEAGUE = os.getenv("SHARD_BY_LEAGUE", "0") == "1"
+
+# Браузерный фолбэк (browser_pool.py): 403 или страница без coupon-row дорисовывается в headless Chromium
+BROWSER_FALLBACK = os.getenv("BROWSER_FALLBACK", "0") == "1"
+# Страница, которую и браузер отрисовал без строк (пустая лига), столько секунд в браузер не идёт
+BROWSER_EMPTY_TTL = int(os.getenv("BROWSER_EMPTY_TTL", "3600"))
 
+# Лист матчей в Google Sheets (sheets_sync.py): пишется, если задан SPREADSHEET_ID и есть CREDS_FILE
 WRITE_SHEETS = os.getenv("WRITE_SHEETS", "1") != "0"
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID", "")
 SHEET_NAME = os.getenv("SHEET_NAME", "Matches")
 CREDS_FILE = os.getenv("CREDS_FILE", "credentials.json")
+SHEETS_STATE = os.getenv("SHEETS_STATE", ".sheets_state.matches.json")
 
 UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
       "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
 TIMEOUT = 25
 _local = threading.local()
 
+# Движок загрузки: "thread" — пул потоков + пауза перед запросом (как раньше),
+# "async" — asyncio с общим keep-alive пулом, лимитом на хост и token-bucket.
+FETCH_ENGINE = os.getenv("FETCH_ENGINE", "thread")
+THREAD_WORKERS = 3                                        # max_workers=3 спасает от блокировок
+HOST_CONCURRENCY = int(os.getenv("HOST_CONCURRENCY", "3"))  # одновременных запросов на хост
+RATE_PER_SEC = float(os.getenv("RATE_PER_SEC", "2"))      # средний темп запросов к Marathon
+RATE_BURST = int(os.getenv("RATE_BURST", "3"))            # сколько запросов можно сразу
+
+# Разбор HTML в отдельных процессах: 0 — в основном процессе, "auto" — по числу ядер
+_parse_workers = os.getenv("PARSE_WORKERS", "0")
+PARSE_WORKERS = (os.cpu_count() or 1) if _parse_workers == "auto" else int(_parse_workers)
+
+# Дубли страниц ищутся по sha1 тела; с этим флагом — ещё и по набору event-id
+DEDUPE_EVENT_IDS = os.getenv("DEDUPE_EVENT_IDS", "1") != "0"
+
+# Кэш условных GET: ETag/Last-Modified + хеш тела → повторно не парсим неизменённые страницы
+HTTP_CACHE = os.getenv("HTTP_CACHE", "1") != "0"
+HTTP_CACHE_FILE = os.getenv("HTTP_CACHE_FILE", ".http_cache.json")
+
+def _new_session(pool_size: int = 1) -> requests.Session:
+    s = requests.Session()
+    s.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    s.headers.update({
+        "User-Agent": UA,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "ru,en;q=0.9",
+        "Connection": "keep-alive",
+    })
+    return s
+
 def _get_session() -> requests.Session:
     """Потокобезопасная сессия: каждый поток получает свою."""
     if not hasattr(_local, "session"):
-        s = requests.Session()
-        s.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
-        s.headers.update({
-            "User-Agent": UA,
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "ru,en;q=0.9",
-            "Connection": "keep-alive",
-        })
-        _local.session = s
+        _local.session = _new_session()
     return _local.session
 
-def http_get(url: str, retries: int = 2) -> str:
+class FetchError(Exception):
+    """Загрузка не удалась после всех повторов: HTTP-статус (0 — сетевая ошибка) и число повторов."""
+
+    def __init__(self, message: str, status: int = 0, retries: int = 0):
+        super().__init__(message)
+        self.status = status
+        self.retries = retries
+
+def _check_response(r: requests.Response, url: str, attempt: int) -> requests.Response:
+    if r.status_code == 403:
+        raise FetchError(f"403 Forbidden — Marathon заблокировал запрос (попытка {attempt+1})", 403)
+    if r.status_code == 404:
+        raise FetchError(f"404 Not Found — страница не существует: {url}", 404)
+    r.raise_for_status()
+    r.retries = attempt   # для отчёта прогона (run_report)
+    return r
+
+def _fetch_error(err: Exception, retries: int) -> FetchError:
+    status = getattr(err, "status", 0) or getattr(getattr(err, "response", None), "status_code", 0) or 0
+    return FetchError(str(err), status, retries)
+
+def http_request(url: str, retries: int = 2, headers: Optional[dict] = None) -> requests.Response:
+    """GET с повторами; 304 Not Modified считается успешным ответом."""
     last_err = None
     for attempt in range(retries + 1):
         try:
-            r = _get_session().get(url, timeout=TIMEOUT)
-            if r.status_code == 403:
-                raise Exception(f"403 Forbidden — Marathon заблокировал запрос (попытка {attempt+1})")
-            if r.status_code == 404:
-                raise Exception(f"404 Not Found — страница не существует: {url}")
-            r.raise_for_status()
-            return r.text
+            r = _get_session().get(url, timeout=TIMEOUT, headers=headers)
+            return _check_response(r, url, attempt)
         except Exception as e:
             last_err = e
             if attempt < retries:
                 time.sleep(1.5 * (attempt + 1))
-    raise last_err
+    raise _fetch_error(last_err, retries) from last_err
 
-def norm_space(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "").strip())
+def http_get(url: str, retries: int = 2) -> str:
+    return http_request(url, retries).text
+
+# ─── Async-движок ──────────────────────────────────────────────────────────────
+class TokenBucket:
+    """
+    Token-bucket для asyncio: в среднем не больше `rate` запросов в секунду,
+    до `burst` запросов подряд. Заменяет слепые time.sleep перед каждым запросом.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = max(rate, 0.001)
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._ts = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Неблокирующий вариант для синхронного кода (бюджет демона): взять токен, если есть."""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Через сколько секунд появится следующий токен."""
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+class AsyncFetcher:
+    """
+    Общий keep-alive пул (одна requests.Session на весь прогон) + семафор на хост
+    + TokenBucket. Сетевой вызов уходит в asyncio.to_thread, поэтому число
+    одновременных запросов определяется только семафором, а темп — bucket-ом.
+    """
 
-def clean_name(s: str) -> str:
-    if not s: return ""
-    s = re.sub(r"\(?Первый матч\s+\d+:\d+\)?", "", s, flags=re.I)
-    s = re.sub(r"\(?счет\s+\d+:\d+\)?", "", s, flags=re.I)
-    s = re.sub(r"\(?серия\s+\d+:\d+\)?", "", s, flags=re.I)
-    s = re.sub(r"\(\d{1,2}:\d{1,2}(?:,\s*\d{1,2}:\d{1,2})*\)", "", s)
-    s = re.sub(r"\d+:\d+", "", s).strip()
-    s = re.sub(r"\bматч\b", "", s, flags=re.I).strip()
-    return re.sub(r"\s+", " ", s).strip(" -/\\")
+    def __init__(self, per_host: int = HOST_CONCURRENCY, rate: float = RATE_PER_SEC,
+                 burst: int = RATE_BURST, session: Optional[requests.Session] = None):
+        self.per_host = max(per_host, 1)
+        self.session = session or _new_session(pool_size=self.per_host)
+        self.bucket = TokenBucket(rate, burst)
+        self._host_sem: dict = {}
+
+    def _sem(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_sem:
+            self._host_sem[host] = asyncio.Semaphore(self.per_host)
+        return self._host_sem[host]
+
+    async def request(self, url: str, retries: int = 2,
+                      headers: Optional[dict] = None) -> requests.Response:
+        last_err = None
+        for attempt in range(retries + 1):
+            try:
+                async with self._sem(url):
+                    await self.bucket.acquire()
+                    r = await asyncio.to_thread(self.session.get, url, timeout=TIMEOUT, headers=headers)
+                return _check_response(r, url, attempt)
+            except Exception as e:
+                last_err = e
+                if attempt < retries:
+                    await asyncio.sleep(1.5 * (attempt + 1))
+        raise _fetch_error(last_err, retries) from last_err
+
+    async def get(self, url: str, retries: int = 2) -> str:
+        return (await self.request(url, retries)).text
+
+    def close(self) -> None:
+        self.session.close()
 
 def as_float(s: str) -> Optional[float]:
     if s is None: return None
@@ -117,331 +261,890 @@ def as_float(s: str) -> Optional[float]:
     try: return float(s)
     except: return None
 
-def fmt_odd(v) -> str:
-    """Форматирует коэффициент без научной нотации (:.3g даёт '1e+03' для >1000)."""
-    if not v: return "0.00"
-    s = f"{v:.3g}"
-    if 'e' in s:
-        return str(round(float(v), 2))
-    return s
+# ─── Разбор coupon-row ─────────────────────────────────────────────────────────
+# Ключи основного рынка футбола (1X2 + двойные шансы)
+FOOTBALL_KEY_MAP = {
+    "Match_Result.1": "p1", "Match_Result.draw": "x", "Match_Result.3": "p2",
+    "Result.HD": "p1x", "Result.HA": "p12", "Result.AD": "px2",
+}
 
-# ─── Дата-хелперы ──────────────────────────────────────────────────────────────
-MONTH_RU = {
-    "янв": 1, "фев": 2, "мар": 3, "апр": 4, "май": 5, "июн": 6,
-    "июл": 7, "авг": 8, "сен": 9, "окт": 10, "ноя": 11, "дек": 12,
+# Ключи основного рынка результата матча
+# Match_Result - для футбола и стандартных рынков
+# Match_Winner_Including_All_OT - для баскетбола/NBA
+WINNER_KEY_MAP = {
+    "Match_Result.1":                   "p1",
+    "Match_Result.draw":                "x",
+    "Match_Result.3":                   "p2",
+    "Match_Winner_Including_All_OT.HB_H": "p1",
+    "Match_Winner_Including_All_OT.HB_A": "p2",
+    "To_Win_Match_With_Handicap.HB_H":  "h1_fake", # Игнорируем форы
 }
 
-def parse_ru_date(date_str: str) -> Optional[_dt.date]:
-    """Парсит '28 мар' → date(2026, 3, 28)."""
-    m = re.match(r"(\d{1,2})\s+([а-яё]+)", (date_str or "").strip(), re.I)
-    if not m:
+# Виды спорта без ничьей: x всегда "—"
+# Баскетбол/теннис — Marathon показывает Match_Result.draw для рынка
+# "основное время" (regulation time), что даёт margin ~158% (мусорные данные)
+NO_DRAW_SPORTS = {"basket", "tennis", "mma", "esports", "volleyball"}
+
+_DATE_TIME_PAT = re.compile(r"(\d{1,2}\s+[а-яёА-Я]{2,4})\s+(\d{1,2}:\d{2})")
+
+# Бэкенд HTML-парсера: "bs4" — BeautifulSoup + CSS select, "lxml" — сырой lxml
+# с заранее скомпилированными XPath. Результат у обоих побайтно одинаковый.
+PARSER_BACKEND = os.getenv("PARSER_BACKEND", "bs4")
+
+class RawRow(NamedTuple):
+    """Сырые поля coupon-row — всё, что нужно сборщикам матчей, без DOM-объектов."""
+    event_id: str
+    members: list        # [(текст, href)] для a.member-link
+    event_name: str      # data-event-name
+    betting_href: str    # первая a[href*='/betting/'] (только если member-link < 2)
+    time_txt: str        # текст .date-wrapper / .date
+    selections: list     # [(data-selection-key, текст)] для .selection-link
+    prices: list         # тексты .price (только если нет .selection-link)
+    league: str
+
+def _split_date_time(time_txt: str) -> tuple:
+    m_dt = _DATE_TIME_PAT.search(time_txt)
+    if m_dt:
+        return m_dt.group(1), m_dt.group(2)
+    return "", (time_txt if ":" in time_txt else "")
+
+def _build_football(r: RawRow, today: Optional[_dt.date] = None) -> Optional[Match]:
+    if len(r.members) < 2:
         return None
-    day = int(m.group(1))
-    mon = MONTH_RU.get(m.group(2)[:3].lower())
-    if not mon:
+    t1 = clean_name(r.members[0][0])
+    t2 = clean_name(r.members[1][0])
+    m_link = r.members[0][1]
+    match_url = urljoin(BASE, m_link) if m_link else ""
+    date_str, time_str = _split_date_time(r.time_txt)
+
+    odds_dict = {}
+    for sel_key, text in r.selections:
+        for suffix, field in FOOTBALL_KEY_MAP.items():
+            if sel_key.endswith(suffix):
+                odds_dict[field] = as_float(text.strip()) or 0.0
+                break
+
+    # У футбола нет «прочерков»: отсутствующая кнопка — 0.0 ("0.00" в JSON)
+    return Match(
+        "football", r.league, r.event_id, date_str, time_str, t1, t2, match_url,
+        odds_dict.get("p1", 0.0), odds_dict.get("x", 0.0), odds_dict.get("p2", 0.0),
+        odds_dict.get("p1x", 0.0), odds_dict.get("p12", 0.0), odds_dict.get("px2", 0.0),
+        kickoff_ts=kickoff_ts(date_str, time_str, today),
+    )
+
+def _build_2way(r: RawRow, sport: str, include_live: bool = False,
+                today: Optional[_dt.date] = None) -> Optional[Match]:
+    m_link, t1, t2 = "", "", ""
+    if len(r.members) >= 2:
+        t1 = clean_name(r.members[0][0])
+        t2 = clean_name(r.members[1][0])
+        m_link = r.members[0][1]
+    else:
+        event_name = r.event_name
+        if " - " in event_name:
+            t1, t2 = [clean_name(x) for x in event_name.split(" - ", 1)]
+        elif " vs " in event_name:
+            t1, t2 = [clean_name(x) for x in event_name.split(" vs ", 1)]
+        if r.betting_href: m_link = r.betting_href
+
+    if not t1 or not t2: return None
+    match_url = urljoin(BASE, m_link) if m_link else ""
+
+    # Пропускаем матчи без ссылки — это LIVE-матчи других видов спорта,
+    # которые MarathonBet показывает вверху популярных страниц.
+    # Live-режим (live_odds.py) их, наоборот, и собирает.
+    if not match_url and not include_live:
         return None
-    today = _dt.date.today()
-    d = _dt.date(today.year, mon, day)
-    # Дата ушла в прошлое более чем на полгода — значит следующий год
-    if (today - d).days > 180:
-        d = _dt.date(today.year + 1, mon, day)
-    return d
-
-_STAGE_PAT = re.compile(
-    r'^\d+/\d+|'                                  # "1/8", "1/4" и т.п.
-    r'\bраунд\b|\bфинал\b|\bматч(и|е|ей|ах|ам)?\b|\bтур\b|\bгруппа\b|'
-    r'лондон|мадрид|берлин|париж|монако|'         # города-площадки кубков
-    r'северо|запад\b|восток\b|юг\b|бавари|'       # региональные лиги
-    r'первые|вторые|ответн|стыков',
-    re.I
-)
-
-def normalize_h2_league(text: str) -> str:
-    """
-    Нормализует Marathon h2 вида "Страна.Лига.Стадия" → "Страна. Лига".
-    Возвращает "" для секций "Итоги" (завершённые матчи).
-    """
-    if not text:
-        return ""
-    if text.lower().startswith('итоги'):
-        return ""   # Пропускаем секции результатов
-    # "Страна.Лига" → "Страна. Лига" (Marathon не ставит пробел после точки)
-    text = re.sub(r'\.(?=[^\s\d])', '. ', text)
-    parts = [p.strip() for p in text.split('. ') if p.strip()]
-    if not parts:
-        return ""
-    result = []
-    for part in parts:
-        if _STAGE_PAT.search(part):
-            break  # Всё после стадии — лишнее
-        result.append(part)
-        if len(result) >= 3:
-            break
-    return '. '.join(result)
-
-def get_row_h2(row) -> str:
+
+    date_str, time_str = _split_date_time(r.time_txt)
+
+    # === КЛЮЧ-ОРИЕНТИРОВАННОЕ ИЗВЛЕЧЕНИЕ КОЭФФИЦИЕНТОВ ===
+    # Берём только кнопки основного рынка (Match_Result.*),
+    # игнорируем гандикап, тотал и другие рынки в той же строке
+    odds_dict: dict = {}
+    for sel_key, text in r.selections:
+        for suffix, field in WINNER_KEY_MAP.items():
+            if sel_key.endswith(suffix):
+                val = as_float(text.strip())
+                if val:
+                    odds_dict[field] = val
+                break
+
+    p1_val = odds_dict.get("p1") or 0.0
+    x_val  = odds_dict.get("x")  or 0.0   # 0 = нет ничьи (теннис, баскет, МMA)
+    p2_val = odds_dict.get("p2") or 0.0
+
+    # Fallback: позиционное извлечение если ключи не найдены
+    # ВНИМАНИЕ: Для баскетбола в строке может быть 6 кнопок:
+    # П1, П2, Фора1, Фора2, ТоталМ, ТоталБ.
+    if not p1_val and not p2_val:
+        odds_btns = [text for _, text in r.selections] or r.prices
+
+        btn_count = len(odds_btns)
+        # Если 3 кнопки (П1, X, П2) - футбол/хоккей
+        if btn_count >= 3:
+            # Если спорт без ничьей (баскет), но кнопок >= 2, берем П1=0, П2=1
+            if sport in NO_DRAW_SPORTS:
+               p1_val = as_float(odds_btns[0]) or 0.0
+               p2_val = as_float(odds_btns[1]) or 0.0
+            else:
+               p1_val = as_float(odds_btns[0]) or 0.0
+               x_val  = as_float(odds_btns[1]) or 0.0
+               p2_val = as_float(odds_btns[2]) or 0.0
+        # Если 2 кнопки (П1, П2) - теннис/NBA/киберспорт
+        elif btn_count >= 2:
+            p1_val = as_float(odds_btns[0]) or 0.0
+            p2_val = as_float(odds_btns[1]) or 0.0
+
+    # Для видов без ничьей — принудительно убираем X.
+    # Marathon показывает Match_Result.draw для "основного времени"
+    # в баскете/теннисе/etc., что даёт margin ~158% (мусорные данные).
+    if sport in NO_DRAW_SPORTS:
+        x_val = 0.0
+
+    # Ничьей и двойных шансов у этих видов нет — NaN ("—" в JSON)
+    return Match(sport, "", r.event_id, date_str, time_str, t1, t2, match_url,
+                 p1_val, x_val or NAN, p2_val, kickoff_ts=kickoff_ts(date_str, time_str, today))
+
+# ─── Бэкенд bs4 ────────────────────────────────────────────────────────────────
+def _row_leagues_bs4(soup) -> dict:
     """
-    Возвращает нормализованное название лиги для coupon-row.
+    Лига для каждой coupon-row за один проход по category-container.
     Marathon: каждый category-container = одна лига, внутри него
     <a class="category-label-link"><h2>Страна.Лига</h2></a> + все coupon-rows.
-    Поднимаемся до category-container, берём его h2.
+    h2 контейнера нормализуется один раз; вложенный контейнер идёт в документе
+    позже внешнего и перезаписывает его строки — побеждает ближайший, как раньше.
+    find_all вместо CSS select — обход без soupsieve. Ключ — id(row): теги живут, пока жив soup.
     """
-    el = row
-    for _ in range(8):
-        el = el.parent
-        if not el or not hasattr(el, "get"):
-            break
-        if "category-container" in (el.get("class") or []):
-            h2 = el.select_one("a.category-label-link h2") or el.find("h2")
-            if h2:
-                return normalize_h2_league(norm_space(h2.get_text()))
-    return ""
-
-def parse_football_table(html: str) -> List[dict]:
+    leagues = {}
+    for cont in soup.find_all(class_="category-container"):
+        h2 = cont.select_one("a.category-label-link h2") or cont.find("h2")
+        if not h2:
+            continue
+        league = normalize_h2_league(norm_space(h2.get_text()))
+        for row in cont.find_all("div", class_="coupon-row"):
+            leagues[id(row)] = league
+    return leagues
+
+def _iter_rows_bs4(html: str, with_league: bool, need_members: int):
     soup = BeautifulSoup(html, "lxml")
-    out = []
+    leagues = _row_leagues_bs4(soup) if with_league else {}
     for row in soup.select("div.coupon-row"):
         event_id = row.get("data-event-treeid") or row.get("data-event-treeId") or row.get("data-event-id")
         if not event_id: continue
         member_links = row.select("a.member-link")
-        if len(member_links) < 2: continue
-            
-        t1 = clean_name(member_links[0].get_text())
-        t2 = clean_name(member_links[1].get_text())
-        m_link = member_links[0].get("href")
-        match_url = urljoin(BASE, m_link) if m_link else ""
-
+        if len(member_links) < need_members: continue
+        members = [(a.get_text(), a.get("href")) for a in member_links[:2]]
+        betting_href = ""
+        if len(member_links) < 2:
+            m_link_el = row.select_one("a[href*='/betting/']")
+            if m_link_el: betting_href = m_link_el.get("href")
         time_el = row.select_one(".date-wrapper") or row.select_one(".date")
         time_txt = norm_space(time_el.get_text()) if time_el else ""
-        date_str, time_str = "", ""
-        m_dt = re.search(r"(\d{1,2}\s+[а-яёА-Я]{2,4})\s+(\d{1,2}:\d{2})", time_txt)
-        if m_dt:
-            date_str, time_str = m_dt.group(1), m_dt.group(2)
-        else:
-            time_str = time_txt if ":" in time_txt else ""
-
-        odds_dict = {}
-        key_map = {
-            "Match_Result.1": "p1", "Match_Result.draw": "x", "Match_Result.3": "p2",
-            "Result.HD": "p1x", "Result.HA": "p12", "Result.AD": "px2"
-        }
-        for btn in row.select(".selection-link"):
-            sel_key = btn.get("data-selection-key", "")
-            for suffix, field in key_map.items():
-                if sel_key.endswith(suffix):
-                    val = as_float(btn.get_text().strip())
-                    odds_dict[field] = fmt_odd(val) if val else "0.00"
-                    break
-
-        out.append({
-            "sport": "football", "league": get_row_h2(row), "id": event_id,
-            "date": date_str, "time": time_str, "team1": t1, "team2": t2,
-            "match_url": match_url,
-            "p1": odds_dict.get("p1", "0.00"), "x": odds_dict.get("x", "0.00"), "p2": odds_dict.get("p2", "0.00"),
-            "p1x": odds_dict.get("p1x", "0.00"), "p12": odds_dict.get("p12", "0.00"), "px2": odds_dict.get("px2", "0.00"),
-        })
+        selections = [(btn.get("data-selection-key", ""), btn.get_text()) for btn in row.select(".selection-link")]
+        prices = [] if selections else [p.get_text() for p in row.select(".price")]
+        yield RawRow(event_id, members, row.get("data-event-name", ""), betting_href,
+                     time_txt, selections, prices, leagues.get(id(row), ""))
+
+# ─── Бэкенд lxml (XPath) ───────────────────────────────────────────────────────
+def _cls(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+_X_ROWS = etree.XPath(f"//div[{_cls('coupon-row')}]")
+_X_ROWS_IN = etree.XPath(f".//div[{_cls('coupon-row')}]")
+_X_CONTAINERS = etree.XPath(f"//*[{_cls('category-container')}]")
+_X_MEMBERS = etree.XPath(f".//a[{_cls('member-link')}]")
+_X_BETTING_LINK = etree.XPath("(.//a[contains(@href, '/betting/')])[1]")
+_X_DATE_WRAPPER = etree.XPath(f"(.//*[{_cls('date-wrapper')}])[1]")
+_X_DATE = etree.XPath(f"(.//*[{_cls('date')}])[1]")
+_X_SELECTIONS = etree.XPath(f".//*[{_cls('selection-link')}]")
+_X_PRICES = etree.XPath(f".//*[{_cls('price')}]")
+_X_LABEL_H2 = etree.XPath(f"(.//a[{_cls('category-label-link')}]//h2)[1]")
+_X_ANY_H2 = etree.XPath("(.//h2)[1]")
+# Как bs4.get_text(): без комментариев и содержимого script/style/template
+_X_TEXT = etree.XPath(".//text()[not(parent::script or parent::style or parent::template)]")
+
+def _text(el) -> str:
+    return "".join(_X_TEXT(el))
+
+def _row_leagues_lxml(root) -> dict:
+    """
+    То же, что _row_leagues_bs4. Ключ — сам элемент: пока он лежит в словаре,
+    lxml возвращает тот же прокси-объект, и поиск по строке из _X_ROWS работает.
+    """
+    leagues = {}
+    for cont in _X_CONTAINERS(root):
+        h2 = _X_LABEL_H2(cont) or _X_ANY_H2(cont)
+        if not h2:
+            continue
+        league = normalize_h2_league(norm_space(_text(h2[0])))
+        for row in _X_ROWS_IN(cont):
+            leagues[row] = league
+    return leagues
+
+_XML_DECL = re.compile(r"\s*<\?xml[^>]*>")
+
+def _iter_rows_lxml(html: str, with_league: bool, need_members: int):
+    # str с <?xml ... encoding=...?> lxml не принимает (ValueError); для HTML декларация не нужна
+    html = _XML_DECL.sub("", html, count=1) if html.lstrip().startswith("<?xml") else html
+    if not html.strip():
+        return
+    try:
+        root = lxml_html.document_fromstring(html)
+    except etree.ParserError:   # только комментарии — «Document is empty», у bs4 это []
+        return
+    leagues = _row_leagues_lxml(root) if with_league else {}
+    for row in _X_ROWS(root):
+        event_id = row.get("data-event-treeid") or row.get("data-event-id")
+        if not event_id: continue
+        member_links = _X_MEMBERS(row)
+        if len(member_links) < need_members: continue
+        members = [(_text(a), a.get("href")) for a in member_links[:2]]
+        betting_href = ""
+        if len(member_links) < 2:
+            m_link_el = _X_BETTING_LINK(row)
+            if m_link_el: betting_href = m_link_el[0].get("href")
+        time_el = _X_DATE_WRAPPER(row) or _X_DATE(row)
+        time_txt = norm_space(_text(time_el[0])) if time_el else ""
+        selections = [(btn.get("data-selection-key", ""), _text(btn)) for btn in _X_SELECTIONS(row)]
+        prices = [] if selections else [_text(p) for p in _X_PRICES(row)]
+        yield RawRow(event_id, members, row.get("data-event-name", ""), betting_href,
+                     time_txt, selections, prices, leagues.get(row, ""))
+
+# ─── Бэкенд stream (lxml, потоковый) ───────────────────────────────────────────
+STREAM_CHUNK = 64 * 1024
+
+def _has_class(el, name: str) -> bool:
+    return name in (el.get("class") or "").split()
+
+def _raw_row_lxml(row, league: str, need_members: int) -> Optional[RawRow]:
+    """Поля одной coupon-row — те же XPath, что у бэкенда lxml."""
+    event_id = row.get("data-event-treeid") or row.get("data-event-id")
+    if not event_id:
+        return None
+    member_links = _X_MEMBERS(row)
+    if len(member_links) < need_members:
+        return None
+    members = [(_text(a), a.get("href")) for a in member_links[:2]]
+    betting_href = ""
+    if len(member_links) < 2:
+        m_link_el = _X_BETTING_LINK(row)
+        if m_link_el: betting_href = m_link_el[0].get("href")
+    time_el = _X_DATE_WRAPPER(row) or _X_DATE(row)
+    time_txt = norm_space(_text(time_el[0])) if time_el else ""
+    selections = [(btn.get("data-selection-key", ""), _text(btn)) for btn in _X_SELECTIONS(row)]
+    prices = [] if selections else [_text(p) for p in _X_PRICES(row)]
+    return RawRow(event_id, members, row.get("data-event-name", ""), betting_href,
+                  time_txt, selections, prices, league)
+
+def _release(el) -> None:
+    """Освободить законченный элемент и уже пройденных соседей: в памяти остаётся только путь от корня."""
+    el.clear(keep_tail=False)
+    parent = el.getparent()
+    if parent is not None:
+        while el.getprevious() is not None:
+            del parent[0]
+
+class _StreamContainer:
+    """Открытый category-container: лига как у _row_leagues_* и строки, ждущие её."""
+    __slots__ = ("el", "label", "any", "pending")
+
+    def __init__(self, el):
+        self.el = el
+        self.label = None    # первый h2 внутри a.category-label-link в поддереве
+        self.any = None      # первый h2 в поддереве
+        self.pending = []    # строки, для которых этот контейнер — ближайший без окончательной лиги
+
+def _iter_rows_stream(html: str, with_league: bool, need_members: int):
+    """
+    HTMLPullParser по кускам STREAM_CHUNK: дерево целиком не строится.
+    Законченная coupon-row сразу превращается в RawRow и удаляется, остальная
+    разметка (скрипты, меню, подвал) — по закрывающему тегу.
+
+    Лига — как у bs4/lxml: ближайший category-container, в поддереве которого
+    есть h2; берётся a.category-label-link h2, иначе первый h2. Такой h2 может
+    стоять после строк или во вложенном контейнере, поэтому строка ждёт, пока
+    лига её контейнера не станет окончательной: label-h2 найден или контейнер
+    закрыт. Строки отдаются в порядке документа; в обычной разметке Marathon
+    (label-h2 перед строками) ничего не копится.
+    """
+    if not html.strip():
+        return
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    containers: List[_StreamContainer] = []
+    label_open: List[int] = []   # для каждого открытого a.category-label-link — число контейнеров снаружи
+    in_h2 = 0                    # текст h2 (span-ы внутри) нужен целиком до его закрытия
+    row_depth = 0                # >0 — внутри coupon-row, её поддерево не трогаем
+    out: deque = deque()         # [RawRow, лига известна] в порядке документа
+
+    def resolve(cont: _StreamContainer, league: str) -> None:
+        for entry in cont.pending:
+            entry[0] = entry[0]._replace(league=league)
+            entry[1] = True
+        cont.pending.clear()
+
+    def events():
+        for pos in range(0, len(html), STREAM_CHUNK):
+            parser.feed(html[pos:pos + STREAM_CHUNK])
+            yield from parser.read_events()
+        parser.close()                       # закрывающие события незакрытых элементов
+        yield from parser.read_events()
+
+    for event, el in events():
+        if event == "start":
+            if row_depth:
+                row_depth += 1
+            elif el.tag == "div" and _has_class(el, "coupon-row"):
+                row_depth = 1
+            elif with_league and _has_class(el, "category-container"):
+                containers.append(_StreamContainer(el))
+            elif el.tag == "a" and _has_class(el, "category-label-link"):
+                label_open.append(len(containers))
+            elif el.tag == "h2":
+                in_h2 += 1
+            continue
+        if row_depth:
+            row_depth -= 1
+            if row_depth:
+                continue
+            raw = _raw_row_lxml(el, "", need_members)
+            _release(el)
+            if raw:
+                top = containers[-1] if containers else None
+                if top is None or top.label is not None:
+                    out.append([raw._replace(league=top.label) if top else raw, True])
+                else:
+                    entry = [raw, False]
+                    out.append(entry)
+                    top.pending.append(entry)
+        elif el.tag == "h2":
+            in_h2 -= 1
+            if containers:
+                league = normalize_h2_league(norm_space(_text(el)))
+                inside_label = max(label_open, default=0)   # контейнеры [0, n) содержат открытую ссылку
+                for i, cont in enumerate(containers):
+                    if cont.any is None:
+                        cont.any = league
+                    if i < inside_label and cont.label is None:
+                        cont.label = league
+                        resolve(cont, league)
+        elif el.tag == "a" and label_open and _has_class(el, "category-label-link"):
+            label_open.pop()
+        elif containers and containers[-1].el is el:
+            cont = containers.pop()
+            league = cont.label if cont.label is not None else cont.any
+            if league is not None:
+                resolve(cont, league)
+            elif containers:
+                containers[-1].pending.extend(cont.pending)   # h2 нет — решает внешний контейнер
+                if containers[-1].label is not None:
+                    resolve(containers[-1], containers[-1].label)
+            else:
+                resolve(cont, "")
+        while out and out[0][1]:
+            yield out.popleft()[0]
+        if not in_h2 and el.getparent() is not None:   # корень <html> оставляем парсеру
+            _release(el)
+
+_ROW_BACKENDS = {"bs4": _iter_rows_bs4, "lxml": _iter_rows_lxml, "stream": _iter_rows_stream}
+
+def iter_rows(html: str, backend: Optional[str] = None, with_league: bool = False,
+              need_members: int = 0):
+    try:
+        it = _ROW_BACKENDS[backend or PARSER_BACKEND]
+    except KeyError:
+        raise ValueError(f"Неизвестный PARSER_BACKEND: {backend or PARSER_BACKEND}")
+    return it(html, with_league, need_members)
+
+def parse_football_matches(html: str, backend: Optional[str] = None) -> List[Match]:
+    out = []
+    today = msk_today()   # один раз на страницу: пустая дата и год в kickoff_ts
+    for r in iter_rows(html, backend, with_league=True, need_members=2):
+        m = _build_football(r, today)
+        if m: out.append(m)
     return out
 
-def parse_2way_winner(html: str, sport: str) -> List[dict]:
+def parse_2way_matches(html: str, sport: str, backend: Optional[str] = None,
+                       include_live: bool = False) -> List[Match]:
     """
     Парсит матчи для не-футбольных видов спорта.
     Использует data-selection-key для точного определения П1/X/П2
-    (аналогично parse_football_table), чтобы не перепутать коэффициенты
+    (аналогично parse_football_matches), чтобы не перепутать коэффициенты
     из разных рынков одной строки (гандикап, тотал, etc.).
+    include_live — оставлять live-строки без ссылки на матч (match_url == "").
     """
-    soup = BeautifulSoup(html, "lxml")
     out = []
+    today = msk_today()
+    for r in iter_rows(html, backend):
+        m = _build_2way(r, sport, include_live, today)
+        if m: out.append(m)
+    return out
 
-    # Ключи основного рынка результата матча
-    # Match_Result - для футбола и стандартных рынков
-    # Match_Winner_Including_All_OT - для баскетбола/NBA
-    KEY_MAP = {
-        "Match_Result.1":                   "p1",
-        "Match_Result.draw":                "x",
-        "Match_Result.3":                   "p2",
-        "Match_Winner_Including_All_OT.HB_H": "p1",
-        "Match_Winner_Including_All_OT.HB_A": "p2",
-        "To_Win_Match_With_Handicap.HB_H":  "h1_fake", # Игнорируем форы
-    }
-
-    # Виды спорта без ничьей: x всегда "—"
-    # Баскетбол/теннис — Marathon показывает Match_Result.draw для рынка
-    # "основное время" (regulation time), что даёт margin ~158% (мусорные данные)
-    NO_DRAW_SPORTS = {"basket", "tennis", "mma", "esports", "volleyball"}
+def parse_football_table(html: str, backend: Optional[str] = None) -> List[dict]:
+    """То же, что parse_football_matches, но сразу в формате matches.json."""
+    return [m.to_dict() for m in parse_football_matches(html, backend)]
 
-    for row in soup.select("div.coupon-row"):
-        event_id = row.get("data-event-treeid") or row.get("data-event-treeId") or row.get("data-event-id")
-        if not event_id: continue
+def parse_2way_winner(html: str, sport: str, backend: Optional[str] = None,
+                      include_live: bool = False) -> List[dict]:
+    """То же, что parse_2way_matches, но сразу в формате matches.json."""
+    return [m.to_dict() for m in parse_2way_matches(html, sport, backend, include_live)]
 
-        member_links = row.select("a.member-link")
-        m_link, t1, t2 = "", "", ""
-        if len(member_links) >= 2:
-            t1 = clean_name(member_links[0].get_text())
-            t2 = clean_name(member_links[1].get_text())
-            m_link = member_links[0].get("href")
-        else:
-            event_name = row.get("data-event-name", "")
-            if " - " in event_name:
-                t1, t2 = [clean_name(x) for x in event_name.split(" - ", 1)]
-            elif " vs " in event_name:
-                t1, t2 = [clean_name(x) for x in event_name.split(" vs ", 1)]
-            m_link_el = row.select_one("a[href*='/betting/']")
-            if m_link_el: m_link = m_link_el.get("href")
+def parse_page(sport: str, title: str, html: str, include_live: bool = False) -> List[Match]:
+    if sport == "football":
+        items = parse_football_matches(html)
+        # Используем лигу из h2-заголовка (если найдена), иначе — title из URL
+        for it in items:
+            if not it.league:
+                it.league = title
+        return items
+    elif sport == "esports":
+        items = parse_2way_matches(html, "esports", include_live=include_live)
+        for it in items: it.league = title  # исправляем: лига не устанавливалась
+        return items
+    else:
+        items = parse_2way_matches(html, sport, include_live=include_live)
+        for it in items: it.league = title
+        return items
 
-        if not t1 or not t2: continue
-        match_url = urljoin(BASE, m_link) if m_link else ""
+def _cache_key(sport: str, title: str) -> str:
+    return f"{sport}|{title}"
 
-        # Пропускаем матчи без ссылки — это LIVE-матчи других видов спорта,
-        # которые MarathonBet показывает вверху популярных страниц
-        if not match_url:
-            continue
+_EVENT_ID_PAT = re.compile(r'data-event-(?:treeid|id)="(\d+)"', re.I)
 
-        time_el = row.select_one(".date-wrapper") or row.select_one(".date")
-        time_txt = norm_space(time_el.get_text()) if time_el else ""
-        date_str, time_str = "", ""
-        m_dt = re.search(r"(\d{1,2}\s+[а-яёА-Я]{2,4})\s+(\d{1,2}:\d{2})", time_txt)
-        if m_dt:
-            date_str, time_str = m_dt.group(1), m_dt.group(2)
-        else:
-            time_str = time_txt if ":" in time_txt else ""
-
-        # === КЛЮЧ-ОРИЕНТИРОВАННОЕ ИЗВЛЕЧЕНИЕ КОЭФФИЦИЕНТОВ ===
-        # Берём только кнопки основного рынка (Match_Result.*),
-        # игнорируем гандикап, тотал и другие рынки в той же строке
-        odds_dict: dict = {}
-        for btn in row.select(".selection-link"):
-            sel_key = btn.get("data-selection-key", "")
-            for suffix, field in KEY_MAP.items():
-                if sel_key.endswith(suffix):
-                    val = as_float(btn.get_text().strip())
-                    if val:
-                        odds_dict[field] = val
-                    break
-
-        p1_val = odds_dict.get("p1") or 0.0
-        x_val  = odds_dict.get("x")  or 0.0   # 0 = нет ничьи (теннис, баскет, МMA)
-        p2_val = odds_dict.get("p2") or 0.0
-
-        # Fallback: позиционное извлечение если ключи не найдены
-        # ВНИМАНИЕ: Для баскетбола в строке может быть 6 кнопок:
-        # П1, П2, Фора1, Фора2, ТоталМ, ТоталБ.
-        if not p1_val and not p2_val:
-            odds_btns = row.select(".selection-link")
-            if not odds_btns:
-                odds_btns = row.select(".price")
-                
-            btn_count = len(odds_btns)
-            # Если 3 кнопки (П1, X, П2) - футбол/хоккей
-            if btn_count >= 3:
-                # Если спорт без ничьей (баскет), но кнопок >= 2, берем П1=0, П2=1
-                if sport in NO_DRAW_SPORTS:
-                   p1_val = as_float(odds_btns[0].get_text()) or 0.0
-                   p2_val = as_float(odds_btns[1].get_text()) or 0.0
-                else:
-                   p1_val = as_float(odds_btns[0].get_text()) or 0.0
-                   x_val  = as_float(odds_btns[1].get_text()) or 0.0
-                   p2_val = as_float(odds_btns[2].get_text()) or 0.0
-            # Если 2 кнопки (П1, П2) - теннис/NBA/киберспорт
-            elif btn_count >= 2:
-                p1_val = as_float(odds_btns[0].get_text()) or 0.0
-                p2_val = as_float(odds_btns[1].get_text()) or 0.0
-
-        # Для видов без ничьей — принудительно убираем X.
-        # Marathon показывает Match_Result.draw для "основного времени"
-        # в баскете/теннисе/etc., что даёт margin ~158% (мусорные данные).
-        if sport in NO_DRAW_SPORTS:
-            x_val = 0.0
-
-        out.append({
-            "sport": sport, "league": "", "id": event_id,
-            "date": date_str, "time": time_str, "team1": t1, "team2": t2,
-            "match_url": match_url,
-            "p1":  fmt_odd(p1_val),
-            "x":   fmt_odd(x_val) if x_val else "—",
-            "p2":  fmt_odd(p2_val),
-            "p1x": "—", "p12": "—", "px2": "—",
-        })
-    return out
+def event_fingerprint(html: str) -> str:
+    """sha1 отсортированного набора event-id страницы (регуляркой, без DOM); "" если id нет."""
+    ids = set(_EVENT_ID_PAT.findall(html))
+    return body_hash(",".join(sorted(ids)).encode()) if ids else ""
+
+class Page(NamedTuple):
+    """Результат I/O-стадии: либо тело для разбора, либо готовые матчи из кэша, либо ошибка."""
+    sport: str
+    title: str
+    url: str
+    html: Optional[str] = None
+    items: Optional[List[Match]] = None
+    error: Optional[str] = None
+    digest: str = ""          # sha1 тела
+    event_fp: str = ""        # отпечаток набора event-id
+    etag: str = ""
+    last_modified: str = ""
+    # Для отчёта прогона
+    status: int = 0           # HTTP-статус последней попытки
+    bytes: int = 0            # размер тела
+    retries: int = 0          # повторов до успеха/отказа
+    fetch_s: float = 0.0      # время загрузки (с ожиданием в очереди async-движка)
+    cache_hit: str = ""       # "not_modified" / "same_body" — матчи взяты из кэша
+    rendered: bool = False    # тело получено браузерным фолбэком
+
+def page_from_response(sport: str, title: str, url: str, r: requests.Response,
+                       cache: Optional[HttpCache] = None) -> Page:
+    """
+    Сверяет ответ с кэшем: на 304 или совпадающий хеш тела возвращает ранее
+    разобранные матчи, и BeautifulSoup для этой страницы не запускается.
+    """
+    key = _cache_key(sport, title)
+    net = {"status": r.status_code, "bytes": len(r.content), "retries": getattr(r, "retries", 0)}
+    if r.status_code == 304:
+        items = cache.not_modified(url, key) if cache else None
+        if items is None:
+            raise Exception(f"304 без записи в кэше: {url}")
+        digest, event_fp = cache.fingerprints(url)
+        return Page(sport, title, url, items=[Match.from_dict(m) for m in items], digest=digest,
+                    event_fp=event_fp, cache_hit="not_modified", **net)
+    etag = r.headers.get("ETag", "")
+    last_modified = r.headers.get("Last-Modified", "")
+    digest = body_hash(r.content)
+    if cache is not None:
+        items = cache.same_body(url, key, digest, etag, last_modified)
+        if items is not None:
+            return Page(sport, title, url, items=[Match.from_dict(m) for m in items], digest=digest,
+                        event_fp=cache.fingerprints(url)[1], cache_hit="same_body", **net)
+    html = r.text
+    return Page(sport, title, url, html=html, digest=digest, event_fp=event_fingerprint(html),
+                etag=etag, last_modified=last_modified, **net)
+
+def _failed_page(sport: str, title: str, url: str, err: Exception, fetch_s: float) -> Page:
+    return Page(sport, title, url, error=str(err), status=getattr(err, "status", 0),
+                retries=getattr(err, "retries", 0), fetch_s=fetch_s)
+
+def _store_parsed(page: Page, items: List[Match], cache: Optional[HttpCache]) -> None:
+    if cache is not None and page.digest:
+        cache.put(page.url, _cache_key(page.sport, page.title), page.digest, [m.to_dict() for m in items],
+                  page.etag, page.last_modified, page.event_fp)
+
+class PageDeduper:
+    """
+    Дубли страниц: Marathon отдаёт одну и ту же страницу по разным URL (три
+    UEFA-URL, WTA/ATP, Евролига/NBA) — такая страница пропускается до разбора.
+    Сравниваются sha1 тела и, если by_event_ids, набор event-id (ловит дубли,
+    у которых отличаются токены/время в разметке). Живёт и дольше прогона
+    (демон): на лигу хранятся только ключи её последней страницы, а совпадение
+    с собственной прошлой версией дублем не считается.
+    """
+
+    def __init__(self, by_event_ids: bool = DEDUPE_EVENT_IDS):
+        self.by_event_ids = by_event_ids
+        self._seen: dict = {}     # ключ → title
+        self._keys: dict = {}     # title → ключи его последней страницы
+
+    def duplicate_of(self, page: Page) -> Optional[str]:
+        """title ранее встреченной такой же страницы или None (тогда страница запоминается)."""
+        keys = []
+        if page.digest:
+            keys.append(("body", page.digest))
+        if self.by_event_ids and page.event_fp:
+            keys.append(("events", page.event_fp))
+        for k in self._keys.pop(page.title, ()):
+            if self._seen.get(k) == page.title:
+                del self._seen[k]
+        for k in keys:
+            if k in self._seen:
+                return self._seen[k]
+        for k in keys:
+            self._seen[k] = page.title
+        self._keys[page.title] = keys
+        return None
+
+class LeagueResult(NamedTuple):
+    """
+    Итог по одной лиге; duplicate_of — title страницы, дублем которой она оказалась.
+    page — страница I/O-стадии (статус, байты, повторы, время загрузки) для отчёта прогона.
+    """
+    title: str
+    items: List[Match]
+    error: Optional[str] = None
+    duplicate_of: Optional[str] = None
+    page: Optional[Page] = None
+    parse_s: float = 0.0
+
+def parse_response(sport: str, title: str, url: str, r: requests.Response,
+                   cache: Optional[HttpCache] = None) -> List[Match]:
+    page = page_from_response(sport, title, url, r, cache)
+    if page.items is not None:
+        return page.items
+    items = parse_page(sport, title, page.html)
+    _store_parsed(page, items, cache)
+    return items
 
-def fetch_and_parse(sport: str, title: str, url: str) -> tuple:
+# ─── Стадия 1: сеть ────────────────────────────────────────────────────────────
+def fetch_page(sport: str, title: str, url: str, cache: Optional[HttpCache] = None) -> Page:
     time.sleep(0.5) # Пауза для защиты от бана
+    t0 = time.perf_counter()
     try:
-        html = http_get(url)
-        if sport == "football":
-            items = parse_football_table(html)
-            # Используем лигу из h2-заголовка (если найдена), иначе — title из URL
-            for it in items:
-                if not it.get("league"):
-                    it["league"] = title
-            return (title, items, None)
-        elif sport == "esports":
-            items = parse_2way_winner(html, "esports")
-            for it in items: it["league"] = title  # исправляем: лига не устанавливалась
-            return (title, items, None)
+        headers = cache.conditional_headers(url, _cache_key(sport, title)) if cache else None
+        r = http_request(url, headers=headers)
+        return page_from_response(sport, title, url, r, cache)._replace(fetch_s=time.perf_counter() - t0)
+    except Exception as e:
+        return _failed_page(sport, title, url, e, time.perf_counter() - t0)
+
+def fetch_pages_threaded(targets: Iterable[tuple], cache: Optional[HttpCache] = None) -> Iterator[Page]:
+    """Старый режим: пул потоков, у каждого своя сессия и пауза перед запросом."""
+    with ThreadPoolExecutor(max_workers=THREAD_WORKERS) as executor:
+        futures = [executor.submit(fetch_page, s, t, u, cache) for s, t, u in targets]
+        for future in as_completed(futures):
+            yield future.result()
+
+async def fetch_pages_async(targets: Iterable[tuple], fetcher: Optional[AsyncFetcher] = None,
+                            cache: Optional[HttpCache] = None,
+                            on_page: Optional[Callable[[Page], None]] = None) -> List[Page]:
+    """
+    Async-режим: все лиги стартуют сразу, темп ограничивают семафор и bucket.
+    on_page вызывается по мере готовности страниц — так разбор начинается, не дожидаясь всех.
+    """
+    own = fetcher is None
+    fetcher = fetcher or AsyncFetcher()
+
+    async def one(sport: str, title: str, url: str) -> Page:
+        t0 = time.perf_counter()
+        try:
+            headers = cache.conditional_headers(url, _cache_key(sport, title)) if cache else None
+            r = await fetcher.request(url, headers=headers)
+            page = page_from_response(sport, title, url, r, cache)._replace(fetch_s=time.perf_counter() - t0)
+        except Exception as e:
+            page = _failed_page(sport, title, url, e, time.perf_counter() - t0)
+        if on_page:
+            on_page(page)
+        return page
+
+    try:
+        tasks = [asyncio.create_task(one(s, t, u)) for s, t, u in targets]
+        return [await f for f in asyncio.as_completed(tasks)]
+    finally:
+        if own:
+            fetcher.close()
+
+def _iter_pages_async(targets: Iterable[tuple], cache: Optional[HttpCache]) -> Iterator[Page]:
+    """Event loop живёт в отдельном потоке и отдаёт страницы через очередь."""
+    q: queue.Queue = queue.Queue()
+    done = object()
+
+    def run() -> None:
+        try:
+            asyncio.run(fetch_pages_async(targets, cache=cache, on_page=q.put))
+        finally:
+            q.put(done)
+
+    threading.Thread(target=run, name="fetch-async", daemon=True).start()
+    while (page := q.get()) is not done:
+        yield page
+
+# Заглушки антибот-проверки: строк нет, но страница не пустая лига
+_CHALLENGE_MARKERS = ("challenge-platform", "cf-chl", "captcha")
+# url → time.monotonic(), до которого страница считается «пустой, но настоящей»
+_empty_pages: dict = {}
+
+def needs_browser(page: Page) -> bool:
+    """
+    403, антибот-заглушка или «скелет» без строк событий — такую страницу
+    дорисовывает браузер. Лига, которую и браузер отрисовал пустой, не
+    уходит в него BROWSER_EMPTY_TTL секунд: иначе Chromium на каждом прогоне.
+    """
+    if page.status == 403:
+        return True
+    if page.html is None or "coupon-row" in page.html:
+        return False
+    if any(marker in page.html for marker in _CHALLENGE_MARKERS):
+        return True
+    return _empty_pages.get(page.url, 0.0) <= time.monotonic()
+
+def _remember_empty(page: Page) -> None:
+    if page.html is not None and "coupon-row" not in page.html:
+        _empty_pages[page.url] = time.monotonic() + BROWSER_EMPTY_TTL
+    else:
+        _empty_pages.pop(page.url, None)
+
+def _rendered_page(page: Page, future) -> Page:
+    try:
+        r = future.result()
+    except Exception as e:
+        return page._replace(html=None, error=page.error or f"браузер: {e}", rendered=True)
+    if r.status >= 400:
+        return page._replace(html=None, error=page.error or f"браузер: HTTP {r.status}", rendered=True)
+    raw = r.html.encode("utf-8")
+    return Page(page.sport, page.title, page.url, html=r.html, digest=body_hash(raw),
+                event_fp=event_fingerprint(r.html), status=r.status, bytes=len(raw),
+                retries=page.retries, fetch_s=page.fetch_s + r.render_s, rendered=True)
+
+def with_browser_fallback(pages: Iterable[Page], browser: BrowserPool) -> Iterator[Page]:
+    """
+    Обычные страницы проходят сразу; 403 и скелеты уходят в пул вкладок браузера
+    параллельно с остальной загрузкой и отдаются по мере отрисовки.
+    """
+    pending: dict = {}
+
+    def rendered(future) -> Page:
+        page = _rendered_page(pending.pop(future), future)
+        _remember_empty(page)
+        return page
+
+    def finished() -> Iterator[Page]:
+        for future in [f for f in pending if f.done()]:
+            yield rendered(future)
+
+    for page in pages:
+        if needs_browser(page):
+            print(f"[BROWSER] {page.title}: {page.error or 'нет coupon-row'} — рендер в браузере")
+            pending[browser.submit(page.url)] = page
         else:
-            items = parse_2way_winner(html, sport)
-            for it in items: it["league"] = title
-            return (title, items, None)
+            yield page
+        yield from finished()
+    for future in as_completed(list(pending)):
+        yield rendered(future)
+
+def iter_pages(targets: Iterable[tuple], engine: str = FETCH_ENGINE,
+               cache: Optional[HttpCache] = None, browser: Optional[BrowserPool] = None) -> Iterator[Page]:
+    if engine == "async":
+        pages = _iter_pages_async(list(targets), cache)
+    else:
+        pages = fetch_pages_threaded(targets, cache)
+    return with_browser_fallback(pages, browser) if browser is not None else pages
+
+def open_browser_pool() -> Optional[BrowserPool]:
+    """Пул браузера, если включён BROWSER_FALLBACK и Chromium запускается; иначе None."""
+    if not BROWSER_FALLBACK:
+        return None
+    try:
+        return BrowserPool().start()
+    except Exception as e:
+        print(f"[WARN] браузерный фолбэк недоступен: {e}")
+        return None
+
+# ─── Стадия 2: разбор ──────────────────────────────────────────────────────────
+def timed_parse(sport: str, title: str, html: str) -> tuple:
+    """(матчи, секунды разбора) — время меряется там, где идёт разбор, в т.ч. в процессе пула."""
+    t0 = time.perf_counter()
+    items = parse_page(sport, title, html)
+    return items, time.perf_counter() - t0
+
+def _page_result(page: Page, parsed: tuple, cache: Optional[HttpCache]) -> LeagueResult:
+    items, parse_s = parsed
+    _store_parsed(page, items, cache)
+    return LeagueResult(page.title, items, page=page._replace(html=None), parse_s=parse_s)
+
+def _ready_result(page: Page, deduper: PageDeduper) -> Optional[LeagueResult]:
+    """Итог без разбора (ошибка, дубль, кэш) или None — страницу нужно разобрать."""
+    if page.error:
+        return LeagueResult(page.title, [], page.error, page=page)
+    dup = deduper.duplicate_of(page)
+    if dup is not None:
+        return LeagueResult(page.title, [], duplicate_of=dup, page=page._replace(html=None))
+    if page.items is not None:
+        return LeagueResult(page.title, page.items, page=page)
+    return None
+
+def fetch_all(targets: Iterable[tuple], engine: str = FETCH_ENGINE,
+              cache: Optional[HttpCache] = None, parse_workers: int = PARSE_WORKERS,
+              deduper: Optional[PageDeduper] = None,
+              browser: Optional[BrowserPool] = None) -> Iterator[LeagueResult]:
+    """
+    Двухстадийный конвейер: I/O-стадия отдаёт тела страниц по мере загрузки,
+    разбор идёт либо здесь же (parse_workers=0), либо в ProcessPoolExecutor —
+    тогда CPU-тяжёлый BeautifulSoup/lxml не делит GIL с сетевыми потоками.
+    Дубли уже загруженных в этом прогоне страниц не разбираются.
+    browser — пул для 403 и страниц-скелетов (см. with_browser_fallback).
+    Отдаёт LeagueResult в порядке готовности.
+    """
+    pages = iter_pages(targets, engine, cache, browser)
+    deduper = deduper or PageDeduper()
+    if parse_workers <= 0:
+        for page in pages:
+            ready = _ready_result(page, deduper)
+            if ready:
+                yield ready
+                continue
+            try:
+                yield _page_result(page, timed_parse(page.sport, page.title, page.html), cache)
+            except Exception as e:
+                yield LeagueResult(page.title, [], str(e), page=page._replace(html=None))
+        return
+
+    def collect(future, page: Page) -> LeagueResult:
+        try:
+            return _page_result(page, future.result(), cache)
+        except Exception as e:
+            return LeagueResult(page.title, [], str(e), page=page._replace(html=None))
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        pending: dict = {}
+        for page in pages:
+            ready = _ready_result(page, deduper)
+            if ready:
+                yield ready
+            else:
+                pending[pool.submit(timed_parse, page.sport, page.title, page.html)] = page
+            for future in [f for f in pending if f.done()]:
+                yield collect(future, pending.pop(future))
+        for future in as_completed(pending):
+            yield collect(future, pending[future])
+
+def select_matches(items: Iterable[Match], today: Optional[_dt.date] = None) -> List[Match]:
+    """Стадия отбора: дедуп по id, белый список футбольных лиг, футбол — ближайшие 14 дней."""
+    uniq = {}
+    for m in items:
+        if m.id and m.id not in uniq:
+            uniq[m.id] = m
+
+    # Фильтр по лигам: для футбола оставляем только разрешённые лиги (без любительских, кубков, 3-4 дивизионов)
+    all_items_filtered = []
+    for m in uniq.values():
+        if m.sport == "football" and m.league not in ALLOWED_FOOTBALL_LEAGUES:
+            continue
+        all_items_filtered.append(m)
+
+    # Фильтр по дате: футбол — только ближайшие 14 дней (убирает целый сезон Серии A и т.д.)
+    # kickoff_ts посчитан при разборе — здесь только сравнение целых
+    cutoff = day_start_ts((today or msk_today()) + _dt.timedelta(days=15))
+    return [m for m in all_items_filtered
+            if m.sport != "football" or m.kickoff_ts is None or m.kickoff_ts < cutoff]
+
+def publish_all(all_items: List[Match]) -> dict:
+    """matches.json + дельта + артефакты, шарды и история линии — каждый файл пишется атомарно."""
+    rows = [m.to_dict() for m in all_items]   # строки коэффициентов — один раз, на границе JSON
+    payload = publish_matches(rows, OUT_JSON, DELTA_JSON, artifacts=JSON_ARTIFACTS)
+    if SHARDS:
+        publish_shards(rows, SHARDS_DIR, SHARD_BY_LEAGUE,
+                       version=payload["version"], last_update=payload["last_update"])
+    if ODDS_HISTORY:
+        appended = OddsHistory(ODDS_HISTORY_DIR).append_run(all_items)
+        print(f"[HIST] записей линии: {appended}")
+    if WRITE_SHEETS and SPREADSHEET_ID and os.path.exists(CREDS_FILE):
+        sync_sheet(rows)
+    return payload
+
+SHEET_HEADERS = ["ID", "Спорт", "Лига", "Дата", "Время", "Команда 1", "Команда 2",
+                 "П1", "X", "П2", "1X", "12", "X2"]
+
+def sync_sheet(rows: List[dict]) -> None:
+    """Новые матчи и сдвинувшиеся коэффициенты — одним batch_update; ушедшие матчи остаются в листе."""
+    try:
+        from google.oauth2.service_account import Credentials
+        import gspread
+
+        creds = Credentials.from_service_account_file(
+            CREDS_FILE, scopes=["https://www.googleapis.com/auth/spreadsheets"])
+        sheet = gspread.authorize(creds).open_by_key(SPREADSHEET_ID)
+        try:
+            ws = sheet.worksheet(SHEET_NAME)
+        except Exception:
+            ws = sheet.add_worksheet(SHEET_NAME, rows=2000, cols=len(SHEET_HEADERS))
+        res = SheetSync(ws, SHEET_HEADERS, SHEETS_STATE).sync(
+            [m["id"], m["sport"], m["league"], m["date"], m["time"], m["team1"], m["team2"],
+             m["p1"], m["x"], m["p2"], m["p1x"], m["p12"], m["px2"]] for m in rows)
+        print(f"[SHEETS] +{res.added} строк, обновлено {res.updated} ({res.cells} ячеек)")
     except Exception as e:
-        return (title, [], str(e))
+        print(f"[WARN] Google Sheets недоступен: {e}")
 
 def main() -> None:
     print("=" * 60)
-    print("PRIZMBET Marathon Parser — SAFE THREADING MODE")
+    print(f"PRIZMBET Marathon Parser — {FETCH_ENGINE.upper()} MODE, PARSE_WORKERS={PARSE_WORKERS}")
     print("=" * 60)
     
-    all_items: List[dict] = []
+    all_items: List[Match] = []
     success_count = 0
     error_count = 0
     
-    # max_workers=3 спасает от блокировок
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        futures = {executor.submit(fetch_and_parse, s, t, u): (s, t, u) for s, t, u in POPULAR_FALLBACK}
-        for future in as_completed(futures):
-            title, items, err = future.result()
-            if err:
+    cache = HttpCache(HTTP_CACHE_FILE) if HTTP_CACHE else None
+    browser = open_browser_pool()
+    report = RunReport("sweep", engine=FETCH_ENGINE, backend=PARSER_BACKEND, parse_workers=PARSE_WORKERS)
+    t0 = time.perf_counter()
+    duplicates = []
+    with report.stage("fetch_parse"):
+        for res in fetch_all(POPULAR_FALLBACK, cache=cache, browser=browser):
+            report.add_league(res)
+            if res.error:
                 error_count += 1
-                print(f"[ERR] Пропущено ({title}): {err}")
+                print(f"[ERR] Пропущено ({res.title}): {res.error}")
+            elif res.duplicate_of:
+                duplicates.append(res)
+                print(f"[DUP] {res.title} — та же страница, что «{res.duplicate_of}», разбор пропущен")
             else:
-                print(f"[OK] {title} - Событий: {len(items)}")
-                all_items.extend(items)
-                if len(items) > 0:
+                print(f"[OK] {res.title} - Событий: {len(res.items)}")
+                all_items.extend(res.items)
+                if len(res.items) > 0:
                     success_count += 1
+    print(f"[TIME] Загрузка и разбор: {time.perf_counter() - t0:.2f} с ({FETCH_ENGINE})")
+    if browser:
+        browser.close()
+        print(f"[BROWSER] отрисовано: {browser.stats['pages']}, ошибок: {browser.stats['errors']}, "
+              f"контекстов пересоздано: {browser.stats['recycled']}")
+    if cache:
+        cache.save()
+        st = cache.stats
+        print(f"[CACHE] 304: {st['not_modified']}, то же тело: {st['same_body']}, разобрано заново: {st['miss']}")
 
-    uniq = {}
-    for m in all_items:
-        m_id = m.get('id', '')
-        if m_id and m_id not in uniq:
-            uniq[m_id] = m
-
-    # Фильтр по лигам: для футбола оставляем только разрешённые лиги (без любительских, кубков, 3-4 дивизионов)
-    all_items_filtered = []
-    for m in uniq.values():
-        if m.get("sport") == "football" and m.get("league") not in ALLOWED_FOOTBALL_LEAGUES:
-            continue
-        all_items_filtered.append(m)
+    with report.stage("filter"):
+        all_items = select_matches(all_items)
+    with report.stage("write"):
+        payload = publish_all(all_items)
+    report.finish(all_items, version=payload["version"], cache=cache.stats if cache else None)
+    report.write(RUN_REPORT)
+    print("[TIME] Отбор: {filter:.3f} с, запись: {write:.3f} с".format(**report.record["stages"]))
 
-    # Фильтр по дате: футбол — только ближайшие 14 дней (убирает целый сезон Серии A и т.д.)
-    today_d = _dt.date.today()
-    cutoff = today_d + _dt.timedelta(days=14)
-    filtered = []
-    for m in all_items_filtered:
-        if m.get("sport") != "football" or not m.get("date"):
-            filtered.append(m)
-            continue
-        d = parse_ru_date(m["date"])
-        if d is None or d <= cutoff:
-            filtered.append(m)
-    all_items = filtered
-
-    payload = {
-        "last_update": _dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "matches": all_items,
-    }
-    with open(OUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-
-    print(f"\n[OK] Всего матчей: {len(all_items)} (Лиг: {success_count})")
+    print(f"\n[OK] Всего матчей: {len(all_items)} (Лиг: {success_count}, дублей страниц: {len(duplicates)})")
+    for res in duplicates:
+        print(f"  [DUP] {res.title} = {res.duplicate_of}")
+    st = norm_cache_stats()
+    print("[NORM] LRU попадания: " + ", ".join(f"{k} {v['hits']}/{v['hits'] + v['misses']}" for k, v in st.items()))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
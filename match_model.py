@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — типизированная модель матча.
+
+Внутри парсера и бота коэффициенты — float (NaN — рынка нет, 0.0 — кнопка
+без цены), а строки вида "1.93" / "—" появляются один раз, в to_dict() при
+записи JSON. Match — dataclass со __slots__: без __dict__ на каждый матч и
+без круговых преобразований строка↔float при каждой ставке.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+ODDS_FIELDS = ("p1", "x", "p2", "p1x", "p12", "px2")
+NAN = float("nan")
+DASH = "—"
+
+# Исход ставки → поле модели; и ключи legacy-формата {"odds": {"1": ...}}
+OUTCOME_FIELDS = {"П1": "p1", "П2": "p2", "X": "x", "1X": "p1x", "X2": "px2", "12": "p12"}
+LEGACY_ODDS_KEYS = {"p1": "1", "p2": "2", "x": "X", "p1x": "1X", "px2": "X2", "p12": "12"}
+
+
+def fmt_odd(v) -> str:
+    """Форматирует коэффициент без научной нотации (:.3g даёт '1e+03' для >1000)."""
+    if not v: return "0.00"
+    s = f"{v:.3g}"
+    if 'e' in s:
+        return str(round(float(v), 2))
+    return s
+
+
+def odd_to_str(v: float) -> str:
+    return DASH if math.isnan(v) else fmt_odd(v)
+
+
+def odd_from_str(s) -> float:
+    """"1,93" → 1.93; "—" / "-" / "" / None → NaN; "0.00" → 0.0."""
+    if s is None:
+        return NAN
+    if isinstance(s, (int, float)):
+        return float(s)
+    s = str(s).replace(",", ".").strip()
+    if not s or s in (DASH, "-"):
+        return NAN
+    try:
+        return float(s)
+    except ValueError:
+        return NAN
+
+
+@dataclass(slots=True)
+class Match:
+    sport: str
+    league: str
+    id: str
+    date: str
+    time: str
+    team1: str
+    team2: str
+    match_url: str = ""
+    p1: float = NAN
+    x: float = NAN
+    p2: float = NAN
+    p1x: float = NAN
+    p12: float = NAN
+    px2: float = NAN
+    kickoff_ts: Optional[int] = None   # начало матча, секунды UTC (None — время не разобрано)
+
+    def to_dict(self) -> dict:
+        """Текущий формат matches.json (порядок ключей тот же, коэффициенты — строки)."""
+        return {
+            "sport": self.sport, "league": self.league, "id": self.id,
+            "date": self.date, "time": self.time, "team1": self.team1, "team2": self.team2,
+            "match_url": self.match_url,
+            "p1": odd_to_str(self.p1), "x": odd_to_str(self.x), "p2": odd_to_str(self.p2),
+            "p1x": odd_to_str(self.p1x), "p12": odd_to_str(self.p12), "px2": odd_to_str(self.px2),
+            "kickoff_ts": self.kickoff_ts,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Match":
+        """Из записи matches.json / кэша; понимает и legacy {"odds": {"1": ..., "X": ...}}."""
+        legacy = d.get("odds") or {}
+        odds = {}
+        for f in ODDS_FIELDS:
+            v = odd_from_str(d.get(f))
+            if math.isnan(v) and legacy:
+                v = odd_from_str(legacy.get(LEGACY_ODDS_KEYS[f]))
+            odds[f] = v
+        return cls(
+            sport=d.get("sport", ""), league=d.get("league", ""), id=str(d.get("id", "")),
+            date=d.get("date", ""), time=d.get("time", ""),
+            team1=d.get("team1", ""), team2=d.get("team2", ""), match_url=d.get("match_url", ""),
+            kickoff_ts=d.get("kickoff_ts"), **odds,
+        )
+
+    def __eq__(self, other) -> bool:
+        # NaN != NaN: «рынка нет» у двух одинаковых матчей должно совпадать
+        if not isinstance(other, Match):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def odds(self) -> tuple:
+        return (self.p1, self.x, self.p2, self.p1x, self.p12, self.px2)
+
+    def odd(self, outcome: str) -> float:
+        """Коэффициент исхода ("П1", "X", "1X", ...) или 0.0, если рынка нет."""
+        field = OUTCOME_FIELDS.get(outcome)
+        v = getattr(self, field) if field else NAN
+        return 0.0 if math.isnan(v) else v
+
+
+def coerce(m) -> Optional[Match]:
+    """Match или dict → Match (None остаётся None)."""
+    if m is None or isinstance(m, Match):
+        return m
+    return Match.from_dict(m)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — история коэффициентов (движение линии) по event id.
+
+Хранилище только на дозапись: записи фиксированной ширины в помесячных
+файлах odds_history/YYYY-MM.bin (UTC), плюс индекс событий events.json
+(вид спорта, лига, команды, последние коэффициенты). Запись добавляется,
+только если коэффициенты события изменились с прошлого прогона, поэтому
+месяц прогонов раз в 15 минут — единицы мегабайт. Из индекса уходят
+события, линия которых не менялась INDEX_KEEP_DAYS (матч сыгран): он не
+растёт с каждым сезоном, а их записи остаются в партициях.
+
+Запись (32 байта, little-endian):
+    ts uint32 | event_id uint32 | p1 x p2 p1x p12 px2 — float32, NaN = нет рынка
+
+Запросы возвращают колонки (array): {"ts": array('I'), "p1": array('f'), ...}.
+
+    python odds_history.py 26994532            # линия события
+    python odds_history.py --league "КХЛ" --hours 24
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import json
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from match_model import ODDS_FIELDS, Match, coerce
+
+RECORD = struct.Struct("<II6f")
+_F32 = struct.Struct("<f")
+INDEX_FILE = "events.json"
+HISTORY_DIR = "odds_history"
+INDEX_KEEP_DAYS = 14
+
+_NAN = float("nan")
+
+
+def odds_vector(m) -> Tuple[float, ...]:
+    """Коэффициенты матча (Match или dict из matches.json) в порядке ODDS_FIELDS; нет рынка → NaN."""
+    return coerce(m).odds()
+
+
+def _f32(v: float) -> float:
+    """Округление до float32 — так значение хранится на диске."""
+    return _F32.unpack(_F32.pack(v))[0]
+
+
+def _same(a: Iterable[float], b: Iterable[float]) -> bool:
+    return all((math.isnan(x) and math.isnan(y)) or x == y for x, y in zip(a, b))
+
+
+def _month(ts: int) -> str:
+    return _dt.datetime.fromtimestamp(ts, _dt.timezone.utc).strftime("%Y-%m")
+
+
+def _months(since: int, until: int) -> List[str]:
+    """Все партиции YYYY-MM, пересекающие окно [since, until]."""
+    d = _dt.datetime.fromtimestamp(since, _dt.timezone.utc).replace(day=1)
+    last = _month(until)
+    out = []
+    while True:
+        key = d.strftime("%Y-%m")
+        out.append(key)
+        if key >= last:
+            return out
+        d = (d + _dt.timedelta(days=32)).replace(day=1)
+
+
+class OddsHistory:
+    """Помесячные бинарные партиции + индекс событий. Один писатель, сколько угодно читателей."""
+
+    def __init__(self, root: str = HISTORY_DIR, keep_days: float = INDEX_KEEP_DAYS):
+        self.root = root
+        self.keep_sec = int(keep_days * 86400)
+        self._lock = threading.Lock()
+        self.index: Dict[str, dict] = self._load_index()
+
+    def _load_index(self) -> dict:
+        try:
+            with open(os.path.join(self.root, INDEX_FILE), encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def _part(self, month: str) -> str:
+        return os.path.join(self.root, f"{month}.bin")
+
+    # ─── Запись ────────────────────────────────────────────────────────────────
+    def append_run(self, matches: Iterable[Match], ts: Optional[int] = None) -> int:
+        """
+        Дописывает коэффициенты прогона. Событие пишется, если оно новое или
+        хотя бы один коэффициент изменился. Возвращает число записей.
+        """
+        ts = int(ts if ts is not None else time.time())
+        buf = bytearray()
+        with self._lock:
+            for m in map(coerce, matches):
+                m_id = m.id
+                if not m_id.isdigit() or int(m_id) > 0xFFFFFFFF:
+                    continue
+                vec = tuple(_f32(v) for v in odds_vector(m))
+                meta = self.index.get(m_id)
+                last = meta and tuple(_NAN if v is None else v for v in meta["last"])
+                if last and _same(last, vec):
+                    continue
+                buf += RECORD.pack(ts, int(m_id), *vec)
+                self.index[m_id] = {
+                    "sport": m.sport, "league": m.league,
+                    "team1": m.team1, "team2": m.team2,
+                    "first_ts": (meta or {}).get("first_ts", ts), "last_ts": ts,
+                    "last": [None if math.isnan(v) else v for v in vec],
+                }
+            pruned = self._prune(ts)
+            if buf:
+                os.makedirs(self.root, exist_ok=True)
+                with open(self._part(_month(ts)), "ab") as f:
+                    f.write(buf)
+            if buf or pruned:
+                self._save_index()
+        return len(buf) // RECORD.size
+
+    def _prune(self, now: int) -> int:
+        """Убирает из индекса события, чья линия не менялась keep_sec. Возвращает их число."""
+        stale = [e for e, meta in self.index.items() if meta.get("last_ts", 0) < now - self.keep_sec]
+        for e in stale:
+            del self.index[e]
+        return len(stale)
+
+    def _save_index(self) -> None:
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    # ─── Чтение ────────────────────────────────────────────────────────────────
+    def _scan(self, ids: set, since: int, until: int) -> Iterator[tuple]:
+        for month in _months(since, until):
+            try:
+                with open(self._part(month), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            usable = len(data) - len(data) % RECORD.size   # недописанный хвост после сбоя
+            for rec in RECORD.iter_unpack(memoryview(data)[:usable]):
+                if since <= rec[0] <= until and rec[1] in ids:
+                    yield rec
+
+    @staticmethod
+    def _empty_line() -> Dict[str, array]:
+        line = {"ts": array("I")}
+        line.update({k: array("f") for k in ODDS_FIELDS})
+        return line
+
+    def lines(self, event_ids: Iterable, since: Optional[int] = None,
+              until: Optional[int] = None) -> Dict[str, Dict[str, array]]:
+        """{event_id: колонки} для набора событий в окне [since, until] (по умолчанию — вся история)."""
+        ids = {int(e) for e in event_ids if str(e).isdigit()}
+        if not ids:
+            return {}
+        if since is None:
+            firsts = [self.index.get(str(e), {}).get("first_ts") for e in ids]
+            since = min((t for t in firsts if t), default=int(time.time()))
+        until = int(until if until is not None else time.time())
+        out: Dict[str, Dict[str, array]] = {}
+        for rec in self._scan(ids, int(since), until):
+            line = out.get(str(rec[1]))
+            if line is None:
+                line = out[str(rec[1])] = self._empty_line()
+            line["ts"].append(rec[0])
+            for k, v in zip(ODDS_FIELDS, rec[2:]):
+                line[k].append(v)
+        return out
+
+    def event_line(self, event_id, since: Optional[int] = None,
+                   until: Optional[int] = None) -> Dict[str, array]:
+        """Движение линии одного события; пустые колонки, если записей нет."""
+        return self.lines([event_id], since, until).get(str(event_id)) or self._empty_line()
+
+    def league_lines(self, league: str, since: Optional[int] = None,
+                     until: Optional[int] = None) -> Dict[str, Dict[str, array]]:
+        """Линии всех событий лиги (по индексу), записанные в окне."""
+        ids = [e for e, meta in self.index.items() if meta.get("league") == league]
+        return self.lines(ids, since, until)
+
+
+def _fmt(v: float) -> str:
+    return "—" if math.isnan(v) else f"{v:.2f}"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="История коэффициентов PRIZMBET")
+    ap.add_argument("event_id", nargs="?")
+    ap.add_argument("--league")
+    ap.add_argument("--hours", type=float, default=24 * 7)
+    ap.add_argument("--dir", default=HISTORY_DIR)
+    args = ap.parse_args()
+
+    hist = OddsHistory(args.dir)
+    since = int(time.time() - args.hours * 3600)
+    if args.league:
+        lines = hist.league_lines(args.league, since)
+    elif args.event_id:
+        lines = {args.event_id: hist.event_line(args.event_id, since)}
+    else:
+        ap.error("нужен event_id или --league")
+
+    for e_id, line in lines.items():
+        meta = hist.index.get(e_id, {})
+        print(f"{e_id} {meta.get('team1', '')} — {meta.get('team2', '')} ({meta.get('league', '')})")
+        for i, ts in enumerate(line["ts"]):
+            when = _dt.datetime.fromtimestamp(ts).strftime("%d.%m %H:%M")
+            print(f"  {when}  " + "  ".join(f"{k}={_fmt(line[k][i])}" for k in ODDS_FIELDS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — демон парсера Marathon с адаптивной частотой обновления лиг.
+
+Вместо полного прохода дважды в сутки каждая лига обновляется по своему
+расписанию: чем ближе ближайший матч лиги, тем чаще (REFRESH_TIERS).
+Все запросы идут из общего бюджета (TokenBucket на DAEMON_BUDGET_PER_HOUR
+запросов в час); лиги, которым не хватило токенов, ждут следующего цикла.
+После каждого цикла с обновлёнными лигами выходы публикуются атомарно
+(marathon_parser_real.publish_all) и, если задан DAEMON_PUBLISH_CMD,
+выполняется команда публикации (например, git commit + push).
+
+    python parser_daemon.py                  # бесконечно
+    python parser_daemon.py --max-runtime 3600
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import os
+import subprocess
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import marathon_parser_real as mp
+from http_cache import HttpCache
+from match_model import Match, coerce
+from run_report import RunReport
+from text_norm import kickoff_ts, msk_today
+
+# (часов до ближайшего матча лиги, интервал обновления в секундах) — первый подходящий
+REFRESH_TIERS = (
+    (3, 5 * 60),
+    (24, 15 * 60),
+    (72, 60 * 60),
+)
+IDLE_INTERVAL = 3 * 3600       # матчи дальше 72 ч или их нет
+ERROR_INTERVAL = 10 * 60       # лига упала — повторить не сразу
+DUPLICATE_INTERVAL = 6 * 3600  # страница оказалась дублем другой лиги
+
+DAEMON_BUDGET_PER_HOUR = float(os.getenv("DAEMON_BUDGET_PER_HOUR", "120"))
+DAEMON_PUBLISH_CMD = os.getenv("DAEMON_PUBLISH_CMD", "")
+MAX_SLEEP = 60                 # просыпаемся не реже раза в минуту
+
+
+def kickoff(m: Match, now: _dt.datetime) -> Optional[int]:
+    """Начало матча в секундах UTC: kickoff_ts из парсера, для старых записей — из date/time."""
+    m = coerce(m)
+    if m.kickoff_ts is not None:
+        return m.kickoff_ts
+    return kickoff_ts(m.date, m.time, msk_today(now))
+
+
+def refresh_interval(items: Iterable[Match], now: Optional[_dt.datetime] = None) -> int:
+    """Интервал обновления лиги по ближайшему ещё не начавшемуся матчу."""
+    now = now or _dt.datetime.now(_dt.timezone.utc)
+    now_ts = now.timestamp()
+    hours = [(k - now_ts) / 3600 for k in (kickoff(m, now) for m in items) if k is not None]
+    upcoming = [h for h in hours if h >= -2]   # идущие матчи тоже считаем «скоро»
+    if not upcoming:
+        return IDLE_INTERVAL
+    nearest = min(upcoming)
+    for limit, interval in REFRESH_TIERS:
+        if nearest <= limit:
+            return interval
+    return IDLE_INTERVAL
+
+
+class LeagueState(NamedTuple):
+    target: tuple              # (sport, title, url)
+    items: List[Match] = []
+    next_due: float = 0.0      # time.time(), когда лигу пора обновить
+    interval: int = 0
+
+
+class AdaptiveScheduler:
+    """Расписание лиг + общий бюджет запросов."""
+
+    def __init__(self, targets: Iterable[tuple], budget_per_hour: float = DAEMON_BUDGET_PER_HOUR,
+                 clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.leagues: Dict[str, LeagueState] = {t[1]: LeagueState(t) for t in targets}
+        # Всплеск = все лиги: первый цикл обходит всё сразу
+        self.budget = mp.TokenBucket(budget_per_hour / 3600, burst=len(self.leagues))
+
+    def due(self) -> List[tuple]:
+        """Лиги, которым пора обновиться и хватило бюджета, — самые просроченные первыми."""
+        now = self.clock()
+        ready = sorted((s for s in self.leagues.values() if s.next_due <= now), key=lambda s: s.next_due)
+        out = []
+        for state in ready:
+            if not self.budget.try_acquire():
+                break
+            out.append(state.target)
+        return out
+
+    def update(self, res: "mp.LeagueResult") -> int:
+        """Учесть результат лиги, вернуть её новый интервал."""
+        state = self.leagues[res.title]
+        if res.error:
+            interval, items = ERROR_INTERVAL, state.items   # держим прошлые матчи
+        elif res.duplicate_of:
+            interval, items = DUPLICATE_INTERVAL, []
+        else:
+            interval, items = refresh_interval(res.items), res.items
+        self.leagues[res.title] = state._replace(items=items, interval=interval,
+                                                 next_due=self.clock() + interval)
+        return interval
+
+    def matches(self) -> List[Match]:
+        """Текущие матчи всех лиг в порядке списка целей."""
+        return [m for s in self.leagues.values() for m in s.items]
+
+    def sleep_for(self) -> float:
+        now = self.clock()
+        nearest = min((s.next_due for s in self.leagues.values()), default=now + MAX_SLEEP)
+        wait = max(nearest - now, self.budget.wait_time())
+        return min(max(wait, 1.0), MAX_SLEEP)
+
+
+def run_cycle(sched: AdaptiveScheduler, cache: Optional[HttpCache], browser=None,
+              deduper: Optional[mp.PageDeduper] = None) -> int:
+    """Один цикл: обновить просроченные лиги и опубликовать. Возвращает число обновлённых лиг."""
+    targets = sched.due()
+    if not targets:
+        return 0
+    report = RunReport("daemon", engine=mp.FETCH_ENGINE, backend=mp.PARSER_BACKEND, leagues_due=len(targets))
+    with report.stage("fetch_parse"):
+        for res in mp.fetch_all(targets, cache=cache, deduper=deduper or mp.PageDeduper(),
+                                browser=browser):
+            report.add_league(res)
+            interval = sched.update(res)
+            status = res.error or (f"дубль «{res.duplicate_of}»" if res.duplicate_of else f"{len(res.items)} событий")
+            print(f"[DAEMON] {res.title}: {status}, следующее обновление через {interval // 60} мин")
+    if cache:
+        cache.save()
+    with report.stage("filter"):
+        selected = mp.select_matches(sched.matches())
+    with report.stage("write"):
+        payload = mp.publish_all(selected)
+    report.finish(selected, version=payload["version"])
+    report.write(mp.RUN_REPORT)
+    print(f"[DAEMON] опубликовано v{payload['version']}: {len(payload['matches'])} матчей")
+    if DAEMON_PUBLISH_CMD:
+        subprocess.run(DAEMON_PUBLISH_CMD, shell=True, check=False)
+    return len(targets)
+
+
+def run_daemon(max_runtime: float = 0) -> None:
+    sched = AdaptiveScheduler(mp.POPULAR_FALLBACK)
+    cache = HttpCache(mp.HTTP_CACHE_FILE) if mp.HTTP_CACHE else None
+    browser = mp.open_browser_pool()   # один браузер на всё время работы — контексты остаются тёплыми
+    deduper = mp.PageDeduper()         # и один дедупликатор: дубль, пойманный раз, не разбирается снова
+    print(f"[DAEMON] лиг: {len(sched.leagues)}, бюджет {DAEMON_BUDGET_PER_HOUR:g} запросов/ч")
+    deadline = time.time() + max_runtime if max_runtime else float("inf")
+    try:
+        while time.time() < deadline:
+            try:
+                run_cycle(sched, cache, browser, deduper)
+            except Exception as e:   # демон не должен падать из-за одного цикла
+                print(f"[DAEMON] ошибка цикла: {e}")
+            time.sleep(max(0.0, min(sched.sleep_for(), deadline - time.time())))
+    finally:
+        if browser:
+            browser.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Демон парсера Marathon с адаптивным расписанием")
+    ap.add_argument("--max-runtime", type=float, default=0, help="остановиться через N секунд (0 — никогда)")
+    args = ap.parse_args()
+    try:
+        run_daemon(args.max_runtime)
+    except KeyboardInterrupt:
+        print("\n[DAEMON] остановлен")
+
+
+if __name__ == "__main__":
+    main()
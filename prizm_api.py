@@ -1,11 +1,42 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""PRIZM Blockchain API — чтение транзакций кошелька"""
-
+"""
+PRIZM Blockchain API — чтение транзакций кошелька.
+
+Все запросы к нодам идут через одну requests.Session (keep-alive пул: без
+нового TCP+TLS на каждый вызов). PrizmClient — async-вариант для бота:
+сетевой вызов уходит в asyncio.to_thread, как в AsyncFetcher парсера, и
+event loop не стоит, пока нода думает. Модульные функции — синхронный
+фасад поверх того же пула (bet_parser.py).
+
+Порядок нод — по здоровью (NodeHealth): скользящая задержка и недавние
+ошибки. Запрос хеджируется: если лучшая нода не ответила за свой p95,
+параллельно уходит запрос на следующую, побеждает первый годный ответ.
+errorCode, HTTP-ошибка или отставшая высота блокчейна понижают ноду.
+
+Новые транзакции читаются по курсору (TxCursor): страницы getBlockchainTransactions
+листаются назад, пока не встретится последняя обработанная транзакция. Выдача
+двухфазная — pull_new_transactions(cursor) ничего не сдвигает, cursor.commit(txs)
+пишется потребителем после обработки: сбой посередине не теряет транзакций.
+
+BlockWatcher опрашивает только высоту блокчейна (getBlockchainStatus — ответ в
+сотню байт) и говорит «пора читать транзакции», когда пришёл новый блок: опрос
+можно делать раз в несколько секунд, а список транзакций грузится раз в блок.
+"""
+
+import asyncio
 import json
+import threading
 import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
 import requests
 
+from match_model import Match
+from publish import write_json
+
 # Подтверждённые рабочие ноды (core.prizm.vip — основная, проверено 2026-02-28)
 PRIZM_NODES = [
     "https://core.prizm.vip",
@@ -14,57 +45,442 @@ PRIZM_NODES = [
 WALLET = "PRIZM-4N7T-L2A7-RQZA-5BETW"
 CACHE_FILE = "prizm_last_tx.json"
 NQT = 100  # 1 PRIZM = 100 NQT (2 decimal places)
+TIMEOUT = 12
+TX_PAGE = 100        # транзакций на страницу getBlockchainTransactions
+SEEN_KEEP = 500      # id последних выданных транзакций в курсоре (одна секунда — много транзакций)
+REORG_BLOCKS = 10    # глубже блока курсора на столько блоков не листаем, даже если курсор не найден
+RESCAN_SEC = 60      # без нового блока (или без ответа о высоте) транзакции всё равно читаются так часто
+POOL_SIZE = 4        # соединений на ноду = одновременных запросов бота
+
+# Хеджирование: второй запрос уходит через p95 задержки текущей ноды, в этих пределах
+HEDGE_MIN = 0.3
+HEDGE_MAX = 3.0
+HEDGE_DEFAULT = 1.0      # пока у ноды нет замеров
+LATENCY_WINDOW = 50      # последних удачных ответов на ноду для p95
+DEMOTE_SEC = 60          # нода с ошибкой уходит в конец очереди на столько секунд
+STALE_BLOCKS = 3         # отставание по высоте, после которого ответ ноды не принимается
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class NodeHealth:
+    """Скользящие задержки, ошибки и высота блокчейна по нодам. Потокобезопасно."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._lat: Dict[str, deque] = {}
+        self._demoted_until: Dict[str, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._last_error: Dict[str, str] = {}
+        self.best_height = 0
+
+    def success(self, node: str, latency: float, height: int = 0) -> None:
+        with self._lock:
+            self._lat.setdefault(node, deque(maxlen=LATENCY_WINDOW)).append(latency)
+            self._demoted_until.pop(node, None)
+            self.best_height = max(self.best_height, height)
+
+    def failure(self, node: str, reason: str) -> None:
+        with self._lock:
+            self._demoted_until[node] = self.clock() + DEMOTE_SEC
+            self._errors[node] = self._errors.get(node, 0) + 1
+            self._last_error[node] = reason
+
+    def is_stale(self, height: int) -> bool:
+        return bool(height) and height < self.best_height - STALE_BLOCKS
+
+    def _median(self, node: str) -> float:
+        lat = sorted(self._lat.get(node) or ())
+        return lat[len(lat) // 2] if lat else HEDGE_DEFAULT
+
+    def p95(self, node: str) -> Optional[float]:
+        with self._lock:
+            lat = sorted(self._lat.get(node) or ())
+        return lat[min(len(lat) - 1, int(len(lat) * 0.95))] if lat else None
+
+    def hedge_delay(self, node: str) -> float:
+        p95 = self.p95(node)
+        return HEDGE_DEFAULT if p95 is None else min(HEDGE_MAX, max(HEDGE_MIN, p95))
+
+    def ranked(self, nodes: List[str]) -> List[str]:
+        """Здоровые — по медиане задержки (без замеров — в исходном порядке), пониженные — в конце."""
+        now = self.clock()
+        with self._lock:
+            def key(item):
+                i, node = item
+                demoted = self._demoted_until.get(node, 0) > now
+                return (demoted, self._demoted_until.get(node, 0) if demoted else self._median(node), i)
+            return [n for _, n in sorted(enumerate(nodes), key=key)]
+
+    def snapshot(self) -> dict:
+        now = self.clock()
+        return {node: {"p95": self.p95(node), "errors": self._errors.get(node, 0),
+                       "demoted": self._demoted_until.get(node, 0) > now,
+                       "last_error": self._last_error.get(node, "")}
+                for node in set(self._lat) | set(self._errors)}
+
+
+HEALTH = NodeHealth()
+
+
+def _new_session(pool_size: int = POOL_SIZE) -> requests.Session:
+    s = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=len(PRIZM_NODES), pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def get_session() -> requests.Session:
+    """Общая сессия процесса; пул urllib3 потокобезопасен, to_thread-вызовы делят его."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _new_session()
+        return _session
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _session_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=len(PRIZM_NODES) * POOL_SIZE,
+                                           thread_name_prefix="prizm-node")
+        return _executor
+
+
+def _height(data: dict) -> int:
+    """Высота блокчейна у ноды, если ответ её выдаёт (статус сети или height+confirmations транзакции)."""
+    if "numberOfBlocks" in data:
+        return int(data["numberOfBlocks"])
+    for tx in data.get("transactions") or ():
+        if "height" in tx and "confirmations" in tx:
+            return int(tx["height"]) + int(tx["confirmations"])
+    return 0
+
+
+def _request(session: requests.Session, node: str, params: dict, timeout) -> Optional[dict]:
+    """Один запрос к одной ноде; исход пишется в HEALTH. None — ответ не годится."""
+    t0 = time.monotonic()
+    try:
+        r = session.get(f"{node}/prizm", params=params, timeout=timeout, verify=True)
+        if not r.ok:
+            HEALTH.failure(node, f"HTTP {r.status_code}")
+            return None
+        data = r.json()
+    except Exception as e:
+        HEALTH.failure(node, type(e).__name__)
+        return None
+    if "errorCode" in data:
+        HEALTH.failure(node, f"errorCode {data.get('errorCode')}")
+        return None
+    height = _height(data)
+    if HEALTH.is_stale(height):
+        HEALTH.failure(node, f"высота {height} < {HEALTH.best_height}")
+        return None
+    HEALTH.success(node, time.monotonic() - t0, height)
+    return data
 
 
-def _get(params: dict, timeout=12) -> dict | None:
-    for node in PRIZM_NODES:
-        try:
-            r = requests.get(f"{node}/prizm", params=params, timeout=timeout, verify=True)
-            if r.ok:
-                data = r.json()
-                if "errorCode" not in data:
-                    return data
-        except Exception:
-            continue
-    return None
-
-
-def get_transactions(first_index=0, last_index=99) -> list[dict]:
-    """Получить список транзакций на кошелёк PRIZM"""
-    data = _get({
+def _call(params: dict, timeout=TIMEOUT, session: Optional[requests.Session] = None) -> tuple:
+    """
+    (ответ, нода) первого годного ответа; (None, None) — все ноды отказали.
+    Ноды идут в порядке HEALTH.ranked; следующая подключается, когда текущая
+    молчит дольше своего p95 или уже ответила негодным.
+    """
+    session = session or get_session()
+    nodes = HEALTH.ranked(PRIZM_NODES)
+    started: List[str] = []
+    pending: dict = {}   # future → нода
+
+    def launch() -> None:
+        node = nodes[len(started)]
+        started.append(node)
+        pending[_pool().submit(_request, session, node, params, timeout)] = node
+
+    launch()
+    deadline = time.monotonic() + timeout + 1
+    while pending:
+        more = len(started) < len(nodes)
+        wait_for = HEALTH.hedge_delay(started[-1]) if more else max(0.0, deadline - time.monotonic())
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            node = pending.pop(future)
+            data = future.result()
+            if data is not None:
+                return data, node   # опоздавшие запросы доработают в фоне и обновят HEALTH
+        if more and (not done or not pending):
+            launch()   # хедж по таймеру или все запущенные уже отказали
+        elif not done:
+            break      # общий дедлайн
+    return None, None
+
+
+def _get(params: dict, timeout=TIMEOUT) -> dict | None:
+    return _call(params, timeout)[0]
+
+
+def _tx_params(first_index: int, last_index: int) -> dict:
+    return {
         "requestType": "getBlockchainTransactions",
         "account": WALLET,
         "type": 0,
         "firstIndex": first_index,
         "lastIndex": last_index,
-    })
+    }
+
+
+def _account_params() -> dict:
+    return {"requestType": "getAccount", "account": WALLET}
+
+
+def _status_params() -> dict:
+    return {"requestType": "getBlockchainStatus"}
+
+
+def _chain_height(data: dict | None) -> Optional[int]:
+    return (_height(data) or None) if data else None
+
+
+def _balance(data: dict | None, node: str | None) -> dict:
+    if not data:
+        return {"balance": None, "unconfirmed": None, "wallet": WALLET, "node": None}
+    return {
+        "balance":     int(data.get("balanceNQT", 0)) / NQT,
+        "unconfirmed": int(data.get("unconfirmedBalanceNQT", 0)) / NQT,
+        "wallet":      WALLET,
+        "node":        node,
+    }
+
+
+class TxCursor:
+    """
+    Курсор синхронизации в CACHE_FILE: последняя обработанная транзакция
+    (last_id, last_ts), высота её блока (last_height) и id недавно выданных —
+    для транзакций того же блока, который разные ноды отдают в разном порядке.
+    Листание ограничивается высотой: timestamp транзакции — время создания у
+    отправителя, и поздно подтверждённая транзакция лежит в новом блоке со старым временем.
+    Старый формат {"last_ts": ...} читается: всё не новее last_ts считается обработанным.
+    """
+
+    def __init__(self, path: Optional[str] = CACHE_FILE):
+        self.path = path
+        self.last_id = ""
+        self.last_ts = 0
+        self.last_height = 0
+        self.seen: List[str] = []
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                st = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        self.last_id = str(st.get("last_id", ""))
+        self.last_ts = int(st.get("last_ts", 0))
+        self.last_height = int(st.get("last_height", 0))
+        self.seen = [str(t) for t in st.get("seen", [])]
+
+    @property
+    def empty(self) -> bool:
+        return not self.last_id and not self.last_ts
+
+    def commit(self, txs: List[dict]) -> None:
+        """Отметить выданные pull_new_transactions транзакции обработанными (старые → новые)."""
+        if not txs:
+            return
+        newest = txs[-1]
+        self.last_id = str(newest.get("transaction", ""))
+        self.last_ts = max(self.last_ts, max(int(t.get("timestamp", 0)) for t in txs))
+        self.last_height = max([self.last_height] + [int(t["height"]) for t in txs if t.get("height") is not None])
+        self.seen = (self.seen + [str(t.get("transaction", "")) for t in txs])[-SEEN_KEEP:]
+        if self.path:
+            write_json(self.path, {"last_id": self.last_id, "last_ts": self.last_ts,
+                                   "last_height": self.last_height, "seen": self.seen,
+                                   "checked": int(time.time())}, compact=True)
+
+
+def _collect_new(fetch_page, cursor: TxCursor, page_size: int = TX_PAGE) -> List[dict]:
+    """
+    Листать страницы (новые → старые) до курсора; вернуть новые транзакции старые → новые.
+    fetch_page(first, last) → список или None (ноды недоступны): тогда пусто,
+    а не половина — иначе коммит курсора перепрыгнул бы непрочитанные страницы.
+    Пустой курсор — первый запуск: только первая страница, как раньше.
+
+    Граница — блок курсора: после last_id листаем только его блок (порядок внутри
+    блока у нод разный), а без last_id — не глубже REORG_BLOCKS (блок курсора
+    откатился). По времени останавливаемся только у транзакций без высоты и
+    только после last_id, либо по старому формату курсора.
+    """
+    seen = set(cursor.seen)
+    legacy = cursor.last_ts and not cursor.last_id
+    found = False
+    new: List[dict] = []
+    first = 0
+    while True:
+        page = fetch_page(first, first + page_size - 1)
+        if page is None:
+            return []
+        for tx in page:
+            tx_id = str(tx.get("transaction", ""))
+            ts = int(tx.get("timestamp", 0))
+            height = tx.get("height")
+            if height is not None and cursor.last_height:
+                if int(height) < cursor.last_height - (0 if found else REORG_BLOCKS):
+                    return new[::-1]
+            elif (found or legacy) and ts < cursor.last_ts:
+                return new[::-1]
+            if legacy and ts == cursor.last_ts:
+                continue
+            if tx_id == cursor.last_id:
+                found = True   # дальше — только тот же блок: порядок в нём у нод может отличаться
+                continue
+            if tx_id in seen:
+                continue
+            seen.add(tx_id)    # сдвиг страниц из-за новых транзакций даёт повторы
+            new.append(tx)
+        if len(page) < page_size or cursor.empty:
+            return new[::-1]
+        first += page_size
+
+
+def _tx_page(session: Optional[requests.Session], timeout=TIMEOUT):
+    def fetch(first: int, last: int) -> Optional[list]:
+        data = _call(_tx_params(first, last), timeout, session)[0]
+        return None if data is None else data.get("transactions", [])
+    return fetch
+
+
+_default_cursor: Optional[TxCursor] = None
+
+
+def default_cursor() -> TxCursor:
+    global _default_cursor
+    if _default_cursor is None or _default_cursor.path != CACHE_FILE:
+        _default_cursor = TxCursor(CACHE_FILE)
+    return _default_cursor
+
+
+# ===== Синхронный фасад =====
+
+def get_transactions(first_index=0, last_index=99) -> list[dict]:
+    """Получить список транзакций на кошелёк PRIZM"""
+    data = _get(_tx_params(first_index, last_index))
     if not data:
         return []
     return data.get("transactions", [])
 
 
+def pull_new_transactions(cursor: Optional[TxCursor] = None) -> list[dict]:
+    """Новые транзакции после курсора (старые → новые); курсор не сдвигается до cursor.commit."""
+    return _collect_new(_tx_page(None), cursor or default_cursor())
+
+
 def get_new_transactions() -> list[dict]:
-    """Вернуть только новые транзакции (после последней проверки)"""
-    last_ts = 0
-    try:
-        with open(CACHE_FILE) as f:
-            last_ts = json.load(f).get("last_ts", 0)
-    except Exception:
-        pass
+    """Вернуть только новые транзакции (после последней проверки); курсор сдвигается сразу"""
+    cursor = default_cursor()
+    txs = pull_new_transactions(cursor)
+    cursor.commit(txs)
+    return txs
 
-    txs = get_transactions()
-    # Возвращаем все транзакции, чтобы телеграм бот мог обрабатывать выплаты (исходящие)
-    new_txs = [t for t in txs if t.get("timestamp", 0) > last_ts]
 
-    if new_txs:
-        new_last = max(t.get("timestamp", 0) for t in new_txs)
-        try:
-            with open(CACHE_FILE, "w") as f:
-                json.dump({"last_ts": new_last, "checked": int(time.time())}, f)
-        except Exception:
-            pass
+def get_account() -> dict | None:
+    """Сырой ответ getAccount или None, если все ноды недоступны"""
+    return _get(_account_params())
+
+
+def get_balance() -> dict:
+    """
+    Получить баланс кошелька PRIZM.
+    Возвращает: {"balance": float, "unconfirmed": float, "wallet": str, "node": str}
+    """
+    return _balance(*_call(_account_params()))
+
+
+def get_height() -> Optional[int]:
+    """Высота блокчейна (numberOfBlocks) или None, если все ноды недоступны"""
+    return _chain_height(_get(_status_params()))
+
+
+# ===== Async-клиент =====
+
+class PrizmClient:
+    """
+    Awaitable-запросы к нодам поверх общего keep-alive пула. Семафор держит
+    число одновременных запросов в размере пула — лишние ждут соединения
+    в event loop, а не в потоке.
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None, timeout: float = TIMEOUT,
+                 max_concurrency: int = POOL_SIZE):
+        self.session = session
+        self.timeout = timeout
+        self._sem = asyncio.Semaphore(max(1, max_concurrency))
 
-    return new_txs
+    async def call(self, params: dict) -> tuple:
+        async with self._sem:
+            return await asyncio.to_thread(_call, params, self.timeout, self.session)
+
+    async def get_transactions(self, first_index=0, last_index=99) -> list[dict]:
+        data, _ = await self.call(_tx_params(first_index, last_index))
+        return data.get("transactions", []) if data else []
+
+    async def pull_new_transactions(self, cursor: Optional[TxCursor] = None) -> list[dict]:
+        """Листание до курсора целиком в одном потоке: страницы идут подряд, слот семафора — один."""
+        async with self._sem:
+            return await asyncio.to_thread(_collect_new, _tx_page(self.session, self.timeout),
+                                           cursor or default_cursor())
+
+    async def get_new_transactions(self) -> list[dict]:
+        cursor = default_cursor()
+        txs = await self.pull_new_transactions(cursor)
+        cursor.commit(txs)
+        return txs
+
+    async def get_account(self) -> dict | None:
+        return (await self.call(_account_params()))[0]
+
+    async def get_balance(self) -> dict:
+        return _balance(*(await self.call(_account_params())))
+
+    async def get_height(self) -> Optional[int]:
+        return _chain_height((await self.call(_status_params()))[0])
+
+
+class BlockWatcher:
+    """
+    due() — читать ли транзакции сейчас: высота выросла с прошлого раза или
+    rescan_sec прошло без чтения (нода молчит о высоте — не хуже прежнего опроса
+    по таймеру). Меньшая высота от отставшей ноды ничего не сдвигает.
+    """
+
+    def __init__(self, client: PrizmClient, rescan_sec: float = RESCAN_SEC, clock=time.monotonic):
+        self.client = client
+        self.rescan_sec = rescan_sec
+        self.clock = clock
+        self.height = 0
+        self.last_scan: Optional[float] = None
+        self.stats = {"checks": 0, "blocks": 0, "rescans": 0}
+
+    async def due(self) -> bool:
+        self.stats["checks"] += 1
+        height = await self.client.get_height()
+        now = self.clock()
+        if height is not None and height > self.height:
+            self.height = height
+            self.stats["blocks"] += 1
+        elif self.last_scan is not None and now - self.last_scan < self.rescan_sec:
+            return False
+        else:
+            self.stats["rescans"] += 1
+        self.last_scan = now
+        return True
 
 
 def get_message(tx: dict) -> str:
@@ -151,15 +567,18 @@ def prizm_amount(tx: dict) -> float:
         return 0.0
 
 
-def get_coef(match: dict, outcome: str) -> float:
+def get_coef(match, outcome: str) -> float:
     """
     Получить коэффициент для исхода из данных матча.
     Поддерживает:
+    0. match_model.Match — коэффициенты уже float, без разбора строк
     1. Текущий плоский формат (p1, x, p2, p1x, p12, px2)
     2. Legacy формат (odds: {"1": ..., "X": ..., "2": ...})
     """
     if not match:
         return 0.0
+    if isinstance(match, Match):
+        return match.odd(outcome)
 
     # Отображение исходов на плоские поля и ключи словаря odds
     flat_map = {"П1": "p1", "П2": "p2", "X": "x", "1X": "p1x", "X2": "px2", "12": "p12"}
@@ -190,34 +609,3 @@ def get_coef(match: dict, outcome: str) -> float:
 
 def get_sender_address(tx: dict) -> str:
     return tx.get("senderRS", tx.get("sender", "unknown"))
-
-
-def get_balance() -> dict:
-    """
-    Получить баланс кошелька PRIZM.
-    Возвращает: {"balance": float, "unconfirmed": float, "wallet": str, "node": str}
-    """
-    for node in PRIZM_NODES:
-        try:
-            r = requests.get(
-                f"{node}/prizm",
-                params={"requestType": "getAccount", "account": WALLET},
-                timeout=12,
-                verify=True,
-            )
-            if not r.ok:
-                continue
-            data = r.json()
-            if "errorCode" in data:
-                continue
-            balance_nqt     = int(data.get("balanceNQT", 0))
-            unconfirmed_nqt = int(data.get("unconfirmedBalanceNQT", 0))
-            return {
-                "balance":     balance_nqt / NQT,
-                "unconfirmed": unconfirmed_nqt / NQT,
-                "wallet":      WALLET,
-                "node":        node,
-            }
-        except Exception:
-            continue
-    return {"balance": None, "unconfirmed": None, "wallet": WALLET, "node": None}
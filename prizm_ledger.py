@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — локальный реестр транзакций кошелька (SQLite в режиме WAL).
+
+Каждая транзакция кошелька хранится один раз (tx_id — первичный ключ), с
+индексами по времени, отправителю, получателю и направлению. Итоги по
+направлениям и дням считаются триггером при вставке, поэтому статистика —
+чтение пары строк, а не выгрузка истории с ноды. Проверка «эту транзакцию
+уже обработали» — запрос по ключу в processed, отдельно для каждого
+потребителя: догрузка истории ничего обработанным не помечает.
+
+    ledger = Ledger()
+    ledger.add(prizm_api.get_transactions())
+    ledger.totals()   # {"in": (count, pzm), "out": ..., "self": ...}
+
+Вся история кошелька догружается один раз (backfill); дальше реестр
+пополняют опросы новых транзакций.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import prizm_api
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Абсолютный путь: бот и bet_parser запускаются из разных каталогов, а реестр у них общий
+LEDGER_FILE = os.path.join(SCRIPT_DIR, os.getenv("PRIZM_LEDGER", "prizm_ledger.sqlite3"))
+DAY = 86400
+# Общий потребитель «транзакция уже стала ставкой в bets.json»: его отмечают и проверяют
+# и бот, и bet_parser — единственный источник дедупликации ставок
+BETS = "bets"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS txs (
+    tx_id      TEXT PRIMARY KEY,
+    ts         INTEGER NOT NULL,
+    height     INTEGER,
+    sender     TEXT NOT NULL DEFAULT '',
+    recipient  TEXT NOT NULL DEFAULT '',
+    direction  TEXT NOT NULL,
+    amount_nqt INTEGER NOT NULL DEFAULT 0,
+    fee_nqt    INTEGER NOT NULL DEFAULT 0,
+    message    TEXT NOT NULL DEFAULT '',
+    raw        TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS txs_ts ON txs(ts);
+CREATE INDEX IF NOT EXISTS txs_sender ON txs(sender, ts);
+CREATE INDEX IF NOT EXISTS txs_recipient ON txs(recipient, ts);
+CREATE INDEX IF NOT EXISTS txs_direction ON txs(direction, ts);
+
+CREATE TABLE IF NOT EXISTS daily (
+    day        INTEGER NOT NULL,
+    direction  TEXT NOT NULL,
+    count      INTEGER NOT NULL,
+    amount_nqt INTEGER NOT NULL,
+    fee_nqt    INTEGER NOT NULL,
+    PRIMARY KEY (day, direction)
+) WITHOUT ROWID;
+
+-- Что каждый потребитель (bets — ставки, bot — уведомления) уже обработал; строки txs для этого не нужны
+CREATE TABLE IF NOT EXISTS processed (
+    consumer TEXT NOT NULL,
+    tx_id    TEXT NOT NULL,
+    PRIMARY KEY (consumer, tx_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+
+-- INSERT OR IGNORE повторной транзакции триггер не запускает: итоги не двоятся
+CREATE TRIGGER IF NOT EXISTS txs_daily AFTER INSERT ON txs BEGIN
+    INSERT INTO daily(day, direction, count, amount_nqt, fee_nqt)
+    VALUES (NEW.ts / 86400, NEW.direction, 1, NEW.amount_nqt, NEW.fee_nqt)
+    ON CONFLICT(day, direction) DO UPDATE SET
+        count = count + 1,
+        amount_nqt = amount_nqt + excluded.amount_nqt,
+        fee_nqt = fee_nqt + excluded.fee_nqt;
+END;
+"""
+
+
+def direction(tx: dict, wallet: str = prizm_api.WALLET) -> str:
+    """in — на кошелёк, out — с кошелька (выплаты), self — сам себе."""
+    out = tx.get("senderRS") == wallet
+    into = tx.get("recipientRS") == wallet
+    return "self" if out and into else "out" if out else "in"
+
+
+class Ledger:
+    """Реестр поверх одного соединения; методы потокобезопасны (бот зовёт и из to_thread)."""
+
+    def __init__(self, path: str = LEDGER_FILE, wallet: str = prizm_api.WALLET):
+        self.path = path
+        self.wallet = wallet
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")      # чтение статистики не ждёт записи
+        self.db.execute("PRAGMA synchronous=NORMAL")    # в WAL это без риска порчи, fsync на чекпоинте
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self.db.close()
+
+    def __enter__(self) -> "Ledger":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _row(self, tx: dict) -> tuple:
+        return (
+            str(tx.get("transaction") or tx.get("fullHash", "")),
+            int(tx.get("timestamp", 0)),
+            tx.get("height"),
+            tx.get("senderRS", ""),
+            tx.get("recipientRS", ""),
+            direction(tx, self.wallet),
+            int(tx.get("amountNQT", 0) or 0),
+            int(tx.get("feeNQT", 0) or 0),
+            prizm_api.get_message(tx),
+            json.dumps(tx, ensure_ascii=False, separators=(",", ":")),
+        )
+
+    # ─── запись ────────────────────────────────────────────────────────────────
+    def add(self, txs: Iterable[dict]) -> int:
+        """Записать транзакции одной транзакцией БД; уже известные пропускаются. Возвращает число новых."""
+        rows = [self._row(tx) for tx in txs]
+        # rowcount — только вставленные строки txs: пропуски и строки триггера не считаются
+        return self._write_many("INSERT OR IGNORE INTO txs VALUES (?,?,?,?,?,?,?,?,?,?)", rows)
+
+    def _write_many(self, query: str, rows: List[tuple]) -> int:
+        if not rows:
+            return 0
+        with self._lock:
+            self.db.execute("BEGIN")
+            try:
+                n = self.db.executemany(query, rows).rowcount
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return n
+
+    def backfill(self, fetch_page=None, page_size: int = prizm_api.TX_PAGE) -> int:
+        """
+        Догрузить всю историю кошелька с ноды (новые → старые). fetch_page(first, last) →
+        список или None; по умолчанию — getBlockchainTransactions через пул нод.
+        Флаг в meta ставится, только когда история дочитана: оборванная загрузка
+        повторится целиком, известные транзакции просто пропустятся.
+        """
+        fetch_page = fetch_page or prizm_api._tx_page(None)
+        added = first = 0
+        while True:
+            page = fetch_page(first, first + page_size - 1)
+            if page is None:
+                return added
+            added += self.add(page)
+            if len(page) < page_size:
+                self._set_meta("backfilled", "1")
+                return added
+            first += page_size
+
+    def _set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    @property
+    def backfilled(self) -> bool:
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone() is not None
+
+    def mark_processed(self, consumer: str, tx_ids: Iterable[str]) -> int:
+        return self._write_many("INSERT OR IGNORE INTO processed VALUES (?, ?)",
+                                [(consumer, str(t)) for t in tx_ids])
+
+    def seed(self, consumer: str, tx_ids: Iterable[str]) -> bool:
+        """Один раз перенести уже обработанное до реестра (tx_id из bets.json). True — перенесено сейчас."""
+        key = f"seeded:{consumer}"
+        with self._lock:
+            if self.db.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return False
+        self.mark_processed(consumer, (t for t in tx_ids if t))
+        self._set_meta(key, "1")
+        return True
+
+    # ─── чтение ────────────────────────────────────────────────────────────────
+    @property
+    def empty(self) -> bool:
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM txs LIMIT 1").fetchone() is None
+
+    def count(self) -> int:
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM txs").fetchone()[0]
+
+    def has(self, tx_id: str) -> bool:
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM txs WHERE tx_id = ?", (str(tx_id),)).fetchone() is not None
+
+    def known(self, tx_ids: Iterable[str]) -> Set[str]:
+        """Какие из tx_ids уже в реестре (одним запросом по первичному ключу)."""
+        return self._select_in("SELECT tx_id FROM txs WHERE tx_id IN ({})", tx_ids)
+
+    def _select_in(self, query: str, tx_ids: Iterable[str], args: tuple = ()) -> Set[str]:
+        ids = [str(t) for t in tx_ids]
+        found: Set[str] = set()
+        with self._lock:
+            for i in range(0, len(ids), 500):   # предел параметров SQLite
+                chunk = ids[i:i + 500]
+                found.update(r[0] for r in self.db.execute(query.format(",".join("?" * len(chunk))),
+                                                           (*args, *chunk)))
+        return found
+
+    def processed(self, consumer: Union[str, Iterable[str]], tx_ids: Iterable[str]) -> Set[str]:
+        """Какие из tx_ids уже обработал потребитель (или любой из нескольких)."""
+        consumers = (consumer,) if isinstance(consumer, str) else tuple(consumer)
+        return self._select_in(f"SELECT tx_id FROM processed WHERE consumer IN ({','.join('?' * len(consumers))}) "
+                               "AND tx_id IN ({})", tx_ids, consumers)
+
+    def totals(self, since_ts: Optional[int] = None) -> Dict[str, Tuple[int, float]]:
+        """{направление: (число транзакций, сумма PZM)} по дневным итогам, без чтения txs."""
+        q = "SELECT direction, SUM(count), SUM(amount_nqt) FROM daily"
+        args: tuple = ()
+        if since_ts is not None:
+            q += " WHERE day >= ?"
+            args = (since_ts // DAY,)
+        with self._lock:
+            rows = self.db.execute(q + " GROUP BY direction", args).fetchall()
+        out = {d: (0, 0.0) for d in ("in", "out", "self")}
+        out.update({d: (n, nqt / prizm_api.NQT) for d, n, nqt in rows})
+        return out
+
+    def daily(self, last_days: int = 30) -> List[tuple]:
+        """(день, направление, число, PZM) за последние last_days дней в реестре."""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT day, direction, count, amount_nqt FROM daily "
+                "WHERE day > (SELECT MAX(day) FROM daily) - ? ORDER BY day, direction",
+                (last_days,)).fetchall()
+        return [(day, d, n, nqt / prizm_api.NQT) for day, d, n, nqt in rows]
+
+    def history(self, account: Optional[str] = None, direction: Optional[str] = None,
+                limit: int = 50) -> List[dict]:
+        """Последние транзакции (новые первыми), по кошельку-контрагенту и/или направлению."""
+        where, args = [], []
+        if account:
+            where.append("(sender = ? OR recipient = ?)")
+            args += [account, account]
+        if direction:
+            where.append("direction = ?")
+            args.append(direction)
+        q = "SELECT raw FROM txs" + (" WHERE " + " AND ".join(where) if where else "")
+        with self._lock:
+            rows = self.db.execute(q + " ORDER BY ts DESC, height DESC LIMIT ?", (*args, limit)).fetchall()
+        return [json.loads(r[0]) for r in rows]
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — публикация matches.json и производных артефактов.
+
+matches.json несёт монотонно растущий "version". Рядом пишется
+matches.delta.json: что добавилось, удалилось и изменилось (по id события)
+относительно предыдущей версии — клиент на base_version скачивает сотни байт
+вместо всего файла.
+
+Дополнительно лента режется на шарды (по виду спорта, опционально по лиге):
+shards/<ключ>.<хеш>.json + shards/manifest.json с хешем, размером и числом
+матчей каждого шарда. Имя файла содержит хеш содержимого, поэтому шард
+неизменяем и клиент перекачивает только те, чей хеш сменился.
+
+Для статического хостинга рядом с JSON пишутся артефакты: минифицированный
+*.min.json со стабильным порядком ключей и его сжатые копии .gz и .br
+(brotli — если установлен пакет Brotli).
+"""
+
+from __future__ import annotations
+
+import datetime as _dt
+import gzip
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # опциональная зависимость: без неё пишем только .gz
+    brotli = None
+
+OUT_JSON = "matches.json"
+DELTA_JSON = "matches.delta.json"
+SHARDS_DIR = "shards"
+SHARD_MANIFEST = "manifest.json"   # внутри SHARDS_DIR — не путать с PWA manifest.json в корне
+
+
+def dump_json(data, compact: bool = False, sort_keys: bool = False) -> bytes:
+    if compact:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys)
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    return text.encode("utf-8")
+
+
+def write_bytes(path: str, raw: bytes) -> int:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw)
+    os.replace(tmp, path)
+    return len(raw)
+
+
+def write_json(path: str, data, compact: bool = False) -> int:
+    """Атомарная запись JSON (tmp + os.replace). Возвращает размер файла в байтах."""
+    return write_bytes(path, dump_json(data, compact))
+
+
+def min_path(path: str) -> str:
+    """matches.json → matches.min.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.min{ext or '.json'}"
+
+
+def write_artifacts(path: str, data) -> Dict[str, int]:
+    """
+    Пишет <имя>.min.json (ключи отсортированы — одинаковые данные дают одинаковые
+    байты) и его .gz / .br. Возвращает размеры в байтах: {"min", "gz"[, "br"]}.
+    gzip с mtime=0, чтобы неизменённый файл не давал лишнего диффа.
+    """
+    raw = dump_json(data, compact=True, sort_keys=True)
+    target = min_path(path)
+    sizes = {"min": write_bytes(target, raw)}
+    sizes["gz"] = write_bytes(target + ".gz", gzip.compress(raw, compresslevel=9, mtime=0))
+    if brotli is not None:
+        sizes["br"] = write_bytes(target + ".br", brotli.compress(raw, quality=11))
+    return sizes
+
+
+def report_sizes(path: str, sizes: Dict[str, int]) -> None:
+    parts = ", ".join(f"{k} {v / 1024:.1f} КБ" for k, v in sizes.items())
+    print(f"[SIZE] {os.path.basename(path)}: {parts}")
+
+
+def save_with_artifacts(path: str, data) -> Dict[str, int]:
+    """Читаемый JSON для диффов + артефакты для отдачи клиентам; печатает размеры."""
+    sizes = {"json": write_json(path, data)}
+    sizes.update(write_artifacts(path, data))
+    report_sizes(path, sizes)
+    return sizes
+
+
+def load_snapshot(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def compute_delta(old: List[dict], new: List[dict]) -> dict:
+    """
+    Разница двух наборов матчей по id:
+    added — новые матчи целиком, removed — id исчезнувших,
+    changed — {"id", <только изменившиеся поля>} (обычно коэффициенты).
+    """
+    old_by_id = {m.get("id"): m for m in old if m.get("id")}
+    new_ids = set()
+    added, changed = [], []
+    for m in new:
+        m_id = m.get("id")
+        if not m_id:
+            continue
+        new_ids.add(m_id)
+        prev = old_by_id.get(m_id)
+        if prev is None:
+            added.append(m)
+            continue
+        diff = {k: v for k, v in m.items() if prev.get(k) != v}
+        diff.update({k: None for k in prev if k not in m})
+        if diff:
+            changed.append({"id": m_id, **diff})
+    removed = [m_id for m_id in old_by_id if m_id not in new_ids]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def delta_is_empty(delta: dict) -> bool:
+    return not (delta["added"] or delta["removed"] or delta["changed"])
+
+
+def publish_matches(matches: List[dict], path: str = OUT_JSON, delta_path: Optional[str] = DELTA_JSON,
+                    now: Optional[_dt.datetime] = None, artifacts: bool = True) -> dict:
+    """
+    Пишет matches.json и (если есть прошлая версия) matches.delta.json.
+    Версия растёт только при реальных изменениях набора матчей; если ничего
+    не поменялось, прежняя дельта остаётся на месте и по-прежнему верна.
+    """
+    prev = load_snapshot(path)
+    prev_version = int(prev.get("version") or 0)
+    last_update = (now or _dt.datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+
+    delta = compute_delta(prev.get("matches") or [], matches) if prev else None
+    version = prev_version if delta is not None and delta_is_empty(delta) else prev_version + 1
+
+    payload = {"last_update": last_update, "version": version, "matches": matches}
+    if artifacts:
+        save_with_artifacts(path, payload)
+    else:
+        write_json(path, payload)
+
+    if delta_path and delta is not None and version != prev_version:
+        write_json(delta_path, {
+            "version": version, "base_version": prev_version,
+            "last_update": last_update, **delta,
+        }, compact=True)
+        print(f"[DELTA] v{prev_version} → v{version}: +{len(delta['added'])} "
+              f"-{len(delta['removed'])} ~{len(delta['changed'])}")
+    return payload
+
+
+# ─── Шарды ─────────────────────────────────────────────────────────────────────
+def shard_key(m: dict, by_league: bool = False) -> Tuple[str, str]:
+    """(ключ для имени файла, лига). Лиги кириллические — в имени файла короткий хеш."""
+    sport = m.get("sport") or "other"
+    if not by_league:
+        return sport, ""
+    league = m.get("league") or ""
+    return f"{sport}-{hashlib.sha1(league.encode('utf-8')).hexdigest()[:8]}", league
+
+
+def split_shards(matches: List[dict], by_league: bool = False) -> Dict[str, dict]:
+    """{ключ: {"sport", "league", "matches"}} с сохранением порядка матчей."""
+    shards: Dict[str, dict] = {}
+    for m in matches:
+        key, league = shard_key(m, by_league)
+        shard = shards.get(key)
+        if shard is None:
+            shard = shards[key] = {"sport": m.get("sport") or "other", "league": league, "matches": []}
+        shard["matches"].append(m)
+    return shards
+
+
+def publish_shards(matches: List[dict], out_dir: str = SHARDS_DIR, by_league: bool = False,
+                   version: int = 0, last_update: str = "") -> dict:
+    """
+    Пишет шарды и манифест. Шард с тем же содержимым получает то же имя и не
+    перезаписывается; файлы, которых нет в новом манифесте, удаляются.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for key, shard in split_shards(matches, by_league).items():
+        raw = dump_json(shard, compact=True)
+        digest = hashlib.sha1(raw).hexdigest()
+        name = f"{key}.{digest[:12]}.json"
+        path = os.path.join(out_dir, name)
+        if not os.path.exists(path):
+            write_bytes(path, raw)
+        entries.append({
+            "key": key, "sport": shard["sport"], "league": shard["league"],
+            "file": name, "hash": digest, "bytes": len(raw), "count": len(shard["matches"]),
+        })
+
+    manifest = {"version": version, "last_update": last_update, "shards": entries}
+    write_json(os.path.join(out_dir, SHARD_MANIFEST), manifest)
+
+    keep = {e["file"] for e in entries} | {SHARD_MANIFEST}
+    for name in os.listdir(out_dir):
+        if name.endswith(".json") and name not in keep:
+            os.remove(os.path.join(out_dir, name))
+    print(f"[SHARDS] {len(entries)} шардов, {sum(e['bytes'] for e in entries)} байт → {out_dir}/")
+    return manifest
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — отчёт прогона парсера в JSON Lines (одна строка на прогон).
+
+По каждой лиге: статус, байты, повторы, время загрузки и разбора, источник
+(сеть / 304 / то же тело), строк найдено и оставлено после отбора. По прогону —
+длительности стадий (загрузка+разбор, отбор, запись) и итоги.
+
+    python run_report.py                  # последние прогоны таблицей
+    python run_report.py --last 50 --league "КХЛ"
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+RUN_REPORT_FILE = "run_report.jsonl"
+
+
+class RunReport:
+    """Собирает метрики одного прогона; write() дописывает строку в JSONL."""
+
+    def __init__(self, mode: str = "", **meta):
+        self.started = time.time()
+        self.record: dict = {"ts": _dt.datetime.now().isoformat(timespec="seconds"), "mode": mode, **meta,
+                             "stages": {}, "leagues": []}
+        self._results: list = []
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record["stages"][name] = round(time.perf_counter() - t0, 4)
+
+    def add_league(self, res) -> None:
+        """res — marathon_parser_real.LeagueResult."""
+        self._results.append(res)
+
+    def finish(self, kept: Iterable[dict], **extra) -> dict:
+        """Досчитать «оставлено после отбора» по каждой лиге и итоги прогона."""
+        kept_ids = {id(m) for m in kept}
+        leagues = []
+        for res in self._results:
+            page = res.page
+            leagues.append({
+                "title": res.title,
+                "sport": page.sport if page else "",
+                "status": page.status if page else 0,
+                "bytes": page.bytes if page else 0,
+                "retries": page.retries if page else 0,
+                "fetch_s": round(page.fetch_s, 4) if page else 0.0,
+                "parse_s": round(res.parse_s, 4),
+                "cache": page.cache_hit if page else "",
+                "rendered": page.rendered if page else False,
+                "rows_seen": len(res.items),
+                "rows_kept": sum(1 for m in res.items if id(m) in kept_ids),
+                "error": res.error,
+                "duplicate_of": res.duplicate_of,
+            })
+        self.record["leagues"] = leagues
+        self.record.update({
+            "rows_seen": sum(l["rows_seen"] for l in leagues),
+            "rows_kept": len(kept_ids),
+            "errors": sum(1 for l in leagues if l["error"]),
+            "bytes": sum(l["bytes"] for l in leagues),
+            "total_s": round(time.time() - self.started, 4),
+            **extra,
+        })
+        return self.record
+
+    def write(self, path: Optional[str] = RUN_REPORT_FILE) -> None:
+        if not path:
+            return
+        line = json.dumps(self.record, ensure_ascii=False, separators=(",", ":"))
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def read_reports(path: str = RUN_REPORT_FILE, last: int = 0) -> List[dict]:
+    out = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        out.append(json.loads(line))
+                    except ValueError:
+                        continue   # оборванная строка после сбоя
+    except FileNotFoundError:
+        return []
+    return out[-last:] if last else out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Отчёты прогонов парсера")
+    ap.add_argument("--file", default=os.getenv("RUN_REPORT", RUN_REPORT_FILE))
+    ap.add_argument("--last", type=int, default=20)
+    ap.add_argument("--league", help="показать одну лигу по прогонам")
+    args = ap.parse_args()
+
+    reports = read_reports(args.file, args.last)
+    if args.league:
+        print(f"{'прогон':<20}{'статус':>7}{'КБ':>8}{'повт':>5}{'загр, с':>9}{'разб, с':>9}{'строк':>7}{'оставл':>8}")
+        for r in reports:
+            for l in r["leagues"]:
+                if l["title"] == args.league:
+                    print(f"{r['ts']:<20}{l['status']:>7}{l['bytes'] / 1024:>8.0f}{l['retries']:>5}"
+                          f"{l['fetch_s']:>9.2f}{l['parse_s']:>9.2f}{l['rows_seen']:>7}{l['rows_kept']:>8}")
+        return
+    print(f"{'прогон':<20}{'режим':<8}{'загр+разб':>10}{'отбор':>8}{'запись':>8}{'всего':>8}"
+          f"{'строк':>7}{'оставл':>8}{'ошибок':>7}")
+    for r in reports:
+        st = r.get("stages", {})
+        print(f"{r['ts']:<20}{r.get('mode', ''):<8}{st.get('fetch_parse', 0):>10.2f}{st.get('filter', 0):>8.3f}"
+              f"{st.get('write', 0):>8.3f}{r['total_s']:>8.2f}{r['rows_seen']:>7}{r['rows_kept']:>8}{r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
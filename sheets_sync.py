@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — синхронизация таблицы Google Sheets по диффу.
+
+Лист не перечитывается на каждом прогоне: локальное состояние (.sheets_state.json)
+хранит для каждого ключа (tx_id) номер строки и последние записанные значения.
+За прогон уходит один batch_update: новые строки — одним диапазоном в конец,
+у изменившихся строк — только изменившиеся ячейки (статус win/loss и т.п.).
+
+Лист читается целиком (get_all_values) только при первом запуске, смене листа
+или заголовков и по resync=True — если таблицу правили руками.
+
+Нужен объект листа с интерфейсом gspread.Worksheet: id, row_count,
+get_all_values(), clear(), add_rows(n), batch_update(data, value_input_option=...).
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from publish import write_json
+
+STATE_FILE = ".sheets_state.json"
+
+
+class SyncResult(NamedTuple):
+    added: int
+    updated: int      # строк с изменёнными ячейками
+    cells: int        # всего изменённых ячеек (без новых строк)
+    bootstrapped: bool
+
+
+def col_letter(col: int) -> str:
+    """1 → A, 26 → Z, 27 → AA."""
+    out = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        out = chr(65 + rem) + out
+    return out
+
+
+def a1(row: int, col: int) -> str:
+    return f"{col_letter(col)}{row}"
+
+
+def _cells(row: Sequence) -> List[str]:
+    """Значение ячейки так, как его вернёт лист (get_all_values отдаёт строки)."""
+    return ["" if v is None else str(v) for v in row]
+
+
+class SheetSync:
+    """tx_id → строка листа; sync() пушит только разницу одним batch_update."""
+
+    def __init__(self, ws, headers: Sequence[str], state_path: Optional[str] = STATE_FILE,
+                 key_col: int = 0):
+        self.ws = ws
+        self.headers = list(headers)
+        self.state_path = state_path
+        self.key_col = key_col
+        self.state = self._load()
+
+    def _load(self) -> dict:
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        if self.state_path:
+            write_json(self.state_path, self.state, compact=True)
+
+    def _valid_state(self) -> bool:
+        st = self.state
+        return bool(st) and st.get("sheet") == str(self.ws.id) and st.get("headers") == self.headers
+
+    def bootstrap(self) -> None:
+        """Построить карту строк по содержимому листа (один get_all_values)."""
+        values = self.ws.get_all_values()
+        rows: Dict[str, list] = {}
+        if not values or values[0][:len(self.headers)] != self.headers:
+            self.ws.clear()
+            self.ws.batch_update([{"range": f"A1:{a1(1, len(self.headers))}", "values": [self.headers]}],
+                                 value_input_option="USER_ENTERED")
+            next_row = 2
+        else:
+            width = len(self.headers)
+            for i, row in enumerate(values[1:], start=2):
+                key = row[self.key_col] if len(row) > self.key_col else ""
+                if key:
+                    rows[key] = [i, (row + [""] * width)[:width]]
+            next_row = len(values) + 1
+        self.state = {"sheet": str(self.ws.id), "headers": self.headers, "next_row": next_row, "rows": rows}
+
+    def sync(self, rows: Iterable[Sequence], resync: bool = False) -> SyncResult:
+        bootstrapped = resync or not self._valid_state()
+        if bootstrapped:
+            self.bootstrap()
+        known = self.state["rows"]
+        next_row = self.state["next_row"]
+        width = len(self.headers)
+
+        new_rows: List[List[str]] = []
+        data: List[dict] = []
+        updated = cells = 0
+        for row in rows:
+            values = _cells(row)[:width]
+            key = values[self.key_col]
+            entry = known.get(key)
+            if entry is None:
+                known[key] = [next_row + len(new_rows), values]
+                new_rows.append(values)
+                continue
+            row_idx, old = entry
+            changed = [c for c, v in enumerate(values) if c >= len(old) or old[c] != v]
+            if changed:
+                updated += 1
+                cells += len(changed)
+                data.extend({"range": a1(row_idx, c + 1), "values": [[values[c]]]} for c in changed)
+                entry[1] = values
+
+        if new_rows:
+            last = next_row + len(new_rows) - 1
+            if last > self.ws.row_count:
+                self.ws.add_rows(last - self.ws.row_count)
+            data.append({"range": f"{a1(next_row, 1)}:{a1(last, width)}", "values": new_rows})
+            self.state["next_row"] = last + 1
+        if data:
+            self.ws.batch_update(data, value_input_option="USER_ENTERED")
+        # Состояние — только после успешной записи: при сбое следующий прогон повторит дифф
+        if data or bootstrapped:
+            self._save()
+        return SyncResult(len(new_rows), updated, cells, bootstrapped)
+
+
+class FakeWorksheet:
+    """Лист в памяти с интерфейсом gspread.Worksheet — для тестов и отладки без сети."""
+
+    def __init__(self, rows: int = 100, cols: int = 26, ws_id: int = 0):
+        self.id = ws_id
+        self.row_count = rows
+        self.col_count = cols
+        self.cells: Dict[tuple, str] = {}
+        self.calls: List[str] = []
+
+    def get_all_values(self) -> List[List[str]]:
+        self.calls.append("get_all_values")
+        if not self.cells:
+            return []
+        last_row = max(r for r, _ in self.cells)
+        last_col = max(c for _, c in self.cells)
+        return [[self.cells.get((r, c), "") for c in range(1, last_col + 1)] for r in range(1, last_row + 1)]
+
+    def clear(self) -> None:
+        self.calls.append("clear")
+        self.cells.clear()
+
+    def add_rows(self, n: int) -> None:
+        self.calls.append("add_rows")
+        self.row_count += n
+
+    def batch_update(self, data: List[dict], value_input_option: str = "RAW") -> None:
+        self.calls.append("batch_update")
+        for item in data:
+            start = item["range"].split(":")[0]
+            letters = start.rstrip("0123456789")
+            row0 = int(start[len(letters):])
+            col0 = 0
+            for ch in letters:
+                col0 = col0 * 26 + ord(ch) - 64
+            for dr, values in enumerate(item["values"]):
+                if row0 + dr > self.row_count:
+                    raise ValueError(f"строка {row0 + dr} за пределами листа ({self.row_count})")
+                for dc, v in enumerate(values):
+                    self.cells[(row0 + dr, col0 + dc)] = str(v)
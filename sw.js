@@ -1,4 +1,5 @@
-const CACHE_NAME = 'prizmbet-v13';
+const CACHE_NAME = 'prizmbet-v15';
+const SHARDS_CACHE = 'prizmbet-shards';
 const ASSETS = [
     '/betprizm/',
     '/betprizm/index.html',
@@ -23,15 +24,49 @@ self.addEventListener('activate', (event) => {
     event.waitUntil(
         caches.keys().then((keys) => {
             return Promise.all(
-                keys.filter((key) => key !== CACHE_NAME).map((key) => caches.delete(key))
+                keys.filter((key) => key !== CACHE_NAME && key !== SHARDS_CACHE).map((key) => caches.delete(key))
             );
         })
     );
 });
 
+async function pruneShards(manifest) {
+    const live = new Set((manifest.shards || []).map((s) => s.file));
+    const cache = await caches.open(SHARDS_CACHE);
+    for (const req of await cache.keys()) {
+        const name = new URL(req.url).pathname.split('/').pop();
+        if (!live.has(name)) await cache.delete(req);
+    }
+}
+
 self.addEventListener('fetch', (event) => {
     // Не кешируем matches.json (он должен быть всегда свежим), но можем отдавать fallback
-    if (event.request.url.includes('matches.json')) {
+    const url = new URL(event.request.url);
+    // Шарды ленты неизменяемы (хеш в имени): cache-first, манифест — всегда из сети
+    if (url.pathname.includes('/shards/') && !url.pathname.endsWith('/manifest.json')) {
+        event.respondWith(
+            caches.open(SHARDS_CACHE).then((cache) =>
+                cache.match(event.request).then((hit) => hit || fetch(event.request).then((response) => {
+                    if (response && response.status === 200) cache.put(event.request, response.clone());
+                    return response;
+                }))
+            )
+        );
+        return;
+    }
+
+    if (url.pathname.endsWith('/shards/manifest.json')) {
+        event.respondWith(
+            fetch(event.request).then((response) => {
+                // Выкидываем из кэша шарды, которых больше нет в манифесте
+                response.clone().json().then((manifest) => pruneShards(manifest)).catch(() => { });
+                return response;
+            }).catch(() => caches.match(event.request))
+        );
+        return;
+    }
+
+    if (event.request.url.includes('matches.json') || event.request.url.includes('matches.delta.json')) {
         event.respondWith(
             fetch(event.request).catch(() => caches.match(event.request))
         );
@@ -39,6 +39,16 @@ from telegram.ext import (
 )
 
 import prizm_api
+import prizm_ledger
+from match_model import Match, odd_to_str
+
+# Async-клиент нод PRIZM: общий keep-alive пул, запросы не блокируют event loop бота
+prizm = prizm_api.PrizmClient()
+# Транзакции читаются, когда вырос блок (или раз в RESCAN_SEC), а не на каждом тике опроса
+block_watcher = prizm_api.BlockWatcher(prizm)
+# Локальный реестр транзакций кошелька: статистика и «уже обработано» без запросов к ноде
+ledger = prizm_ledger.Ledger()
+LEDGER_CONSUMER = "bot"
 
 # ══════════════════════════════════════════════════════════════
 #  КОНФИГ
@@ -53,6 +63,7 @@ CONFIG_FILE  = Path("bot_config.json")
 RATE_LIMIT_SEC   = 2      # секунд между командами для обычных юзеров
 BROADCAST_DELAY  = 0.05   # задержка между отправками при рассылке (anti-flood)
 PROGRESS_STEP    = 10     # обновлять прогресс-бар каждые N пользователей
+BLOCK_POLL_SEC   = 3      # как часто спрашивать у ноды высоту блокчейна
 
 # ══════════════════════════════════════════════════════════════
 #  ЛОГИРОВАНИЕ
@@ -183,9 +194,10 @@ def save_bets(bets: list):
     BETS_FILE.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
 def load_matches() -> dict:
+    """id → Match: коэффициенты разбираются один раз, при загрузке"""
     try:
         data = json.loads(MATCHES_FILE.read_text(encoding="utf-8"))
-        return {m["id"]: m for m in data.get("matches", [])}
+        return {str(m["id"]): Match.from_dict(m) for m in data.get("matches", [])}
     except Exception:
         return {}
 
@@ -438,20 +450,16 @@ async def cmd_stats(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     wins    = sum(1 for b in bets if b.get("status") == "win")
     losses  = sum(1 for b in bets if b.get("status") == "loss")
     
-    # Calculate blockchain stats (last 100 txs for speed, or more if needed)
-    txs = prizm_api.get_transactions(0, 500)
-    real_income = 0.0
-    real_payouts = 0.0
-    
-    for tx in txs:
-        amount = prizm_api.prizm_amount(tx)
-        if tx.get("senderRS") == prizm_api.WALLET:
-            real_payouts += amount
-        elif tx.get("recipientRS") == prizm_api.WALLET:
-            real_income += amount
-            
+    # Обороты — из итогов локального реестра; история с ноды догружается в фоне
+    complete     = ledger.backfilled
+    if not complete:
+        start_ledger_backfill()   # оборванная догрузка перезапускается, идущая не дублируется
+    totals       = ledger.totals()
+    real_income  = totals["in"][1]
+    real_payouts = totals["out"][1]
+
     # Include unconfirmed balance in real_income just in case
-    balance_info = prizm_api.get_balance()
+    balance_info = await prizm.get_balance()
     current_balance = balance_info.get("balance", 0.0) if balance_info.get("balance") is not None else 0.0
             
     profit  = real_income - real_payouts
@@ -466,11 +474,13 @@ async def cmd_stats(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         f"❌ Проиграли:         `{losses}`\n"
         f"📈 Винрейт дома:      `{wr}`\n\n"
         f"━━━━━━━━━━━━━━━━━━━━\n"
-        f"📥 Входящие TX (500): `{real_income:.1f} PRIZM`\n"
-        f"📤 Исходящие TX (500): `{real_payouts:.1f} PRIZM`\n"
+        f"📥 Входящие TX ({totals['in'][0]}): `{real_income:.1f} PRIZM`\n"
+        f"📤 Исходящие TX ({totals['out'][0]}): `{real_payouts:.1f} PRIZM`\n"
         f"💰 Баланс кошелька:   `{current_balance:.1f} PRIZM`\n"
-        f"📈 Профит (за 500 TX): `{profit:.1f} PRIZM`"
+        f"📈 Профит (вся история): `{profit:.1f} PRIZM`"
     )
+    if not complete:
+        text += "\n\n⚠️ _История кошелька ещё догружается — итоги неполные_"
     await msg.edit_text(text, parse_mode=ParseMode.MARKDOWN)
 
 @smart_handler
@@ -519,7 +529,7 @@ async def cmd_balance(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
     msg = await update.message.reply_text("🔍 _Запрашиваю баланс..._", parse_mode=ParseMode.MARKDOWN)
     try:
-        info = prizm_api.get_balance()
+        info = await prizm.get_balance()
         if info["balance"] is None:
             await msg.edit_text("❌ Не удалось получить баланс — все ноды недоступны.")
             return
@@ -763,15 +773,15 @@ async def inline_query_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     results = []
 
     for mid, m in list(matches.items())[:50]:
-        t1 = m.get("team1", "")
-        t2 = m.get("team2", "")
+        t1 = m.team1
+        t2 = m.team2
         if query and query not in f"{t1} {t2}".lower():
             continue
-        league = m.get("league", "")
-        date   = m.get("date", "")
-        o1     = m.get("odds_1", "?")
-        ox     = m.get("odds_x", "?")
-        o2     = m.get("odds_2", "?")
+        league = m.league
+        date   = m.date
+        o1     = odd_to_str(m.p1)
+        ox     = odd_to_str(m.x)
+        o2     = odd_to_str(m.p2)
 
         title   = f"{t1} — {t2}"
         desc    = f"{league} | {date}"
@@ -877,7 +887,7 @@ async def callback_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # ── Баланс ─────────────────────────────────────────────
     elif data == "check_balance":
         try:
-            info = prizm_api.get_balance()
+            info = await prizm.get_balance()
             if info["balance"] is None:
                 await q.message.reply_text("❌ Все ноды недоступны")
             else:
@@ -911,21 +921,58 @@ async def handle_message(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 # ══════════════════════════════════════════════════════════════
 #  ПРОВЕРКА PRIZM ТРАНЗАКЦИЙ
 # ══════════════════════════════════════════════════════════════
+_tx_lock = asyncio.Lock()
+_backfill_lock = asyncio.Lock()
+
+
+async def backfill_ledger():
+    """Догрузить историю кошелька в реестр; одновременно идёт не больше одной догрузки"""
+    if _backfill_lock.locked():
+        return
+    async with _backfill_lock:
+        if ledger.backfilled:
+            return
+        try:
+            added = await asyncio.to_thread(ledger.backfill)
+            log.info(f"Ledger backfill: +{added} TX, complete={ledger.backfilled}")
+        except Exception as e:
+            log.error(f"Ledger backfill: {e}")
+
+
+def start_ledger_backfill():
+    if not _backfill_lock.locked():
+        asyncio.get_running_loop().create_task(backfill_ledger())
+
+
 async def check_prizm_transactions(bot=None):
+    # Фоновый опрос и /check_tx не должны читать курсор одновременно
+    async with _tx_lock:
+        await _check_prizm_transactions(bot)
+
+
+async def _check_prizm_transactions(bot=None):
     log.info("Checking PRIZM transactions...")
-    new_txs = prizm_api.get_new_transactions()
+    # Курсор сдвигается только после save_bets: при сбое транзакции придут снова,
+    # а уже обработанные отсекают отметки реестра
+    cursor  = prizm_api.default_cursor()
+    new_txs = await prizm.pull_new_transactions(cursor)
     if not new_txs:
         log.info("No new transactions")
         return
 
     bets    = load_bets()
     matches = load_matches()
-    bet_ids = {b.get("tx_id") for b in bets}
+    # Ставки, записанные до появления реестра, — «обработаны» (один раз, общий с bet_parser потребитель)
+    ledger.seed(prizm_ledger.BETS, (b.get("tx_id") for b in bets))
+    # Повторная выдача после сбоя: ни ставки (наши или bet_parser), ни уведомления о выплатах — не второй раз
+    done    = ledger.processed((LEDGER_CONSUMER, prizm_ledger.BETS),
+                               (tx.get("transaction", "") for tx in new_txs))
+    new_ids = []
     added   = 0
 
     for tx in new_txs:
         tx_id = tx.get("transaction", "")
-        if tx_id in bet_ids:
+        if tx_id in done:
             continue
             
         amount       = prizm_api.prizm_amount(tx)
@@ -974,21 +1021,21 @@ async def check_prizm_transactions(bot=None):
                  continue
                  
             match_id = "unknown"; bet_type = "unknown"
-            match    = {"team1": "Неизвестно", "team2": "Неизвестно"}
+            match    = None
             coef = payout = 0.0
         else:
             match_id = parsed["match_id"]; bet_type = parsed["bet_type"]
-            match    = matches.get(match_id, {})
-            coef     = prizm_api.get_coef(match, bet_type)
+            match    = matches.get(match_id)
+            coef     = match.odd(bet_type) if match else 0.0
             payout   = round(amount * coef, 2) if coef > 0 else 0
 
         bet = {
             "id":       f"BET{int(time.time())}{added}",
             "tx_id":    tx_id,
             "match_id": match_id,
-            "team1":    match.get("team1", "Неизвестно"),
-            "team2":    match.get("team2", "Неизвестно"),
-            "league":   match.get("league", ""),
+            "team1":    match.team1 if match else "Неизвестно",
+            "team2":    match.team2 if match else "Неизвестно",
+            "league":   match.league if match else "",
             "bet_type": bet_type,
             "coef":     coef,
             "amount":   amount,
@@ -999,7 +1046,8 @@ async def check_prizm_transactions(bot=None):
             "time":     datetime.now().strftime("%d.%m.%Y %H:%M"),
         }
         bets.append(bet)
-        bet_ids.add(tx_id)
+        done.add(tx_id)
+        new_ids.append(tx_id)
         added += 1
         log.info(f"New bet: {bet['id']} {bet['team1']} {bet_type} {amount} PRIZM")
 
@@ -1012,7 +1060,7 @@ async def check_prizm_transactions(bot=None):
 
             match_line = (
                 f"🏆 {bet.get('league','')}\n"
-                f"📅 {match.get('date', '—')}\n"
+                f"📅 {match.date if match else '—'}\n"
                 f"⚽ {bet['team1']} — {bet['team2']}\n"
                 f"🎯 Тип: `{bet['bet_type']}`  Коэф: `×{bet['coef']}`\n\n"
             ) if parsed else ""
@@ -1044,12 +1092,17 @@ async def check_prizm_transactions(bot=None):
     if added:
         save_bets(bets)
         log.info(f"Saved {added} bets")
+    ledger.add(new_txs)
+    ledger.mark_processed(prizm_ledger.BETS, new_ids)
+    ledger.mark_processed(LEDGER_CONSUMER, (tx.get("transaction", "") for tx in new_txs))
+    cursor.commit(new_txs)
 
 
 async def poll_transactions_job(context: ContextTypes.DEFAULT_TYPE):
-    """Фоновая задача для проверки новых транзакций"""
+    """Фоновая задача: дешёвая проверка высоты, список транзакций — только на новом блоке"""
     try:
-        await check_prizm_transactions(context.bot)
+        if await block_watcher.due():
+            await check_prizm_transactions(context.bot)
     except Exception as e:
         log.error(f"Error in poll_transactions_job: {e}")
 
@@ -1089,13 +1142,17 @@ async def post_init(app: Application):
     except Exception as e:
         log.warning(f"Admin commands scope error: {e}")
         
-    # Запускаем фоновую проверку транзакций (каждые 60 секунд)
+    # Фоновая проверка: высота блокчейна каждые BLOCK_POLL_SEC, транзакции — на новом блоке
     if app.job_queue:
-        app.job_queue.run_repeating(poll_transactions_job, interval=60, first=10)
-        log.info("✅ Background transaction polling started (every 60s)")
+        app.job_queue.run_repeating(poll_transactions_job, interval=BLOCK_POLL_SEC, first=10)
+        log.info(f"✅ Background block watcher started (every {BLOCK_POLL_SEC}s, "
+                 f"full rescan every {prizm_api.RESCAN_SEC}s)")
     else:
         log.error("❌ JobQueue is disabled! Transactions won't be polled automatically.")
 
+    # История кошелька для /stats — один раз и в фоне, не в обработчике команды
+    start_ledger_backfill()
+
     log.info("✅ Bot commands registered in Telegram menu")
 
 # ══════════════════════════════════════════════════════════════
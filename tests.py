@@ -1,7 +1,48 @@
+import asyncio
+import datetime as dt
+import functools
+import http.server
+import glob
+import gzip
+import json
+import math
+import os
+import tempfile
+import threading
+import time
 import unittest
+import urllib.request
+import warnings
+from unittest import mock
+from bs4 import XMLParsedAsHTMLWarning
 from bet_parser import get_coef
+import bet_parser
 from prizm_api import prizm_amount
-from marathon_parser_real import parse_2way_winner
+import prizm_api
+import prizm_ledger
+import marathon_parser_real
+import bench_parser
+import browser_pool
+import live_odds
+import parser_daemon
+import publish
+import run_report
+from odds_history import OddsHistory
+from match_model import Match
+from sheets_sync import FakeWorksheet, SheetSync
+import text_norm
+from http_cache import HttpCache
+from marathon_parser_real import (
+    parse_2way_winner, parse_football_table, TokenBucket, AsyncFetcher, fetch_pages_async, parse_response,
+    Page, fetch_all, LeagueResult,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = sorted(glob.glob(os.path.join(HERE, "fixtures", "*.html")))
+
+def read_fixture(path):
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return f.read()
 
 class TestPrizmBet(unittest.TestCase):
     def test_get_coef_flat(self):
@@ -21,6 +62,43 @@ class TestPrizmBet(unittest.TestCase):
         match = {"id": "123", "p1": "1.70", "odds": {"1": 1.6}}
         self.assertEqual(get_coef(match, "П1"), 1.70)
 
+    def test_match_model_round_trip(self):
+        row = parse_football_table(read_fixture(FIXTURES[0]))[0]
+        m = Match.from_dict(row)
+        self.assertFalse(hasattr(m, "__dict__"))
+        self.assertEqual(m.to_dict(), row)
+        self.assertEqual(list(m.to_dict()), list(row))
+        legacy = Match.from_dict({"id": 7, "p1": "—", "odds": {"1": 1.6, "X": "3,5"}})
+        self.assertEqual(get_coef(legacy, "П1"), 1.6)
+        self.assertEqual(get_coef(legacy, "X"), 3.5)
+        self.assertEqual(get_coef(legacy, "П2"), 0.0)
+        self.assertEqual(legacy.to_dict()["p2"], "—")
+
+    def test_sheet_sync_pushes_only_diff(self):
+        headers = ["TX ID", "Статус", "Сумма"]
+        with tempfile.TemporaryDirectory() as tmp:
+            state = os.path.join(tmp, "state.json")
+            ws = FakeWorksheet(rows=3)
+            res = SheetSync(ws, headers, state).sync([["t1", "pending", 10], ["t2", "pending", 5.5]])
+            self.assertEqual(res[:3], (2, 0, 0))
+            self.assertEqual(ws.get_all_values(), [headers, ["t1", "pending", "10"], ["t2", "pending", "5.5"]])
+
+            ws.calls.clear()
+            sync = SheetSync(ws, headers, state)   # новый процесс: карта строк из файла, лист не читается
+            res = sync.sync([["t1", "pending", 10], ["t2", "win", 5.5], ["t3", "pending", 1]])
+            self.assertEqual((res.added, res.updated, res.cells, res.bootstrapped), (1, 1, 1, False))
+            self.assertEqual(ws.calls, ["add_rows", "batch_update"])
+            self.assertEqual(ws.cells[(3, 2)], "win")
+            self.assertEqual(ws.cells[(4, 1)], "t3")
+
+            ws.calls.clear()
+            self.assertEqual(SheetSync(ws, headers, state).sync([["t1", "pending", 10]])[:3], (0, 0, 0))
+            self.assertEqual(ws.calls, [])
+            # Потерянное состояние — одна сверка с листом, без дублей строк
+            res = SheetSync(ws, headers, None).sync([["t3", "loss", 1]])
+            self.assertEqual((res.added, res.cells, res.bootstrapped), (0, 1, True))
+            self.assertEqual(ws.cells[(4, 2)], "loss")
+
     def test_prizm_amount(self):
         # 1 PRIZM = 100 NQT (2 decimal places)
         tx = {"amountNQT": "100"}
@@ -49,5 +127,757 @@ class TestPrizmBet(unittest.TestCase):
         self.assertEqual(results[0]["p2"], "2.5")
         self.assertEqual(results[0]["x"], "—")
 
+    def test_token_bucket_paces_requests(self):
+        async def run():
+            bucket = TokenBucket(rate=50, burst=1)
+            t0 = time.monotonic()
+            for _ in range(5):
+                await bucket.acquire()
+            return time.monotonic() - t0
+        # первый токен сразу, остальные 4 — по 1/50 с
+        self.assertGreaterEqual(asyncio.run(run()), 0.07)
+
+    def test_async_fetcher_per_host_limit(self):
+        class FakeResponse:
+            status_code = 200
+            text = '<div class="coupon-row" data-event-id="1"></div>'
+            content = text.encode()
+            headers = {}
+            def raise_for_status(self): pass
+
+        class FakeSession:
+            def __init__(self):
+                self.active = self.peak = 0
+                self.lock = threading.Lock()
+            def get(self, url, timeout=None, headers=None):
+                with self.lock:
+                    self.active += 1
+                    self.peak = max(self.peak, self.active)
+                time.sleep(0.02)
+                with self.lock:
+                    self.active -= 1
+                return FakeResponse()
+            def close(self): pass
+
+        session = FakeSession()
+        fetcher = AsyncFetcher(per_host=2, rate=1000, burst=10, session=session)
+        targets = [("tennis", f"T{i}", f"https://example.test/{i}") for i in range(6)]
+        pages = asyncio.run(fetch_pages_async(targets, fetcher))
+        self.assertEqual(len(pages), 6)
+        self.assertTrue(all(p.error is None and p.html for p in pages))
+        self.assertEqual(session.peak, 2)
+
+    def test_http_cache_skips_parse(self):
+        html = """
+        <div class="coupon-row" data-event-id="77">
+            <div class="date">18:00</div>
+            <a class="member-link" href="/betting/77">Team A</a>
+            <a class="member-link" href="/betting/78">Team B</a>
+            <div class="selection-link" data-selection-key="Match_Result.1">1.80</div>
+            <div class="selection-link" data-selection-key="Match_Result.3">2.00</div>
+        </div>
+        """
+
+        class FakeResponse:
+            def __init__(self, status, body=b"", headers=None):
+                self.status_code, self.content, self.headers = status, body, headers or {}
+                self.text = body.decode("utf-8")
+
+        url = "https://example.test/tennis"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.json")
+            cache = HttpCache(path)
+            first = parse_response("tennis", "ATP", url, FakeResponse(200, html.encode(), {"ETag": '"v1"'}), cache)
+            self.assertEqual(cache.stats["miss"], 1)
+            cache.save()
+
+            cache = HttpCache(path)
+            self.assertEqual(cache.conditional_headers(url, "tennis|ATP"), {"If-None-Match": '"v1"'})
+            self.assertEqual(cache.conditional_headers(url, "tennis|WTA"), {})
+            self.assertEqual(parse_response("tennis", "ATP", url, FakeResponse(304), cache), first)
+            self.assertEqual(parse_response("tennis", "ATP", url, FakeResponse(200, html.encode()), cache), first)
+            self.assertEqual(cache.stats, {"not_modified": 1, "same_body": 1, "miss": 0})
+
+    def test_parser_backends_parity(self):
+        self.assertTrue(FIXTURES, "нет сохранённых страниц в fixtures/")
+        pages = [(os.path.basename(path), read_fixture(path)) for path in FIXTURES]
+        # Пограничные документы: bs4 разбирает их без ошибок, остальные бэкенды — тоже
+        pages += [("comment-only", "<!-- пустая страница -->"),
+                  ("xml-declaration", '<?xml version="1.0" encoding="utf-8"?>\n' + pages[0][1])]
+        self.enterContext(warnings.catch_warnings())
+        warnings.simplefilter("ignore", XMLParsedAsHTMLWarning)   # bs4 всё равно разбирает как HTML
+        for name, html in pages:
+            expected = (parse_football_table(html, "bs4"),
+                        [parse_2way_winner(html, sport, "bs4") for sport in ("tennis", "hockey", "basket")])
+            if name.endswith(".html"):
+                # страница без coupon-row сравнивала бы пустое с пустым
+                self.assertTrue(expected[0] or any(expected[1]), f"{name}: нет строк")
+            for backend in ("lxml", "stream"):
+                # мелкие куски — строки и h2 рвутся между feed() потокового бэкенда
+                with self.subTest(fixture=name, backend=backend), \
+                        mock.patch.object(marathon_parser_real, "STREAM_CHUNK", 1021):
+                    got = (parse_football_table(html, backend),
+                           [parse_2way_winner(html, sport, backend) for sport in ("tennis", "hockey", "basket")])
+                    self.assertEqual(got, expected)
+
+    def test_parse_football_fixture(self):
+        items = parse_football_table(read_fixture(os.path.join(HERE, "fixtures", "marathon_football.html")))
+        by_id = {m["id"]: m for m in items}
+        self.assertNotIn("27115900", by_id)  # одна команда — не матч
+        self.assertEqual(by_id["26994540"]["team1"], "Райо Вальекано")
+        self.assertEqual((by_id["26994540"]["date"], by_id["26994540"]["time"]), ("16 мар", "23:00"))
+        self.assertEqual(by_id["26994540"]["p1"], "1.73")
+        self.assertEqual(by_id["27200001"]["league"], "Испания. Сегунда")
+        self.assertEqual(by_id["26000001"]["league"], "")    # секция "Итоги"
+        self.assertEqual(by_id["27115826"]["p2"], "1234.5")  # без научной нотации
+
+    def test_nested_category_container_nearest_h2_wins(self):
+        html = """
+        <div class="category-container"><a class="category-label-link"><h2>Италия.Серия A</h2></a>
+          <div class="coupon-row" data-event-treeId="1"><a class="member-link">A</a><a class="member-link">B</a></div>
+          <section class="category-container"><h2>Италия.Серия B.Тур 5</h2>
+            <div class="coupon-row" data-event-treeId="2"><a class="member-link">C</a><a class="member-link">D</a></div>
+          </section>
+          <section class="category-container">
+            <div class="coupon-row" data-event-treeId="3"><a class="member-link">E</a><a class="member-link">F</a></div>
+          </section>
+        </div>
+        """
+        for backend in ("bs4", "lxml", "stream"):
+            leagues = [m["league"] for m in parse_football_table(html, backend)]
+            self.assertEqual(leagues, ["Италия. Серия A", "Италия. Серия B", "Италия. Серия A"], backend)
+
+    def test_text_norm_memoized(self):
+        text_norm.cache_clear()
+        for _ in range(3):
+            self.assertEqual(text_norm.clean_name("Спартак (Первый матч 1:0)"), "Спартак")
+            self.assertEqual(text_norm.normalize_h2_league("Англия.Премьер-лига.Тур 30"), "Англия. Премьер-лига")
+        st = text_norm.cache_stats()
+        self.assertEqual((st["clean_name"]["hits"], st["clean_name"]["misses"]), (2, 1))
+        self.assertEqual((st["normalize_h2_league"]["hits"], st["normalize_h2_league"]["misses"]), (2, 1))
+
+    def test_parse_ru_date_year_rollover(self):
+        self.assertEqual(text_norm.parse_ru_date("28 мар", dt.date(2026, 3, 1)), dt.date(2026, 3, 28))
+        self.assertEqual(text_norm.parse_ru_date("5 янв", dt.date(2026, 12, 20)), dt.date(2027, 1, 5))
+        self.assertIsNone(text_norm.parse_ru_date("", dt.date(2026, 3, 1)))
+        self.assertIsNone(text_norm.parse_ru_date("Сегодня", dt.date(2026, 3, 1)))
+
+    def test_kickoff_ts_msk_to_utc_and_filter(self):
+        today = dt.date(2026, 3, 1)
+        utc = lambda *a: int(dt.datetime(*a, tzinfo=dt.timezone.utc).timestamp())
+        self.assertEqual(text_norm.kickoff_ts("16 мар", "23:00", today), utc(2026, 3, 16, 20, 0))
+        self.assertEqual(text_norm.kickoff_ts("", "02:30", today), utc(2026, 2, 28, 23, 30))
+        self.assertEqual(text_norm.kickoff_ts("5 янв", "12:00", dt.date(2026, 12, 20)), utc(2027, 1, 5, 9, 0))
+        self.assertIsNone(text_norm.kickoff_ts("16 мар", "", today))
+        self.assertIsNone(text_norm.kickoff_ts("Сегодня", "12:00", today))
+        league = next(iter(marathon_parser_real.ALLOWED_FOOTBALL_LEAGUES))
+        near, far, edge, unknown = (
+            Match("football", league, str(i), d, "12:00", "A", "B",
+                  kickoff_ts=text_norm.kickoff_ts(d, t, today))
+            for i, (d, t) in enumerate((("3 мар", "12:00"), ("20 мар", "12:00"), ("15 мар", "23:59"), ("", ""))))
+        kept = marathon_parser_real.select_matches([near, far, edge, unknown], today)
+        self.assertEqual([m.id for m in kept], [near.id, edge.id, unknown.id])
+
+    def test_process_pool_parse_stage_matches_inline(self):
+        football = read_fixture(os.path.join(HERE, "fixtures", "marathon_football.html"))
+        two_way = read_fixture(os.path.join(HERE, "fixtures", "marathon_2way.html"))
+        pages = [
+            Page("football", "Испания. Ла Лига", "u1", html=football),
+            Page("tennis", "ATP", "u2", html=two_way),
+            Page("basket", "NBA", "u3", items=[{"id": "cached"}]),
+            Page("hockey", "КХЛ", "u4", error="403 Forbidden"),
+        ]
+        with mock.patch.object(marathon_parser_real, "iter_pages", lambda *a, **kw: iter(pages)):
+            inline = {r.title: r for r in fetch_all([], parse_workers=0)}
+            pooled = {r.title: r for r in fetch_all([], parse_workers=2)}
+        # время разбора у режимов своё — сравниваем сами итоги
+        self.assertEqual({t: r[:4] for t, r in inline.items()}, {t: r[:4] for t, r in pooled.items()})
+        self.assertGreater(pooled["ATP"].parse_s, 0)
+        self.assertEqual(inline["NBA"].items, [{"id": "cached"}])
+        self.assertEqual(inline["КХЛ"].error, "403 Forbidden")
+        self.assertEqual(len(inline["Испания. Ла Лига"].items), 8)
+
+    def test_duplicate_pages_skipped_before_parse(self):
+        class FakeResponse:
+            status_code = 200
+            def __init__(self, body):
+                self.content, self.text, self.headers = body.encode(), body, {}
+
+        base = read_fixture(os.path.join(HERE, "fixtures", "marathon_2way.html"))
+        same_events = base.replace("<title>Теннис. ATP</title>", "<title>Теннис. WTA</title>")
+        pages = [
+            marathon_parser_real.page_from_response("tennis", "ATP", "u1", FakeResponse(base)),
+            marathon_parser_real.page_from_response("tennis", "ATP копия", "u2", FakeResponse(base)),
+            marathon_parser_real.page_from_response("tennis", "WTA", "u3", FakeResponse(same_events)),
+        ]
+        with mock.patch.object(marathon_parser_real, "iter_pages", lambda *a, **kw: iter(pages)), \
+             mock.patch.object(marathon_parser_real, "parse_page", wraps=marathon_parser_real.parse_page) as parse:
+            res = {r.title: r for r in fetch_all([], parse_workers=0)}
+            self.assertEqual(parse.call_count, 1)
+        self.assertEqual(len(res["ATP"].items), 5)
+        self.assertEqual((res["ATP копия"].items, res["ATP копия"].duplicate_of), ([], "ATP"))
+        self.assertEqual(res["WTA"].duplicate_of, "ATP")
+
+        by_body_only = marathon_parser_real.PageDeduper(by_event_ids=False)
+        self.assertIsNone(by_body_only.duplicate_of(pages[0]))
+        self.assertEqual(by_body_only.duplicate_of(pages[1]), "ATP")
+        self.assertIsNone(by_body_only.duplicate_of(pages[2]))
+        # Демон держит дедупликатор между циклами: своя прошлая страница — не дубль, старые ключи лиги уходят
+        self.assertIsNone(by_body_only.duplicate_of(pages[0]))
+        self.assertEqual(by_body_only.duplicate_of(pages[1]), "ATP")
+        changed = marathon_parser_real.page_from_response("tennis", "ATP", "u1", FakeResponse(same_events))
+        self.assertEqual(by_body_only.duplicate_of(changed), "WTA")
+        self.assertIsNone(by_body_only.duplicate_of(pages[1]))   # ATP теперь дубль — копия разбирается сама
+
+    def test_publish_delta_versions(self):
+        m1 = {"id": "1", "team1": "A", "team2": "B", "p1": "1.5", "p2": "2.5"}
+        m2 = {"id": "2", "team1": "C", "team2": "D", "p1": "1.9", "p2": "1.9"}
+        m3 = {"id": "3", "team1": "E", "team2": "F", "p1": "3.0", "p2": "1.3"}
+        with tempfile.TemporaryDirectory() as tmp:
+            out, delta_path = os.path.join(tmp, "matches.json"), os.path.join(tmp, "matches.delta.json")
+            self.assertEqual(publish.publish_matches([m1, m2], out, delta_path)["version"], 1)
+            self.assertFalse(os.path.exists(delta_path))  # нет базы — нет дельты
+
+            payload = publish.publish_matches([dict(m1, p1="1.45"), m3], out, delta_path)
+            self.assertEqual(payload["version"], 2)
+            with open(delta_path, encoding="utf-8") as f:
+                delta = json.load(f)
+            self.assertEqual((delta["base_version"], delta["version"]), (1, 2))
+            self.assertEqual(delta["added"], [m3])
+            self.assertEqual(delta["removed"], ["2"])
+            self.assertEqual(delta["changed"], [{"id": "1", "p1": "1.45"}])
+
+            # без изменений версия не растёт, прежняя дельта остаётся
+            self.assertEqual(publish.publish_matches([dict(m1, p1="1.45"), m3], out, delta_path)["version"], 2)
+            with open(delta_path, encoding="utf-8") as f:
+                self.assertEqual(json.load(f)["version"], 2)
+
+    def test_publish_shards_manifest(self):
+        foot = {"id": "1", "sport": "football", "league": "Испания. Ла Лига", "p1": "1.5"}
+        hock = {"id": "2", "sport": "hockey", "league": "КХЛ", "p1": "2.1"}
+        with tempfile.TemporaryDirectory() as tmp:
+            first = publish.publish_shards([foot, hock], tmp, version=1)
+            files = {e["sport"]: e["file"] for e in first["shards"]}
+            self.assertEqual({e["sport"]: e["count"] for e in first["shards"]}, {"football": 1, "hockey": 1})
+            with open(os.path.join(tmp, files["hockey"]), encoding="utf-8") as f:
+                self.assertEqual(json.load(f)["matches"], [hock])
+
+            # меняется только хоккей: футбольный шард сохраняет имя, старый хоккейный удалён
+            second = publish.publish_shards([foot, dict(hock, p1="2.2")], tmp, version=2)
+            files2 = {e["sport"]: e["file"] for e in second["shards"]}
+            self.assertEqual(files2["football"], files["football"])
+            self.assertNotEqual(files2["hockey"], files["hockey"])
+            self.assertEqual(sorted(os.listdir(tmp)), sorted([*files2.values(), "manifest.json"]))
+
+            by_league = publish.publish_shards([foot, hock], tmp, by_league=True)
+            self.assertEqual({e["league"] for e in by_league["shards"]}, {"Испания. Ла Лига", "КХЛ"})
+
+    def test_json_artifacts_minified_and_compressed(self):
+        data = {"matches": [{"team2": "Б", "id": "1", "p1": "1.5"}], "last_update": "2026-01-01 00:00:00"}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "matches.json")
+            sizes = publish.save_with_artifacts(path, data)
+            with open(os.path.join(tmp, "matches.min.json"), "rb") as f:
+                raw = f.read()
+            self.assertEqual(raw, json.dumps(data, ensure_ascii=False, separators=(",", ":"),
+                                             sort_keys=True).encode("utf-8"))
+            with open(os.path.join(tmp, "matches.min.json.gz"), "rb") as f:
+                gz = f.read()
+            self.assertEqual(gzip.decompress(gz), raw)
+            self.assertEqual(sizes["min"], len(raw))
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual("br" in sizes, publish.brotli is not None)
+
+            # те же данные в другом порядке ключей — те же байты
+            publish.write_artifacts(path, {"last_update": data["last_update"], "matches": data["matches"]})
+            with open(os.path.join(tmp, "matches.min.json.gz"), "rb") as f:
+                self.assertEqual(f.read(), gz)
+
+    def test_odds_history_appends_only_changes(self):
+        base = {"id": "26994532", "sport": "football", "league": "Испания. Ла Лига",
+                "team1": "A", "team2": "B", "p1": "1.93", "x": "3.62", "p2": "4.2",
+                "p1x": "1.26", "p12": "1.32", "px2": "1.93"}
+        other = {"id": "27000001", "sport": "hockey", "league": "КХЛ", "p1": "2.1", "x": "—", "p2": "1.8"}
+        t0 = int(dt.datetime(2026, 3, 31, 23, 0, tzinfo=dt.timezone.utc).timestamp())
+        with tempfile.TemporaryDirectory() as tmp:
+            hist = OddsHistory(tmp)
+            self.assertEqual(hist.append_run([base, other], ts=t0), 2)
+            self.assertEqual(hist.append_run([base, other], ts=t0 + 900), 0)   # линия не двигалась
+            self.assertEqual(hist.append_run([dict(base, p1="1.85"), other], ts=t0 + 7200), 1)  # уже апрель
+
+            self.assertEqual(sorted(os.listdir(tmp)), ["2026-03.bin", "2026-04.bin", "events.json"])
+            line = OddsHistory(tmp).event_line("26994532", since=t0 - 1, until=t0 + 10000)
+            self.assertEqual(list(line["ts"]), [t0, t0 + 7200])
+            self.assertEqual([round(v, 2) for v in line["p1"]], [1.93, 1.85])
+
+            hockey = OddsHistory(tmp).league_lines("КХЛ", since=t0, until=t0 + 10000)
+            self.assertEqual(list(hockey), ["27000001"])
+            self.assertTrue(math.isnan(hockey["27000001"]["x"][0]))
+            self.assertEqual(OddsHistory(tmp).league_lines("КХЛ", since=t0 + 1, until=t0 + 10000), {})
+
+            # Индекс не растёт бесконечно: линия без движения INDEX_KEEP_DAYS — событие уходит из него
+            hist = OddsHistory(tmp)
+            self.assertEqual(hist.append_run([dict(base, p1="1.80")], ts=t0 + 15 * 86400), 1)
+            self.assertEqual(sorted(OddsHistory(tmp).index), ["26994532"])
+            self.assertEqual(len(OddsHistory(tmp).event_line("27000001", since=t0, until=t0 + 10)["ts"]), 1)
+
+    def test_daemon_refresh_interval_tiers(self):
+        now = dt.datetime(2026, 3, 10, 12, 0, tzinfo=text_norm.MSK)
+        soon = {"date": "", "time": "14:00"}
+        tomorrow = {"date": "11 мар", "time": "12:00"}
+        far = {"date": "20 мар", "time": "12:00"}
+        self.assertEqual(parser_daemon.refresh_interval([far, soon], now), 5 * 60)
+        self.assertEqual(parser_daemon.refresh_interval([tomorrow, far], now), 15 * 60)
+        self.assertEqual(parser_daemon.refresh_interval([far], now), parser_daemon.IDLE_INTERVAL)
+        self.assertEqual(parser_daemon.refresh_interval([], now), parser_daemon.IDLE_INTERVAL)
+
+    def test_daemon_scheduler_budget_and_errors(self):
+        clock = [1000.0]
+        targets = [("football", f"L{i}", f"http://x/{i}") for i in range(3)]
+        sched = parser_daemon.AdaptiveScheduler(targets, budget_per_hour=1, clock=lambda: clock[0])
+        self.assertEqual(len(sched.due()), 3)            # первый цикл — всплеск на все лиги
+        sched.update(LeagueResult("L0", [{"id": "1", "date": "", "time": "23:59"}]))
+        sched.update(LeagueResult("L1", [], "403"))
+        sched.update(LeagueResult("L2", [], duplicate_of="L0"))
+        self.assertEqual(sched.leagues["L1"].interval, parser_daemon.ERROR_INTERVAL)
+        self.assertEqual([m["id"] for m in sched.matches()], ["1"])
+
+        clock[0] += parser_daemon.ERROR_INTERVAL + 1
+        self.assertEqual(sched.due(), [])                # L1 просрочена, но бюджет исчерпан
+        sched.budget._tokens = 1
+        self.assertEqual([t[1] for t in sched.due()], ["L1"])
+        sched.update(LeagueResult("L1", [], "timeout"))
+        self.assertEqual([m["id"] for m in sched.matches()], ["1"])  # ошибка не стирает прошлые матчи
+
+    def test_parse_2way_include_live(self):
+        html = read_fixture(os.path.join(HERE, "fixtures", "marathon_2way.html"))
+        ids = [m["id"] for m in parse_2way_winner(html, "tennis")]
+        live = {m["id"]: m for m in parse_2way_winner(html, "tennis", include_live=True)}
+        self.assertNotIn("90000001", ids)
+        self.assertEqual(set(live) - set(ids), {"90000001"})
+        self.assertEqual((live["90000001"]["match_url"], live["90000001"]["p1"]), ("", "1.4"))
+
+    def test_live_sse_snapshot_then_delta(self):
+        state, hub = live_odds.LiveState(), live_odds.SSEHub()
+        m = {"id": "1", "p1": "1.5", "p2": "2.5"}
+        self.assertIsNotNone(state.update("Live", [m]))
+        self.assertIsNone(state.update("Live", [dict(m)]))     # линия не двигалась — рассылать нечего
+
+        server = live_odds.LiveServer(("127.0.0.1", 0), live_odds.make_handler(state, hub))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            resp = urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/events", timeout=5)
+
+            def read_event():
+                lines = []
+                while (line := resp.readline().decode("utf-8").strip()) or not lines:
+                    if line:
+                        lines.append(line)
+                fields = dict(l.split(": ", 1) for l in lines)
+                return fields["event"], json.loads(fields["data"])
+
+            self.assertEqual(read_event(), ("snapshot", {"matches": [m]}))
+            hub.publish("delta", state.update("Live", [dict(m, p1="1.45")]))
+            self.assertEqual(read_event(), ("delta", {"added": [], "removed": [],
+                                                      "changed": [{"id": "1", "p1": "1.45"}]}))
+            resp.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_bench_synthetic_page_parses_on_all_backends(self):
+        html = bench_parser.synthetic_page(120, per_league=50)
+        results = {b: bench_parser.parse("football", html, b) for b in marathon_parser_real._ROW_BACKENDS}
+        for backend, items in results.items():
+            with self.subTest(backend=backend):
+                self.assertEqual(len(items), 120)
+                self.assertEqual(items, results["bs4"])
+        self.assertEqual(results["bs4"][0].league, "Страна 0. Лига 0")
+        self.assertEqual(bench_parser.percentile([3, 1, 2], 50), 2)
+        # Страница корпуса без строк мерила бы разбор пустоты
+        for name, sport, html in bench_parser.load_corpus(0):
+            with self.subTest(page=name):
+                self.assertTrue(bench_parser.parse(sport, html, "bs4"))
+
+    def test_run_report_league_metrics(self):
+        class FakeResponse:
+            def __init__(self, status, body=""):
+                self.status_code, self.content, self.text, self.headers = status, body.encode(), body, {}
+            def raise_for_status(self):
+                pass
+
+        html = read_fixture(os.path.join(HERE, "fixtures", "marathon_football.html"))
+        responses = {"u1": [FakeResponse(200, html)], "u2": [FakeResponse(403)] * 3}
+
+        class FakeSession:
+            def get(self, url, timeout=None, headers=None):
+                return responses[url].pop(0)
+
+        targets = [("football", "Испания. Ла Лига", "u1"), ("hockey", "КХЛ", "u2")]
+        with mock.patch.object(marathon_parser_real, "_get_session", lambda: FakeSession()), \
+                mock.patch.object(marathon_parser_real.time, "sleep", lambda s: None):
+            report = run_report.RunReport("sweep")
+            with report.stage("fetch_parse"):
+                for res in fetch_all(targets, engine="thread", parse_workers=0):
+                    report.add_league(res)
+        kept = [m for r in report._results for m in r.items][:3]
+        record = report.finish(kept)
+        leagues = {l["title"]: l for l in record["leagues"]}
+
+        self.assertEqual((leagues["Испания. Ла Лига"]["status"], leagues["Испания. Ла Лига"]["bytes"]),
+                         (200, len(html.encode())))
+        self.assertEqual((leagues["Испания. Ла Лига"]["rows_seen"], leagues["Испания. Ла Лига"]["rows_kept"]), (8, 3))
+        self.assertGreater(leagues["Испания. Ла Лига"]["parse_s"], 0)
+        self.assertEqual((leagues["КХЛ"]["status"], leagues["КХЛ"]["retries"]), (403, 2))
+        self.assertEqual((record["rows_seen"], record["rows_kept"], record["errors"]), (8, 3, 1))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run_report.jsonl")
+            report.write(path)
+            report.write(path)
+            self.assertEqual([r["rows_kept"] for r in run_report.read_reports(path)], [3, 3])
+
+    def test_browser_fallback_only_for_403_and_skeletons(self):
+        from concurrent.futures import Future
+        football = read_fixture(FIXTURES[0])
+        submitted = []
+
+        class FakePool:
+            html = football
+
+            def submit(self, url):
+                submitted.append(url)
+                f = Future()
+                f.set_result(browser_pool.Rendered(url, self.html, 200, 0.5))
+                return f
+
+        pages = [
+            Page("football", "OK", "u1", html=football, status=200),
+            Page("football", "Blocked", "u2", error="403 Forbidden", status=403, fetch_s=1.0),
+            Page("football", "Skeleton", "u3", html="<html><div id='app'></div></html>", status=200),
+            Page("football", "Missing", "u4", error="404 Not Found", status=404),
+        ]
+        out = {p.title: p for p in marathon_parser_real.with_browser_fallback(pages, FakePool())}
+        self.assertEqual(submitted, ["u2", "u3"])
+        self.assertIs(out["OK"], pages[0])
+        self.assertEqual(out["Missing"], pages[3])
+        for title in ("Blocked", "Skeleton"):
+            page = out[title]
+            self.assertTrue(page.rendered)
+            self.assertIsNone(page.error)
+            self.assertEqual(page.html, football)
+            self.assertTrue(page.digest and page.event_fp)
+        self.assertEqual(out["Blocked"].fetch_s, 1.5)
+
+        # Пустая лига: и браузер не нашёл строк — следующий прогон её в браузер не шлёт, заглушку шлёт
+        FakePool.html = "<html><div class='category-container'></div></html>"
+        submitted.clear()
+        empty = Page("football", "Empty", "u5", html="<html><div id='app'></div></html>", status=200)
+        challenge = Page("football", "Challenge", "u6", html="<div id='challenge-platform'></div>", status=200)
+        with mock.patch.dict(marathon_parser_real._empty_pages, clear=True):
+            list(marathon_parser_real.with_browser_fallback([empty], FakePool()))
+            list(marathon_parser_real.with_browser_fallback([empty, challenge], FakePool()))
+            list(marathon_parser_real.with_browser_fallback([challenge], FakePool()))
+        self.assertEqual(submitted, ["u5", "u6", "u6"])
+
+    @unittest.skipUnless(browser_pool.browser_available(), "нет playwright/Chromium")
+    def test_browser_pool_renders_fixtures_and_recycles(self):
+        handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=os.path.join(HERE, "fixtures"))
+        handler.log_message = lambda *a: None
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with browser_pool.BrowserPool(tabs=2, recycle_after=2, timeout=10) as pool:
+                futures = [pool.submit(f"http://127.0.0.1:{server.server_port}/{os.path.basename(p)}")
+                           for p in FIXTURES * 2]
+                for path, future in zip(FIXTURES * 2, futures):
+                    rendered = future.result(30)
+                    self.assertEqual(rendered.status, 200)
+                    expected = [m["id"] for m in parse_football_table(read_fixture(path))]
+                    self.assertEqual([m["id"] for m in parse_football_table(rendered.html)], expected)
+                self.assertEqual(pool.stats["pages"], len(futures))
+                self.assertGreaterEqual(pool.stats["recycled"], 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_prizm_client_async_keepalive_and_failover(self):
+        connections = []
+
+        class Node(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                connections.append(self.client_address)
+
+            def log_message(self, *a):
+                pass
+
+            def do_GET(self):
+                if "getAccount" in self.path:
+                    body = {"balanceNQT": "150050", "unconfirmedBalanceNQT": "150000"}
+                else:
+                    body = {"transactions": [{"transaction": "1", "timestamp": 5}]}
+                raw = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Node)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        node = f"http://127.0.0.1:{server.server_port}"
+        try:
+            with mock.patch.object(prizm_api, "PRIZM_NODES", ["http://127.0.0.1:1", node]), \
+                    mock.patch.object(prizm_api, "HEALTH", prizm_api.NodeHealth()):
+                client = prizm_api.PrizmClient(session=prizm_api._new_session(pool_size=1), max_concurrency=1)
+
+                async def run():
+                    return await asyncio.gather(client.get_balance(), client.get_transactions(),
+                                                client.get_account())
+
+                balance, txs, account = asyncio.run(run())
+                self.assertEqual(balance, {"balance": 1500.5, "unconfirmed": 1500.0,
+                                           "wallet": prizm_api.WALLET, "node": node})
+                self.assertEqual(txs, [{"transaction": "1", "timestamp": 5}])
+                self.assertEqual(account["balanceNQT"], "150050")
+                self.assertEqual(len(connections), 1)   # три запроса — одно соединение
+                # Синхронный фасад (bet_parser) — тот же разбор ответа
+                self.assertEqual(prizm_api.get_balance()["balance"], 1500.5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_prizm_hedged_call_prefers_healthy_node(self):
+        def start_node(delay=0.0, body=None):
+            class Node(http.server.BaseHTTPRequestHandler):
+                protocol_version = "HTTP/1.1"
+
+                def log_message(self, *a):
+                    pass
+
+                def do_GET(self):
+                    time.sleep(delay)
+                    raw = json.dumps(body).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(raw)))
+                    self.end_headers()
+                    self.wfile.write(raw)
+
+            server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Node)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            return server, f"http://127.0.0.1:{server.server_port}"
+
+        fresh = {"transactions": [{"transaction": "2", "height": 100, "confirmations": 5}]}
+        stale = {"transactions": [{"transaction": "1", "height": 90, "confirmations": 2}]}
+        servers = [start_node(delay=1.5, body=fresh), start_node(body=fresh),
+                   start_node(body={"errorCode": 5, "errorDescription": "Unknown account"}),
+                   start_node(body=stale)]
+        slow, fast, broken, behind = (url for _, url in servers)
+        health = prizm_api.NodeHealth()
+        try:
+            with mock.patch.object(prizm_api, "HEALTH", health), \
+                    mock.patch.object(prizm_api, "HEDGE_DEFAULT", 0.2):
+                # Медленная нода первая: через 0.2 с хедж на быструю, ждать 1.5 с не нужно
+                with mock.patch.object(prizm_api, "PRIZM_NODES", [slow, fast]):
+                    t0 = time.monotonic()
+                    data, node = prizm_api._call({"requestType": "getBlockchainTransactions"})
+                    self.assertLess(time.monotonic() - t0, 1.0)
+                    self.assertEqual((data, node), (fresh, fast))
+                    self.assertEqual(health.best_height, 105)
+                    # Быстрая с замерами теперь впереди медленной без замеров
+                    self.assertEqual(health.ranked([slow, fast]), [fast, slow])
+            # errorCode и отставшая высота — ответ не принят, нода понижена
+            health = prizm_api.NodeHealth()
+            health.best_height = 105   # высота уже известна по другим нодам
+            with mock.patch.object(prizm_api, "HEALTH", health), \
+                    mock.patch.object(prizm_api, "PRIZM_NODES", [broken, behind, fast]):
+                self.assertEqual(prizm_api._call({"requestType": "getBlockchainTransactions"}),
+                                 (fresh, fast))
+                self.assertEqual(health.ranked([broken, behind, fast]), [fast, broken, behind])
+                snap = health.snapshot()
+                self.assertIn("errorCode 5", snap[broken]["last_error"])
+                self.assertTrue(snap[behind]["demoted"])
+        finally:
+            for server, _ in servers:
+                server.shutdown()
+                server.server_close()
+
+    def test_tx_cursor_pages_through_bursts_exactly_once(self):
+        def tx(n, ts):
+            return {"transaction": str(n), "timestamp": ts}
+
+        chain = [tx(n, 1000 + n // 3) for n in range(1, 51)][::-1]   # новые первыми, по 3 в секунду
+
+        def fetch(first, last):
+            return chain[first:last + 1]
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "cursor.json")
+            cursor = prizm_api.TxCursor(path)
+            boot = prizm_api._collect_new(fetch, cursor, page_size=10)
+            self.assertEqual([t["transaction"] for t in boot], [str(n) for n in range(41, 51)])
+            cursor.commit(boot)
+
+            # Всплеск в 250 транзакций между опросами: листается 26 страниц, ничего не теряется
+            chain[:0] = [tx(n, 1000 + n // 3) for n in range(51, 301)][::-1]
+            # Узел отдал ту же секунду в другом порядке: 51 пришла после курсора (50)
+            chain.remove(tx(51, 1017))
+            chain.insert(chain.index(tx(50, 1016)) + 1, tx(51, 1016))
+            pages = []
+            burst = prizm_api._collect_new(lambda a, b: pages.append(a) or fetch(a, b), cursor, page_size=10)
+            self.assertEqual(sorted(int(t["transaction"]) for t in burst), list(range(51, 301)))
+            self.assertEqual(len(pages), 26)
+
+            # Нода упала на второй странице — пусто, курсор стоит, следующий опрос повторит
+            chain[:0] = [tx(n, 1200) for n in range(301, 321)][::-1]
+            cursor.commit(burst)
+            calls = []
+            flaky = lambda a, b: None if calls.append(a) or a else fetch(a, b)
+            self.assertEqual(prizm_api._collect_new(flaky, cursor, page_size=10), [])
+            self.assertEqual(cursor.last_id, "300")
+
+            # Курсор пережил перезапуск; новая транзакция во время листания сдвигает страницы — без повторов
+            cursor = prizm_api.TxCursor(path)
+            def shifting(first, last):
+                if first == 10:
+                    chain.insert(0, tx(321, 1201))
+                return fetch(first, last)
+            again = prizm_api._collect_new(shifting, cursor, page_size=10)
+            self.assertEqual([t["transaction"] for t in again], [str(n) for n in range(301, 321)])
+            cursor.commit(again)
+            self.assertEqual([t["transaction"] for t in prizm_api._collect_new(fetch, cursor, page_size=10)],
+                             ["321"])
+
+            # Старый формат {"last_ts": ...}: всё не новее last_ts уже обработано
+            with open(path, "w") as f:
+                json.dump({"last_ts": 1199}, f)
+            legacy = prizm_api._collect_new(fetch, prizm_api.TxCursor(path), page_size=10)
+            self.assertEqual(len(legacy), 21)
+
+    def test_tx_cursor_bounded_by_height_not_timestamp(self):
+        def tx(n, height, ts):
+            return {"transaction": str(n), "height": height, "timestamp": ts}
+
+        # Блоки по 2 транзакции; цепочка — новые блоки первыми
+        chain = [tx(n, n // 2, 10_000 + 60 * n) for n in range(1, 41)][::-1]
+
+        def fetch(first, last):
+            pages.append(first)
+            return chain[first:last + 1]
+
+        with tempfile.TemporaryDirectory() as d:
+            cursor = prizm_api.TxCursor(os.path.join(d, "cursor.json"))
+            pages = []
+            cursor.commit(prizm_api._collect_new(fetch, cursor, page_size=50))   # первый запуск — вся цепочка
+            self.assertEqual((cursor.last_id, cursor.last_height), ("40", 20))
+
+            # Транзакция создана давно (задержка в мемпуле, часы отправителя), подтверждена в новом блоке;
+            # за ней по цепочке — ещё новые. Время меньше last_ts на сутки — листание не обрывается
+            late = tx(41, 21, 10_000 + 60 * 40 - 86400)
+            chain[:0] = [tx(43, 22, 12_500), tx(42, 21, 12_450), late]
+            pages = []
+            got = prizm_api._collect_new(fetch, cursor, page_size=10)
+            self.assertEqual(sorted(t["transaction"] for t in got), ["41", "42", "43"])
+            self.assertEqual(pages, [0])   # дальше блока курсора не листали
+            cursor.commit(got)
+            self.assertEqual(cursor.last_height, 22)
+
+            # Блок курсора откатился (его транзакций в цепочке нет): не глубже REORG_BLOCKS
+            del chain[:3]
+            chain[:0] = [tx(44, 21, 12_600)]
+            pages = []
+            got = prizm_api._collect_new(fetch, cursor, page_size=10)
+            self.assertEqual([t["transaction"] for t in got], ["44"])
+            self.assertEqual(pages, [0, 10])   # до высоты 22 - 10 = 12, а не вся история
+
+    def test_ledger_stores_once_and_answers_locally(self):
+        wallet = prizm_api.WALLET
+
+        def tx(n, sender, recipient, nqt, ts, message=""):
+            t = {"transaction": str(n), "timestamp": ts, "senderRS": sender, "recipientRS": recipient,
+                 "amountNQT": str(nqt), "feeNQT": "5"}
+            if message:
+                t["attachment"] = {"message": message, "messageIsText": True}
+            return t
+
+        history = [tx(n, f"PRIZM-U{n % 3}", wallet, 100 * n, 86400 * (n // 10) + n) for n in range(1, 26)]
+        history.append(tx(26, wallet, "PRIZM-U1", 500, 86400 * 2 + 30))
+        history = history[::-1]
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "ledger.sqlite3")
+            with prizm_ledger.Ledger(path) as ledger:
+                self.assertEqual(ledger.db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+                # Догрузка: страницы до конца истории, флаг только после последней
+                self.assertEqual(ledger.backfill(lambda a, b: None, page_size=10), 0)
+                self.assertFalse(ledger.backfilled)
+                self.assertEqual(ledger.backfill(lambda a, b: history[a:b + 1], page_size=10), 26)
+                self.assertTrue(ledger.backfilled)
+                self.assertEqual(ledger.add(history[:5]), 0)   # повтор не двоит ни строки, ни итоги
+                totals = ledger.totals()
+                self.assertEqual(totals["in"], (25, sum(range(1, 26))))
+                self.assertEqual(totals["out"], (1, 5.0))
+                self.assertEqual(ledger.totals(since_ts=86400 * 2)["in"], (6, sum(range(20, 26))))
+                self.assertEqual([t["transaction"] for t in ledger.history("PRIZM-U1", limit=3)],
+                                 ["26", "25", "22"])
+                self.assertEqual(ledger.known(["3", "99"]), {"3"})
+                plan = ledger.db.execute("EXPLAIN QUERY PLAN SELECT raw FROM txs WHERE sender = ? "
+                                         "ORDER BY ts DESC", ("x",)).fetchall()
+                self.assertIn("txs_sender", str(plan))
+
+            # Повторное открытие: данные на месте, отметки «обработано» — по потребителю
+            with prizm_ledger.Ledger(path) as ledger:
+                self.assertEqual(ledger.count(), 26)
+                self.assertTrue(ledger.seed(prizm_ledger.BETS, ["1", "2"]))
+                self.assertFalse(ledger.seed(prizm_ledger.BETS, ["3"]))   # перенос — один раз
+                self.assertEqual(ledger.processed(prizm_ledger.BETS, ["1", "2", "3"]), {"1", "2"})
+                self.assertEqual(ledger.processed("bot", ["1"]), set())
+                ledger.mark_processed("bot", ["3"])
+                self.assertEqual(ledger.processed(("bot", prizm_ledger.BETS), ["1", "3", "4"]), {"1", "3"})
+
+                # bet_parser: ставка из новой транзакции, обработанные пропускаются по реестру
+                bet_tx = tx(27, "PRIZM-U0", wallet, 1000, 86400 * 3, message="777 П1 10")
+                txs = [bet_tx, tx(1, "PRIZM-U1", wallet, 100, 0, message="777 П1 10")]
+                ledger.add(txs)
+                matches = {"777": Match("football", "РПЛ", "777", "", "", "A", "B", p1=2.0)}
+                new = bet_parser.process_transactions(txs, matches, ledger)
+                self.assertEqual([b["tx_id"] for b in new], ["27"])
+                self.assertEqual(new[0]["potential_win"], 20.0)
+                ledger.mark_processed(prizm_ledger.BETS, [b["tx_id"] for b in new])
+                self.assertEqual(bet_parser.process_transactions(txs, matches, ledger), [])
+
+                # Бот принял ставку уже после переноса: отметка общего потребителя, bets.json не читается
+                bot_tx = tx(28, "PRIZM-U2", wallet, 500, 86400 * 3 + 60, message="777 П1 5")
+                ledger.add([bot_tx])
+                ledger.mark_processed(prizm_ledger.BETS, ["28"])
+                self.assertEqual(bet_parser.process_transactions([bot_tx] + txs, matches, ledger), [])
+
+    def test_block_watcher_scans_only_on_new_block(self):
+        class Client:
+            heights = [100, 100, 100, 101, 99, None, None, 102]
+            async def get_height(self):
+                return self.heights.pop(0)
+
+        now = [0.0]
+        watcher = prizm_api.BlockWatcher(Client(), rescan_sec=60, clock=lambda: now[0])
+
+        async def run():
+            out = []
+            for t in (0, 3, 6, 9, 12, 15, 72, 75):   # опрос раз в 3 с, потом нода молчит минуту
+                now[0] = t
+                out.append(await watcher.due())
+            return out
+
+        # первый тик, новый блок 101, пересканирование после 60 с тишины, блок 102
+        self.assertEqual(asyncio.run(run()), [True, False, False, True, False, False, True, True])
+        self.assertEqual(watcher.height, 102)
+        self.assertEqual(watcher.stats, {"checks": 8, "blocks": 3, "rescans": 1})
+        self.assertEqual(prizm_api._chain_height({"numberOfBlocks": 4242, "lastBlock": "1"}), 4242)
+        self.assertIsNone(prizm_api._chain_height(None))
+
 if __name__ == "__main__":
     unittest.main()
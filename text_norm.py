@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRIZMBET — нормализация текста Marathon: названия команд, h2-лиг и дат.
+
+Все регулярки скомпилированы один раз, результаты кэшируются LRU по сырой
+строке: одни и те же команды и лиги повторяются на разных страницах и в
+соседних прогонах демона. Счётчики попаданий — cache_stats().
+"""
+
+from __future__ import annotations
+
+import datetime as _dt
+import re
+from functools import lru_cache
+from typing import Optional
+
+# Размер LRU: с запасом на все команды и лиги одного прогона (~300 матчей × 2)
+NAME_CACHE_SIZE = 4096
+LEAGUE_CACHE_SIZE = 1024
+DATE_CACHE_SIZE = 512
+
+# Marathon (/su/) показывает дату и время по Москве
+MSK = _dt.timezone(_dt.timedelta(hours=3), "MSK")
+
+_WS_PAT = re.compile(r"\s+")
+
+# clean_name: порядок замен важен — сначала "(Первый матч 1:0)", потом голый счёт
+_NAME_PATS = (
+    (re.compile(r"\(?Первый матч\s+\d+:\d+\)?", re.I), ""),
+    (re.compile(r"\(?счет\s+\d+:\d+\)?", re.I), ""),
+    (re.compile(r"\(?серия\s+\d+:\d+\)?", re.I), ""),
+    (re.compile(r"\(\d{1,2}:\d{1,2}(?:,\s*\d{1,2}:\d{1,2})*\)"), ""),
+)
+_SCORE_PAT = re.compile(r"\d+:\d+")
+_MATCH_WORD_PAT = re.compile(r"\bматч\b", re.I)
+
+# ─── Дата-хелперы ──────────────────────────────────────────────────────────────
+MONTH_RU = {
+    "янв": 1, "фев": 2, "мар": 3, "апр": 4, "май": 5, "июн": 6,
+    "июл": 7, "авг": 8, "сен": 9, "окт": 10, "ноя": 11, "дек": 12,
+}
+_RU_DATE_PAT = re.compile(r"(\d{1,2})\s+([а-яё]+)", re.I)
+
+_STAGE_PAT = re.compile(
+    r'^\d+/\d+|'                                  # "1/8", "1/4" и т.п.
+    r'\bраунд\b|\bфинал\b|\bматч(и|е|ей|ах|ам)?\b|\bтур\b|\bгруппа\b|'
+    r'лондон|мадрид|берлин|париж|монако|'         # города-площадки кубков
+    r'северо|запад\b|восток\b|юг\b|бавари|'       # региональные лиги
+    r'первые|вторые|ответн|стыков',
+    re.I
+)
+_H2_DOT_PAT = re.compile(r'\.(?=[^\s\d])')
+
+
+def norm_space(s: str) -> str:
+    return _WS_PAT.sub(" ", (s or "").strip())
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def clean_name(s: str) -> str:
+    if not s: return ""
+    for pat, repl in _NAME_PATS:
+        s = pat.sub(repl, s)
+    s = _SCORE_PAT.sub("", s).strip()
+    s = _MATCH_WORD_PAT.sub("", s).strip()
+    return _WS_PAT.sub(" ", s).strip(" -/\\")
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_ru_date(date_str: str, today: _dt.date) -> Optional[_dt.date]:
+    m = _RU_DATE_PAT.match(date_str.strip())
+    if not m:
+        return None
+    day = int(m.group(1))
+    mon = MONTH_RU.get(m.group(2)[:3].lower())
+    if not mon:
+        return None
+    d = _dt.date(today.year, mon, day)
+    # Дата ушла в прошлое более чем на полгода — значит следующий год
+    if (today - d).days > 180:
+        d = _dt.date(today.year + 1, mon, day)
+    return d
+
+
+def parse_ru_date(date_str: str, today: Optional[_dt.date] = None) -> Optional[_dt.date]:
+    """
+    Парсит '28 мар' → date(2026, 3, 28).
+    today можно передать один раз на прогон, чтобы не звать date.today() на каждый матч;
+    он же входит в ключ кэша, поэтому смена суток не отдаёт вчерашний год.
+    """
+    if not date_str:
+        return None
+    return _parse_ru_date(date_str, today or _dt.date.today())
+
+
+def msk_today(now: Optional[_dt.datetime] = None) -> _dt.date:
+    """Сегодняшняя дата по Москве — к ней относится пустая дата Marathon."""
+    return (now or _dt.datetime.now(_dt.timezone.utc)).astimezone(MSK).date()
+
+
+def day_start_ts(day: _dt.date) -> int:
+    """Полночь дня по Москве в секундах UTC."""
+    return int(_dt.datetime.combine(day, _dt.time(), MSK).timestamp())
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _kickoff_ts(date_str: str, time_str: str, today: _dt.date) -> Optional[int]:
+    try:
+        hh, mm = (int(x) for x in time_str.split(":"))
+    except ValueError:
+        return None
+    day = _parse_ru_date(date_str, today) if date_str.strip() else today
+    if day is None:
+        return None
+    return int(_dt.datetime.combine(day, _dt.time(hh % 24, mm % 60), MSK).timestamp())
+
+
+def kickoff_ts(date_str: str, time_str: str, today: Optional[_dt.date] = None) -> Optional[int]:
+    """
+    '16 мар' + '23:00' (МСК) → секунды UTC; пустая дата — сегодня по Москве.
+    None, если время или дату не разобрать. today — как в parse_ru_date, один раз на прогон.
+    """
+    if not time_str:
+        return None
+    return _kickoff_ts(date_str or "", time_str, today or msk_today())
+
+
+@lru_cache(maxsize=LEAGUE_CACHE_SIZE)
+def normalize_h2_league(text: str) -> str:
+    """
+    Нормализует Marathon h2 вида "Страна.Лига.Стадия" → "Страна. Лига".
+    Возвращает "" для секций "Итоги" (завершённые матчи).
+    """
+    if not text:
+        return ""
+    if text.lower().startswith('итоги'):
+        return ""   # Пропускаем секции результатов
+    # "Страна.Лига" → "Страна. Лига" (Marathon не ставит пробел после точки)
+    text = _H2_DOT_PAT.sub('. ', text)
+    parts = [p.strip() for p in text.split('. ') if p.strip()]
+    if not parts:
+        return ""
+    result = []
+    for part in parts:
+        if _STAGE_PAT.search(part):
+            break  # Всё после стадии — лишнее
+        result.append(part)
+        if len(result) >= 3:
+            break
+    return '. '.join(result)
+
+
+_CACHED = {
+    "clean_name": clean_name,
+    "normalize_h2_league": normalize_h2_league,
+    "parse_ru_date": _parse_ru_date,
+    "kickoff_ts": _kickoff_ts,
+}
+
+
+def cache_stats() -> dict:
+    """{имя: {"hits", "misses", "maxsize", "currsize"}} для каждой кэширующей функции."""
+    return {name: fn.cache_info()._asdict() for name, fn in _CACHED.items()}
+
+
+def cache_clear() -> None:
+    for fn in _CACHED.values():
+        fn.cache_clear()